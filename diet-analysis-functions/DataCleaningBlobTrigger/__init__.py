@@ -3,139 +3,185 @@ Data Cleaning Blob Trigger
 
 Automatically cleans and processes the All_Diets.csv file when uploaded to Azure Blob Storage.
 Phase 3 Requirement: Blob trigger for data cleaning and caching.
+
+Everything a run produces is written as a new generation and published with
+one pointer flip (utils/generations.py). A run gives up as soon as a newer
+upload of All_Diets.csv exists, since the run for that upload publishes
+instead.
 """
 
 import azure.functions as func
+from azure.core.exceptions import ResourceModifiedError
 import pandas as pd
 import logging
 import io
 import os
-from azure.storage.blob import BlobServiceClient
-
-
+import sys
+APP_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if APP_ROOT not in sys.path:
+    sys.path.append(APP_ROOT)
+from utils.cache_helper import CACHE_MANIFEST_BLOB, save_cache_results
+from utils.cleaning import STREAMING_MEMORY_TARGET_MB, clean_blob_streaming, clean_dataframe
+from utils.generations import Generation, SupersededError
+from utils.ingest import CLEANED_BLOB, INGEST_STATE_BLOB, IngestState, save_ingest_state
+from utils.search_index import SEARCH_INDEX_BLOB, build_search_index
+from utils.snapshot import SNAPSHOT_BLOB, write_snapshot
+from utils.storage import get_blob_client
+from utils.timing import record, stage, timed
+
+
+# "auto" streams uploads larger than STREAMING_THRESHOLD_MB, "streaming" always
+# streams and "memory" always loads the whole file
+CLEANING_MODE = os.environ.get("CLEANING_MODE", "auto").lower()
+STREAMING_THRESHOLD_BYTES = int(os.environ.get("STREAMING_THRESHOLD_MB", "100")) * 1024 * 1024
+
+
+@timed("DataCleaningBlobTrigger")
 def main(myblob: func.InputStream):
     """
     This function triggers when All_Diets.csv is uploaded/modified in blob storage.
-    It cleans the data and saves it as All_Diets_cleaned.csv
+    It cleans the data and publishes it as a new generation
     """
     logging.info(f"🚀 Blob trigger activated! Processing: {myblob.name}")
     logging.info(f"📊 Blob size: {myblob.length} bytes")
 
-    try:
-        # Read the uploaded CSV from blob
-        blob_data = myblob.read()
-        df = pd.read_csv(io.BytesIO(blob_data))
+    # Get connection string from environment
+    connect_str = os.environ.get("AzureStorageConnection")
+    if not connect_str:
+        raise ValueError("AzureStorageConnection environment variable not set")
 
-        logging.info(f"✅ Loaded CSV with {len(df)} rows and {len(df.columns)} columns")
+    container_name = "datasets"
+    source_container, source_blob_name = myblob.name.split("/", 1)
+    source_etag = (getattr(myblob, "blob_properties", None) or {}).get("ETag")
+    if not source_etag:
+        source_etag = get_blob_client(connect_str, source_container, source_blob_name).get_blob_properties().etag
+    generation = Generation(connect_str, container_name, source_blob_name, source_etag)
+    logging.info(f"🧬 Building generation {generation.id} from {source_blob_name} {source_etag}")
 
-        # ===== DATA CLEANING STEPS =====
-
-        # 1. Standardize Diet_type column (capitalize first letter, strip whitespace)
-        df["Diet_type"] = df["Diet_type"].astype(str).str.strip().str.title()
+    try:
+        # A burst of uploads is cleaned once, by the run for the last one
+        generation.debounce()
+
+        # Large uploads are cleaned in chunks straight from storage
+        if CLEANING_MODE == "streaming" or (
+            CLEANING_MODE == "auto" and (myblob.length or 0) > STREAMING_THRESHOLD_BYTES
+        ):
+            logging.info(f"🌊 Streaming mode (target {STREAMING_MEMORY_TARGET_MB} MB)")
+            ingest_state = IngestState()
+            cache_results, report = clean_blob_streaming(
+                connect_str, source_container, source_blob_name, generation.blob_name(CLEANED_BLOB),
+                state=ingest_state, source_etag=source_etag
+            )
+            logging.info(f"📈 Streaming report: {report}")
+            # The search index and snapshot need the whole dataset: this
+            # generation has neither and readers use the cleaned CSV
+            _publish(connect_str, container_name, generation, cache_results, ingest_state, {})
+            return
 
-        # 2. Remove duplicate rows
-        original_count = len(df)
-        df = df.drop_duplicates()
-        duplicates_removed = original_count - len(df)
-        if duplicates_removed > 0:
-            logging.info(f"🧹 Removed {duplicates_removed} duplicate rows")
+        # Read the uploaded CSV from blob
+        with stage("storage"):
+            blob_data = myblob.read()
+        record(bytes_downloaded=len(blob_data))
+        with stage("parse"):
+            df = pd.read_csv(io.BytesIO(blob_data))
+        record(rows=len(df))
 
-        # 3. Remove rows with invalid diet types
-        valid_diets = ["Paleo", "Vegan", "Keto", "Mediterranean", "Dash"]
-        df = df[df["Diet_type"].isin(valid_diets)]
+        logging.info(f"✅ Loaded CSV with {len(df)} rows and {len(df.columns)} columns")
 
-        # 4. Handle missing values in numeric columns
-        numeric_columns = ["Protein(g)", "Carbs(g)", "Fat(g)", "Calories"]
-        for col in numeric_columns:
-            if col in df.columns:
-                # Fill missing values with column mean
-                df[col] = pd.to_numeric(df[col], errors='coerce')
-                df[col].fillna(df[col].mean(), inplace=True)
+        # Row hashes and column sums that later delta batches are cleaned against
+        ingest_state = IngestState()
+        with stage("clean"):
+            ingest_state.observe(df)
 
-        # 5. Remove rows with all NaN values
-        df.dropna(how='all', inplace=True)
+            # ===== DATA CLEANING STEPS =====
+            df = clean_dataframe(df)
 
         logging.info(f"✅ Data cleaned! Final dataset has {len(df)} rows")
+        generation.check()
 
         # ===== SAVE CLEANED DATA BACK TO BLOB STORAGE =====
 
-        # Get connection string from environment
-        connect_str = os.environ.get("AzureStorageConnection")
-        if not connect_str:
-            raise ValueError("AzureStorageConnection environment variable not set")
-
-        # Save cleaned CSV to blob storage
-        container_name = "datasets"
-        cleaned_blob_name = "All_Diets_cleaned.csv"
-
         # Convert DataFrame to CSV bytes
         output_buf = io.BytesIO()
-        df.to_csv(output_buf, index=False)
+        with stage("serialize"):
+            df.to_csv(output_buf, index=False)
         output_buf.seek(0)
 
-        # Upload to blob storage
-        blob_service_client = BlobServiceClient.from_connection_string(connect_str)
-        blob_client = blob_service_client.get_blob_client(
-            container=container_name,
-            blob=cleaned_blob_name
-        )
-        blob_client.upload_blob(output_buf.getvalue(), overwrite=True)
+        cleaned_blob_name = generation.blob_name(CLEANED_BLOB)
+        blob_client = get_blob_client(connect_str, container_name, cleaned_blob_name)
+        with stage("storage"):
+            blob_client.upload_blob(output_buf.getvalue(), overwrite=True)
+        record(bytes_uploaded=len(output_buf.getvalue()))
 
         logging.info(f"✅ Successfully saved cleaned data to {cleaned_blob_name}")
         logging.info(f"✅ Cleaned dataset has {len(df)} rows and {len(df.columns)} columns")
 
+        # Keyword search index for DietSearch, tied to the cleaned CSV by the generation id
+        with stage("serialize"):
+            search_index = build_search_index(df, generation.id)
+            index_data = search_index.to_bytes()
+        index_blob_client = get_blob_client(connect_str, container_name, generation.blob_name(SEARCH_INDEX_BLOB))
+        with stage("storage"):
+            index_blob_client.upload_blob(index_data, overwrite=True)
+        record(bytes_uploaded=len(index_data))
+        logging.info(f"✅ Saved search index ({len(search_index.tokens)} tokens)")
+
+        # Columnar snapshot so read paths can skip CSV parsing
+        with stage("serialize"):
+            snapshot_data = write_snapshot(df, generation.id)
+        snapshot_blob_client = get_blob_client(connect_str, container_name, generation.blob_name(SNAPSHOT_BLOB))
+        with stage("storage"):
+            snapshot_blob_client.upload_blob(snapshot_data, overwrite=True)
+        record(bytes_uploaded=len(snapshot_data))
+        logging.info("✅ Saved columnar snapshot")
+        generation.check()
+
         # ===== PHASE 3: PRE-CALCULATE AND CACHE CHART RESULTS =====
         logging.info("Starting result calculation for caching...")
 
-        cache_results = {}
-
-        # 1. Bar Chart Data: Average Protein by Diet Type
-        avg_protein = df.groupby("Diet_type")["Protein(g)"].mean().to_dict()
-        cache_results["bar_chart"] = {
-            "data": avg_protein,
-            "title": "Average Protein by Diet Type"
-        }
-        logging.info("✅ Cached bar chart data")
-
-        # 2. Line Chart Data: Average Macronutrients by Diet Type
-        avg_macros = df.groupby("Diet_type")[["Protein(g)", "Carbs(g)", "Fat(g)"]].mean()
-        cache_results["line_chart"] = {
-            "data": avg_macros.to_dict(orient="index"),
-            "title": "Average Macronutrients by Diet Type"
-        }
-        logging.info("✅ Cached line chart data")
-
-        # 3. Pie Chart Data: Macronutrient composition for each diet
-        pie_chart_data = {}
-        for diet in valid_diets:
-            subset = df[df["Diet_type"] == diet]
-            if not subset.empty:
-                avg_macros_diet = subset[["Protein(g)", "Carbs(g)", "Fat(g)"]].mean().to_dict()
-                pie_chart_data[diet] = avg_macros_diet
-        cache_results["pie_chart"] = pie_chart_data
-        logging.info("✅ Cached pie chart data for all diets")
-
-        # 4. Insights Data: Overall statistics
-        insights = df.groupby("Diet_type")[["Protein(g)", "Carbs(g)", "Fat(g)"]].mean().to_dict(orient="records")
-        cache_results["insights"] = {
-            "diet_insights": insights
-        }
-        logging.info("✅ Cached insights data")
-
-        # Save cache to blob storage as JSON
-        import json
-        cache_blob_name = "cached_results.json"
-        cache_json = json.dumps(cache_results, indent=2)
-
-        cache_blob_client = blob_service_client.get_blob_client(
-            container=container_name,
-            blob=cache_blob_name
-        )
-        cache_blob_client.upload_blob(cache_json, overwrite=True)
+        # One grouped reduction feeds every registered cache section; the
+        # accumulator's partial results are kept for delta batches
+        ingest_state.accumulator.add(df)
+        ingest_state.columns = list(df.columns)
+        cache_results = ingest_state.accumulator.results()
+        logging.info(f"✅ Calculated cache sections: {', '.join(cache_results)}")
+
+        _publish(connect_str, container_name, generation, cache_results, ingest_state, {
+            "snapshot": generation.blob_name(SNAPSHOT_BLOB),
+            "search_index": generation.blob_name(SEARCH_INDEX_BLOB)
+        })
 
-        logging.info(f"✅ Successfully saved cached results to {cache_blob_name}")
-        logging.info("🎉 Data cleaning and caching complete!")
+    # ResourceModifiedError: the source changed under a streaming download
+    except (SupersededError, ResourceModifiedError) as e:
+        # Not an error: the run for the newer upload publishes instead
+        logging.info(f"⏭️ Generation {generation.id} dropped: {str(e)}")
+        generation.discard()
 
     except Exception as e:
         logging.error(f"❌ Error in data cleaning: {str(e)}")
+        generation.discard()
         raise
+
+
+def _publish(connect_str, container_name, generation, cache_results, ingest_state, blobs):
+    """Saves the cache sections and ingest state under the generation, then flips the pointer to it."""
+    manifest_blob_name = generation.blob_name(CACHE_MANIFEST_BLOB)
+
+    def save_cache(parent):
+        # Only sections the parent's manifest doesn't list are uploaded
+        save_cache_results(
+            connect_str, container_name, cache_results,
+            manifest_blob_name=manifest_blob_name,
+            previous_manifest_blob_name=(parent or {}).get("blobs", {}).get("manifest", CACHE_MANIFEST_BLOB)
+        )
+
+    save_cache(generation.parent)
+    save_ingest_state(connect_str, container_name, ingest_state, generation.blob_name(INGEST_STATE_BLOB))
+    # A generation published meanwhile becomes the parent: the manifest is rebuilt against its sections
+    generation.publish({
+        "cleaned": [generation.blob_name(CLEANED_BLOB)],
+        "manifest": manifest_blob_name,
+        "ingest_state": generation.blob_name(INGEST_STATE_BLOB),
+        **blobs
+    }, on_retry=save_cache)
+    logging.info("🎉 Data cleaning and caching complete!")
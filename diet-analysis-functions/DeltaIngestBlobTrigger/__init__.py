@@ -0,0 +1,37 @@
+"""
+Delta Ingest Blob Trigger
+
+Ingests a batch of new recipes dropped under datasets/incoming/ (e.g. a daily
+extraction feed) without reprocessing All_Diets.csv: the batch is cleaned on
+its own, deduplicated against every row loaded before, merged into the cache
+sections and published as a new generation whose cleaned CSV ends with the
+batch's rows. See utils/ingest.py.
+"""
+
+import azure.functions as func
+import logging
+import os
+import sys
+APP_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if APP_ROOT not in sys.path:
+    sys.path.append(APP_ROOT)
+from utils.ingest import ingest_delta
+from utils.timing import timed
+
+
+@timed("DeltaIngestBlobTrigger")
+def main(myblob: func.InputStream):
+    logging.info(f"🚀 Delta ingest triggered by {myblob.name} ({myblob.length} bytes)")
+
+    try:
+        connect_str = os.environ.get("AzureStorageConnection")
+        if not connect_str:
+            raise ValueError("AzureStorageConnection environment variable not set")
+
+        container_name, batch_name = myblob.name.split("/", 1)
+        report = ingest_delta(connect_str, container_name, batch_name, myblob.read())
+        logging.info(f"🎉 Delta ingest of {batch_name} complete: {report}")
+
+    except Exception as e:
+        logging.error(f"❌ Error in delta ingest: {str(e)}")
+        raise
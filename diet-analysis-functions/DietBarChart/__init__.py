@@ -1,57 +1,61 @@
 import os
 import time
-import io
-import pandas as pd
-import matplotlib.pyplot as plt
-from azure.storage.blob import BlobServiceClient
 import azure.functions as func
 import sys
-sys.path.append(os.path.dirname(os.path.dirname(__file__)))
-from utils.cache_helper import get_cached_results
-
-def main(req: func.HttpRequest) -> func.HttpResponse:
+APP_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if APP_ROOT not in sys.path:
+    sys.path.append(APP_ROOT)
+from utils.cache_helper import pin_generation_async
+from utils.recompute import get_or_recompute_section_with_etag_async
+from utils.chart_cache import cache_headers, chart_etag, is_not_modified, not_modified_response
+from utils.charts import bar_chart_spec, chart_body_async, chart_options, render_bar_chart
+from utils.responses import body_response, cached_response
+from utils.timing import timed
+
+@timed("DietBarChart")
+async def main(req: func.HttpRequest) -> func.HttpResponse:
     start_time = time.time()
 
+    # Output format: png (default), svg or json (chart spec, no rendering)
+    try:
+        options = chart_options(req.params, "bar")
+    except ValueError as e:
+        return func.HttpResponse(str(e), status_code=400)
+
     try:
         # Read connection info
         conn_str = os.environ["AzureStorageConnection"]
         container_name = "datasets"
+        await pin_generation_async(conn_str, container_name)
 
         # PHASE 3: Try to get data from cache first
-        cache = get_cached_results(conn_str, container_name)
-
-        if cache and "bar_chart" in cache:
-            # Use cached data (FAST!)
-            avg_protein = pd.Series(cache["bar_chart"]["data"])
-        else:
-            # Fallback: Calculate from original CSV if cache not available
-            blob_name = "All_Diets.csv"
-            blob_service = BlobServiceClient.from_connection_string(conn_str)
-            blob_client = blob_service.get_blob_client(container=container_name, blob=blob_name)
-            blob_data = blob_client.download_blob().readall()
-            df = pd.read_csv(io.BytesIO(blob_data))
-            avg_protein = df.groupby("Diet_type")["Protein(g)"].mean()
-        plt.figure(figsize=(8,5))
-        avg_protein.plot(kind="bar", color="steelblue")
-        plt.title("Average Protein by Diet Type")
-        plt.xlabel("Diet Type")
-        plt.ylabel("Protein (g)")
-        plt.tight_layout()
-
-        # Convert to bytes
-        img_bytes = io.BytesIO()
-        plt.savefig(img_bytes, format="png", dpi=150)
-        plt.close()
-        img_bytes.seek(0)
+        # Missing sections are recomputed once and written back
+        section, generation = await get_or_recompute_section_with_etag_async(conn_str, "bar_chart", container_name=container_name)
+        if section is None:
+            return func.HttpResponse("Bar chart data is not available right now, try again later.", status_code=503)
+
+        # Rendered images are keyed by the cache generation
+        etag = chart_etag("bar", generation, **options)
+        if is_not_modified(req, etag):
+            return not_modified_response(etag)
+        if options["format"] != "png":
+            # svg and json bodies are kept encoded (png doesn't compress)
+            response = cached_response(req, etag, {"X-Elapsed-Seconds": str(round(time.time() - start_time, 3)),
+                                                   **cache_headers(etag)})
+            if response is not None:
+                return response
+        body, mimetype = await chart_body_async(etag, options, bar_chart_spec, render_bar_chart, section)
 
         # Compute elapsed time
         elapsed = round(time.time() - start_time, 3)
 
         # Return with elapsed time in header
-        return func.HttpResponse(
-            img_bytes.getvalue(),
-            mimetype="image/png",
-            headers={"X-Elapsed-Seconds": str(elapsed)}
+        return body_response(
+            req,
+            body,
+            mimetype,
+            headers={"X-Elapsed-Seconds": str(elapsed), **cache_headers(etag)},
+            etag=etag
         )
 
     except Exception as e:
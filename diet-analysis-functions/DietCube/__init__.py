@@ -0,0 +1,89 @@
+"""
+Diet Cube
+
+Count, sum, mean, standard deviation, min and max of a metric grouped by any
+of diet, cuisine and day, answered from the precomputed cube cache section
+(see utils/cube.py) rather than the dataset.
+
+    /api/DietCube?dims=diet,cuisine&metric=protein
+    /api/DietCube?dims=cuisine&metric=fat&diet=Keto      # one diet's slice
+    /api/DietCube?metric=carbs                           # grand total
+"""
+
+import azure.functions as func
+import os
+import time
+import sys
+APP_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if APP_ROOT not in sys.path:
+    sys.path.append(APP_ROOT)
+from utils.cache_helper import pin_generation_async
+from utils.chart_cache import cache_headers, chart_etag, is_not_modified, not_modified_response
+from utils.cube import CUBE_DIMS, CUBE_METRICS, parse_dims, rollup
+from utils.recompute import get_or_recompute_section_with_etag_async
+from utils.responses import cached_response, json_response, wants_pretty
+from utils.timing import stage, timed
+
+
+@timed("DietCube")
+async def main(req: func.HttpRequest) -> func.HttpResponse:
+    start_time = time.time()
+
+    metric = (req.params.get("metric") or "protein").strip().lower()
+    if metric not in CUBE_METRICS:
+        return func.HttpResponse(f"Invalid metric. Must be one of: {', '.join(CUBE_METRICS)}", status_code=400)
+    try:
+        dims = parse_dims(req.params.get("dims"))
+    except ValueError as e:
+        return func.HttpResponse(str(e), status_code=400)
+
+    # Optional slice, e.g. diet=Keto (diets are title case, cuisines lower case)
+    filters = {dim: (req.params.get(dim) or "").strip() for dim in CUBE_DIMS}
+    filters["diet"] = filters["diet"].title()
+    filters["cuisine"] = filters["cuisine"].lower()
+    filters = {dim: value for dim, value in filters.items() if value}
+
+    try:
+        connect_str = os.environ.get("AzureStorageConnection")
+        if not connect_str:
+            raise ValueError("AzureStorageConnection environment variable not set")
+
+        container_name = "datasets"
+
+        await pin_generation_async(connect_str, container_name)
+
+        cube, generation = await get_or_recompute_section_with_etag_async(connect_str, "cube", container_name=container_name)
+        if cube is None:
+            return func.HttpResponse("The cube is not available right now, try again later.", status_code=503)
+
+        etag = chart_etag("cube", generation, dims=",".join(dims), metric=metric, pretty=wants_pretty(req), **filters)
+        if is_not_modified(req, etag):
+            return not_modified_response(etag)
+        # The same roll-up was already encoded for another request
+        response = cached_response(req, etag, {"X-Elapsed-Seconds": str(round(time.time() - start_time, 3)),
+                                               **cache_headers(etag)})
+        if response is not None:
+            return response
+
+        with stage("groupby"):
+            groups = rollup(cube, dims, metric, filters)
+        elapsed = round(time.time() - start_time, 3)
+
+        return json_response(
+            req,
+            {
+                "dims": dims,
+                "metric": metric,
+                "column": CUBE_METRICS[metric],
+                "filters": filters,
+                "groups": groups
+            },
+            headers={
+                "X-Elapsed-Seconds": str(elapsed),
+                **cache_headers(etag)
+            },
+            etag=etag
+        )
+
+    except Exception as e:
+        return func.HttpResponse(f"Error rolling up the cube: {str(e)}", status_code=500)
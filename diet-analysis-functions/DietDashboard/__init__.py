@@ -0,0 +1,164 @@
+"""
+Diet Dashboard
+
+Everything the dashboard shows on first load and on Refresh in one call: bar,
+line and pie chart data (or rendered images with images=true), the insights
+table and the first DietSearch page. The cache manifest is fetched once and
+shared by every section; each section is timed on its own in "timings".
+Invalid parameters get a 400 with a JSON {"error": ...} body, the same
+shape as a section that failed.
+The sections are built concurrently, so the cache section fetches and the
+dataset's ETag check overlap instead of running one after another.
+"""
+
+import asyncio
+import azure.functions as func
+import base64
+import os
+import time
+import sys
+APP_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if APP_ROOT not in sys.path:
+    sys.path.append(APP_ROOT)
+from utils.cache_helper import pin_generation_async
+from utils.chart_cache import chart_etag
+from utils.charts import chart_image_async, chart_options, render_bar_chart, render_line_chart, render_pie_chart
+from utils.dataset import LAYOUTS, get_dataset_async, range_sort_options
+from utils.recompute import get_or_recompute_section_with_etag_async
+from utils.responses import json_response
+from utils.timing import stage, timed
+
+VALID_DIETS = ["Paleo", "Vegan", "Keto", "Mediterranean", "Dash"]
+# Largest search table page the dashboard returns
+DASHBOARD_MAX_PAGE_SIZE = int(os.environ.get("DASHBOARD_MAX_PAGE_SIZE", "100"))
+
+
+def _bad_request(req, message):
+    return json_response(req, {"error": message}, status_code=400)
+
+
+def _data_uri(image):
+    return "data:image/png;base64," + base64.b64encode(image).decode("ascii")
+
+
+async def _chart(connect_str, container_name, name, images):
+    section, generation = await get_or_recompute_section_with_etag_async(connect_str, f"{name}_chart", container_name=container_name)
+    if section is None:
+        return {"error": f"The {name} chart is not available right now."}
+    result = {"title": section["title"], "data": section["data"]}
+    if images:
+        render = render_bar_chart if name == "bar" else render_line_chart
+        # Same ETag as the chart endpoint's default PNG, so the image cache is shared
+        options = chart_options({}, name)
+        image = await chart_image_async(chart_etag(name, generation, **options), render, section, options)
+        result["image"] = _data_uri(image)
+    return result
+
+
+async def _pie_chart(connect_str, container_name, diet, images):
+    macros, generation = await get_or_recompute_section_with_etag_async(connect_str, "pie_chart", diet, container_name)
+    if macros is None:
+        return {"diet": diet, "error": f"Diet '{diet}' not found in dataset."}
+    result = {"diet": diet, "data": macros}
+    if images:
+        options = chart_options({}, "pie")
+        etag = chart_etag("pie", generation, diet=diet, **options)
+        result["image"] = _data_uri(await chart_image_async(etag, render_pie_chart, macros, diet, options))
+    return result
+
+
+async def _insights(connect_str, container_name):
+    section, _ = await get_or_recompute_section_with_etag_async(connect_str, "insights", container_name=container_name)
+    if section is None:
+        return {"error": "Insights are not available right now."}
+    return section["diet_insights"]
+
+
+async def _search(connect_str, container_name, diet, keyword, match, options, page, page_size, layout):
+    dataset = await get_dataset_async(connect_str, container_name)
+    prefix = match == "prefix"
+    with stage("search"):
+        positions = dataset.filter_positions(diet, keyword, prefix=prefix, **options)
+        query = dataset.query_key(diet, keyword, prefix, **options)
+        return dataset.page(positions, page, page_size, query=query, layout=layout)
+
+
+async def _timed_section(build):
+    """Runs one section; returns (result or error dict, seconds)."""
+    section_start = time.time()
+    try:
+        result = await build
+    except Exception as e:
+        result = {"error": str(e)}
+    return result, round(time.time() - section_start, 3)
+
+
+@timed("DietDashboard")
+async def main(req: func.HttpRequest) -> func.HttpResponse:
+    start_time = time.time()
+
+    # Pie chart diet, same default as DietPieChart
+    diet = (req.params.get("diet") or "Keto").strip().title()
+    # DietSearch parameters for the first table page
+    table_diet = (req.params.get("table_diet") or "All").strip().title()
+    keyword = (req.params.get("keyword") or "").strip()
+    match = (req.params.get("match") or "substring").strip().lower()
+    layout = (req.params.get("layout") or "records").strip().lower()
+    # Base64 PNGs in the response instead of just the chart data
+    images = (req.params.get("images") or "false").strip().lower() in ("1", "true", "yes")
+
+    if table_diet != "All" and table_diet not in VALID_DIETS:
+        return _bad_request(req, f"Invalid diet. Must be one of: {', '.join(VALID_DIETS)}")
+    if match not in ("substring", "prefix"):
+        return _bad_request(req, "Invalid match. Must be one of: substring, prefix")
+    if layout not in LAYOUTS:
+        return _bad_request(req, f"Invalid layout. Must be one of: {', '.join(LAYOUTS)}")
+    try:
+        page = int(req.params.get("page") or 1)
+        page_size = int(req.params.get("page_size") or 20)
+    except ValueError:
+        return _bad_request(req, "page and page_size must be numbers")
+    if page < 1:
+        return _bad_request(req, "page must be at least 1")
+    if not 1 <= page_size <= DASHBOARD_MAX_PAGE_SIZE:
+        return _bad_request(req, f"page_size must be between 1 and {DASHBOARD_MAX_PAGE_SIZE}")
+    try:
+        search_options = range_sort_options(req.params)
+    except ValueError as e:
+        return _bad_request(req, str(e))
+
+    try:
+        connect_str = os.environ.get("AzureStorageConnection")
+        if not connect_str:
+            raise ValueError("AzureStorageConnection environment variable not set")
+
+        container_name = "datasets"
+
+        # Every read below (and every task it starts) sees the same published generation
+        await pin_generation_async(connect_str, container_name)
+
+        sections = [
+            ("bar_chart", _chart(connect_str, container_name, "bar", images)),
+            ("line_chart", _chart(connect_str, container_name, "line", images)),
+            ("pie_chart", _pie_chart(connect_str, container_name, diet, images)),
+            ("insights", _insights(connect_str, container_name)),
+            ("search", _search(connect_str, container_name, table_diet, keyword, match, search_options, page, page_size,
+                               layout)),
+        ]
+
+        # One failing section doesn't blank the whole dashboard
+        built = await asyncio.gather(*(_timed_section(build) for _, build in sections))
+        result = {}
+        timings = {}
+        for (name, _), (section_result, seconds) in zip(sections, built):
+            result[name] = section_result
+            timings[name] = seconds
+
+        elapsed = round(time.time() - start_time, 3)
+        result["timings"] = timings
+        result["elapsed_seconds"] = elapsed
+
+        return json_response(req, result, headers={"X-Elapsed-Seconds": str(elapsed)})
+
+    except Exception as e:
+        return func.HttpResponse(f"Error building dashboard: {str(e)}", status_code=500)
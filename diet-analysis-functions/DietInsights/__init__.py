@@ -1,15 +1,17 @@
 import azure.functions as func
-from azure.storage.blob import BlobServiceClient
-import pandas as pd
-import io
-import json
 import os
 import time
 import sys
-sys.path.append(os.path.dirname(os.path.dirname(__file__)))
-from utils.cache_helper import get_cached_results
+APP_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if APP_ROOT not in sys.path:
+    sys.path.append(APP_ROOT)
+from utils.cache_helper import pin_generation_async
+from utils.recompute import get_or_recompute_section_async
+from utils.responses import json_response
+from utils.timing import timed
 
-def main(req: func.HttpRequest) -> func.HttpResponse:
+@timed("DietInsights")
+async def main(req: func.HttpRequest) -> func.HttpResponse:
     start_time = time.time()
 
     try:
@@ -20,39 +22,21 @@ def main(req: func.HttpRequest) -> func.HttpResponse:
 
         container_name = "datasets"
 
-        # PHASE 3: Try to get data from cache first
-        cache = get_cached_results(connect_str, container_name)
+        await pin_generation_async(connect_str, container_name)
 
-        if cache and "insights" in cache:
-            # Use cached data (FAST!)
-            result = cache["insights"]["diet_insights"]
-        else:
-            # Fallback: Calculate from original CSV if cache not available
-            blob_name = "All_Diets.csv"
-            blob_service_client = BlobServiceClient.from_connection_string(connect_str)
-            blob_client = blob_service_client.get_container_client(container_name).get_blob_client(blob_name)
-            blob_data = blob_client.download_blob().readall()
-            usecols = ["Diet_type", "Protein(g)", "Carbs(g)", "Fat(g)"]
-            dtypes = {
-                "Diet_type": "category",
-                "Protein(g)": "float32",
-                "Carbs(g)": "float32",
-                "Fat(g)": "float32"
-            }
-            df = pd.read_csv(io.BytesIO(blob_data), usecols=usecols, dtype=dtypes)
-            avg_macros = df.groupby("Diet_type")[["Protein(g)", "Carbs(g)", "Fat(g)"]].mean().reset_index()
-            result = avg_macros.to_dict(orient="records")
+        # PHASE 3: Try to get data from cache first
+        # Missing sections are recomputed once (across workers) and written back
+        section = await get_or_recompute_section_async(connect_str, "insights", container_name=container_name)
+        if section is None:
+            return func.HttpResponse("Insights are not available right now, try again later.", status_code=503)
+        result = section["diet_insights"]
         elapsed = round(time.time() - start_time, 3)
 
         # Return JSON result
-        return func.HttpResponse(
-            json.dumps({
-                "elapsed_seconds": elapsed,
-                "diet_insights": result
-            }, indent=4),
-            mimetype="application/json",
-            status_code=200
-        )
+        return json_response(req, {
+            "elapsed_seconds": elapsed,
+            "diet_insights": result
+        })
 
     except Exception as e:
         return func.HttpResponse(f"Error: {str(e)}", status_code=500)
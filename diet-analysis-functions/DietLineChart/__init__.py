@@ -1,18 +1,27 @@
-import matplotlib
-matplotlib.use("Agg")  # <- must come before importing pyplot
-import matplotlib.pyplot as plt
 import azure.functions as func
-from azure.storage.blob import BlobServiceClient
-import pandas as pd
-import io
 import time
 import os
 import sys
-sys.path.append(os.path.dirname(os.path.dirname(__file__)))
-from utils.cache_helper import get_cached_results
+APP_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if APP_ROOT not in sys.path:
+    sys.path.append(APP_ROOT)
+from utils.cache_helper import pin_generation_async
+from utils.recompute import get_or_recompute_section_with_etag_async
+from utils.chart_cache import cache_headers, chart_etag, is_not_modified, not_modified_response
+from utils.charts import chart_body_async, chart_options, line_chart_spec, render_line_chart
+from utils.responses import body_response, cached_response
+from utils.timing import timed
 
-def main(req: func.HttpRequest) -> func.HttpResponse:
+@timed("DietLineChart")
+async def main(req: func.HttpRequest) -> func.HttpResponse:
     start_time = time.time()
+
+    # Output format: png (default), svg or json (chart spec, no rendering)
+    try:
+        options = chart_options(req.params, "line")
+    except ValueError as e:
+        return func.HttpResponse(str(e), status_code=400)
+
     try:
         # Environment variable for connection string
         connect_str = os.environ.get("AzureStorageConnection")
@@ -21,45 +30,35 @@ def main(req: func.HttpRequest) -> func.HttpResponse:
 
         container_name = "datasets"
 
-        # PHASE 3: Try to get data from cache first
-        cache = get_cached_results(connect_str, container_name)
-
-        if cache and "line_chart" in cache:
-            # Use cached data (FAST!)
-            avg_macros = pd.DataFrame.from_dict(cache["line_chart"]["data"], orient="index").reset_index()
-            avg_macros.columns = ["Diet_type", "Protein(g)", "Carbs(g)", "Fat(g)"]
-        else:
-            # Fallback: Calculate from original CSV if cache not available
-            blob_name = "All_Diets.csv"
-            blob_service_client = BlobServiceClient.from_connection_string(connect_str)
-            blob_client = blob_service_client.get_blob_client(container=container_name, blob=blob_name)
-            blob_data = blob_client.download_blob().readall()
-            df = pd.read_csv(io.BytesIO(blob_data))
-            avg_macros = df.groupby("Diet_type")[["Protein(g)", "Carbs(g)", "Fat(g)"]].mean().reset_index()
+        await pin_generation_async(connect_str, container_name)
 
-        # Plot
-        plt.figure(figsize=(10, 6))
-        for col in ["Protein(g)", "Carbs(g)", "Fat(g)"]:
-            plt.plot(avg_macros["Diet_type"], avg_macros[col], marker="o", label=col.replace("(g)", ""))
-        plt.title("Average Macronutrients by Diet Type")
-        plt.xlabel("Diet Type")
-        plt.ylabel("Grams")
-        plt.legend()
-        plt.tight_layout()
+        # PHASE 3: Try to get data from cache first
+        # Missing sections are recomputed once and written back
+        section, generation = await get_or_recompute_section_with_etag_async(connect_str, "line_chart", container_name=container_name)
+        if section is None:
+            return func.HttpResponse("Line chart data is not available right now, try again later.", status_code=503)
 
-        # Save to buffer
-        buf = io.BytesIO()
-        plt.savefig(buf, format="png", dpi=150)
-        plt.close()
-        buf.seek(0)
+        # Rendered images are keyed by the cache generation
+        etag = chart_etag("line", generation, **options)
+        if is_not_modified(req, etag):
+            return not_modified_response(etag)
+        if options["format"] != "png":
+            # svg and json bodies are kept encoded (png doesn't compress)
+            response = cached_response(req, etag, {"X-Elapsed-Seconds": str(round(time.time() - start_time, 3)),
+                                                   **cache_headers(etag)})
+            if response is not None:
+                return response
+        body, mimetype = await chart_body_async(etag, options, line_chart_spec, render_line_chart, section)
 
         elapsed = round(time.time() - start_time, 3)
 
         # Return HTTP response with image
-        return func.HttpResponse(
-            buf.getvalue(),
-            mimetype="image/png",
-            headers={"X-Elapsed-Seconds": str(elapsed)}
+        return body_response(
+            req,
+            body,
+            mimetype,
+            headers={"X-Elapsed-Seconds": str(elapsed), **cache_headers(etag)},
+            etag=etag
         )
 
     except Exception as e:
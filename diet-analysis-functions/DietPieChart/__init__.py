@@ -1,22 +1,30 @@
-import matplotlib
-matplotlib.use("Agg")  # Use non-GUI backend for serverless
-import matplotlib.pyplot as plt
 import azure.functions as func
-from azure.storage.blob import BlobServiceClient
-import pandas as pd
-import io
 import time
 import os
 import sys
-sys.path.append(os.path.dirname(os.path.dirname(__file__)))
-from utils.cache_helper import get_cached_results
+APP_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if APP_ROOT not in sys.path:
+    sys.path.append(APP_ROOT)
+from utils.cache_helper import pin_generation_async
+from utils.recompute import get_or_recompute_section_with_etag_async
+from utils.chart_cache import cache_headers, chart_etag, is_not_modified, not_modified_response
+from utils.charts import chart_body_async, chart_options, pie_chart_spec, render_pie_chart
+from utils.responses import body_response, cached_response
+from utils.timing import timed
 
-def main(req: func.HttpRequest) -> func.HttpResponse:
+@timed("DietPieChart")
+async def main(req: func.HttpRequest) -> func.HttpResponse:
     start_time = time.time()
 
     # Get diet parameter from query string; default to "Keto"
     diet = (req.params.get("diet") or "Keto").strip().title()
 
+    # Output format: png (default), svg or json (chart spec, no rendering)
+    try:
+        options = chart_options(req.params, "pie")
+    except ValueError as e:
+        return func.HttpResponse(str(e), status_code=400)
+
     try:
         # Read connection string from environment variable
         connect_str = os.environ.get("AzureStorageConnection")
@@ -25,48 +33,41 @@ def main(req: func.HttpRequest) -> func.HttpResponse:
 
         container_name = "datasets"
 
-        # PHASE 3: Try to get data from cache first
-        cache = get_cached_results(connect_str, container_name)
+        await pin_generation_async(connect_str, container_name)
 
-        if cache and "pie_chart" in cache and diet in cache["pie_chart"]:
-            # Use cached data (FAST!)
-            avg_macros = pd.Series(cache["pie_chart"][diet])
-        else:
-            # Fallback: Calculate from original CSV if cache not available
-            blob_name = "All_Diets.csv"
-            blob_service_client = BlobServiceClient.from_connection_string(connect_str)
-            blob_client = blob_service_client.get_blob_client(container=container_name, blob=blob_name)
-            blob_data = blob_client.download_blob().readall()
-            df = pd.read_csv(io.BytesIO(blob_data))
-            df["Diet_type"] = df["Diet_type"].astype(str).str.strip().str.title()
-            subset = df[df["Diet_type"] == diet]
-            if subset.empty:
-                return func.HttpResponse(f"Diet '{diet}' not found in dataset.", status_code=404)
-            avg_macros = subset[["Protein(g)", "Carbs(g)", "Fat(g)"]].mean()
-
-        # Plot pie chart
-        plt.figure(figsize=(6, 6))
-        plt.pie(avg_macros, labels=["Protein", "Carbs", "Fat"], autopct="%1.1f%%")
-        plt.title(f"Macronutrient Composition for {diet} Diet")
-        plt.tight_layout()
+        # PHASE 3: Try to get data from cache first
+        # Only this diet's three numbers are downloaded; missing sections are
+        # recomputed once and written back
+        macros, generation = await get_or_recompute_section_with_etag_async(connect_str, "pie_chart", diet, container_name)
+        if macros is None:
+            return func.HttpResponse(f"Diet '{diet}' not found in dataset.", status_code=404)
 
-        # Save plot to buffer
-        buf = io.BytesIO()
-        plt.savefig(buf, format="png", dpi=150)
-        plt.close()
-        buf.seek(0)
+        # Rendered images are keyed by the cache generation
+        etag = chart_etag("pie", generation, diet=diet, **options)
+        if is_not_modified(req, etag):
+            return not_modified_response(etag, {"X-Diet": diet})
+        if options["format"] != "png":
+            # svg and json bodies are kept encoded (png doesn't compress)
+            response = cached_response(req, etag, {"X-Elapsed-Seconds": str(round(time.time() - start_time, 3)),
+                                                   "X-Diet": diet, **cache_headers(etag)})
+            if response is not None:
+                return response
+        body, mimetype = await chart_body_async(etag, options, pie_chart_spec, render_pie_chart, macros, diet)
 
         # Measure execution time
         elapsed = round(time.time() - start_time, 3)
 
         # Return image as HTTP response with headers
-        return func.HttpResponse(
-            buf.getvalue(),
-            mimetype="image/png",
+        return body_response(
+            req,
+            body,
+            mimetype,
             headers={
                 "X-Elapsed-Seconds": str(elapsed),
-                "X-Diet": diet
-            }
+                "X-Diet": diet,
+                **cache_headers(etag)
+            },
+            etag=etag
         )
 
     except Exception as e:
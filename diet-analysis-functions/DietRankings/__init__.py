@@ -0,0 +1,89 @@
+"""
+Diet Rankings
+
+Top recipes of a diet (or of one cuisine within it) by a macro or ratio
+metric. The rankings are precomputed by DataCleaningBlobTrigger into the
+"rankings" cache section, so a request is one cached lookup and a slice.
+
+    /api/DietRankings?diet=Keto&metric=protein_to_carbs&cuisine=italian&k=5
+"""
+
+import azure.functions as func
+import os
+import time
+import sys
+APP_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if APP_ROOT not in sys.path:
+    sys.path.append(APP_ROOT)
+from utils.cache_helper import pin_generation_async
+from utils.chart_cache import cache_headers, chart_etag, is_not_modified, not_modified_response
+from utils.rankings import RANKING_METRICS, RANKINGS_TOP_K
+from utils.recompute import get_or_recompute_section_with_etag_async
+from utils.responses import cached_response, json_response, wants_pretty
+from utils.timing import timed
+
+
+@timed("DietRankings")
+async def main(req: func.HttpRequest) -> func.HttpResponse:
+    start_time = time.time()
+
+    diet = (req.params.get("diet") or "Keto").strip().title()
+    metric = (req.params.get("metric") or "protein").strip().lower()
+    # Optional cuisine within the diet, e.g. "italian"
+    cuisine = (req.params.get("cuisine") or "").strip().lower()
+
+    if metric not in RANKING_METRICS:
+        return func.HttpResponse(f"Invalid metric. Must be one of: {', '.join(RANKING_METRICS)}", status_code=400)
+    try:
+        k = int(req.params.get("k") or 5)
+    except ValueError:
+        return func.HttpResponse("k must be a number", status_code=400)
+    if not 1 <= k <= RANKINGS_TOP_K:
+        return func.HttpResponse(f"k must be between 1 and {RANKINGS_TOP_K}", status_code=400)
+
+    try:
+        connect_str = os.environ.get("AzureStorageConnection")
+        if not connect_str:
+            raise ValueError("AzureStorageConnection environment variable not set")
+
+        container_name = "datasets"
+
+        await pin_generation_async(connect_str, container_name)
+
+        # Only this diet's rankings are downloaded (and kept in memory)
+        rankings, generation = await get_or_recompute_section_with_etag_async(connect_str, "rankings", diet, container_name)
+        if rankings is None:
+            return func.HttpResponse(f"Diet '{diet}' not found in dataset.", status_code=404)
+        if cuisine:
+            if cuisine not in rankings["cuisines"]:
+                return func.HttpResponse(f"No recipes found for cuisine '{cuisine}' in the {diet} diet.", status_code=404)
+            metric_rankings = rankings["cuisines"][cuisine]
+        else:
+            metric_rankings = rankings["top"]
+
+        etag = chart_etag("rankings", generation, diet=diet, metric=metric, cuisine=cuisine, k=k,
+                          pretty=wants_pretty(req))
+        if is_not_modified(req, etag):
+            return not_modified_response(etag, {"X-Diet": diet})
+        headers = {"X-Diet": diet, **cache_headers(etag)}
+        response = cached_response(req, etag, {"X-Elapsed-Seconds": str(round(time.time() - start_time, 3)), **headers})
+        if response is not None:
+            return response
+        elapsed = round(time.time() - start_time, 3)
+
+        return json_response(
+            req,
+            {
+                "diet": diet,
+                "cuisine": cuisine or None,
+                "metric": metric,
+                "column": RANKING_METRICS[metric],
+                "k": k,
+                "rankings": metric_rankings[metric][:k]
+            },
+            headers={"X-Elapsed-Seconds": str(elapsed), **headers},
+            etag=etag
+        )
+
+    except Exception as e:
+        return func.HttpResponse(f"Error getting rankings: {str(e)}", status_code=500)
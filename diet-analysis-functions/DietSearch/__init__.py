@@ -1,21 +1,35 @@
 import azure.functions as func
-from azure.storage.blob import BlobServiceClient
-import pandas as pd
 import io
 import os
 import time
-import json
-
-def main(req: func.HttpRequest) -> func.HttpResponse:
+import sys
+APP_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if APP_ROOT not in sys.path:
+    sys.path.append(APP_ROOT)
+from utils.cache_helper import pin_generation_async
+from utils.dataset import LAYOUTS, CursorError, StaleCursorError, get_dataset_async, range_sort_options
+from utils.responses import body_response, json_response
+from utils.timing import record, stage, timed
+
+@timed("DietSearch")
+async def main(req: func.HttpRequest) -> func.HttpResponse:
     start_time = time.time()
     diet = (req.params.get("diet") or "").strip().title()  # e.g., "Keto" or "All"
 
     # PHASE 3: Keyword search parameter
     keyword = (req.params.get("keyword") or "").strip()
+    # "substring" (default) or "prefix" (words starting with the keyword)
+    match = (req.params.get("match") or "substring").strip().lower()
 
     # PHASE 3: Pagination parameters
     page = int(req.params.get("page") or 1)
     page_size = int(req.params.get("page_size") or 20)
+    # Opaque cursor from a previous page's next_cursor (takes precedence over page)
+    cursor = (req.params.get("cursor") or "").strip()
+    # "json" (default, one page) or "ndjson" (every matching row, one per line)
+    fmt = (req.params.get("format") or "json").strip().lower()
+    # "records" (default, one object per row) or "columnar" (column names once, one array per column)
+    layout = (req.params.get("layout") or "records").strip().lower()
 
     valid_diets = ["Paleo", "Vegan", "Keto", "Mediterranean", "Dash"]
 
@@ -26,15 +40,11 @@ def main(req: func.HttpRequest) -> func.HttpResponse:
             raise ValueError("AzureStorageConnection not set in local.settings.json")
 
         container_name = "datasets"
-        blob_name = "All_Diets.csv"
 
-        blob_service_client = BlobServiceClient.from_connection_string(connect_str)
-        blob_client = blob_service_client.get_blob_client(container=container_name, blob=blob_name)
-        blob_data = blob_client.download_blob().readall()
+        await pin_generation_async(connect_str, container_name)
 
-        # Load and normalize dataset
-        df = pd.read_csv(io.BytesIO(blob_data))
-        df["Diet_type"] = df["Diet_type"].astype(str).str.strip().str.title()
+        # Worker-resident dataset (reloaded only when the blob's ETag changes)
+        dataset = await get_dataset_async(connect_str, container_name)
 
         # Determine if filtering is needed
         if diet and diet != "All":
@@ -43,53 +53,70 @@ def main(req: func.HttpRequest) -> func.HttpResponse:
                     f"Invalid diet. Must be one of: {', '.join(valid_diets)}",
                     status_code=400
                 )
-            filtered_df = df[df["Diet_type"] == diet]
-            if filtered_df.empty:
+            if len(dataset.rows_for_diet(diet)) == 0:
                 return func.HttpResponse(f"No records found for diet '{diet}'.", status_code=404)
-        else:
-            # Return all diets if diet is "All" or not provided
-            filtered_df = df
-
-        # PHASE 3: Apply keyword search across all columns
-        if keyword:
-            mask = filtered_df.astype(str).apply(
-                lambda row: row.str.contains(keyword, case=False, na=False).any(),
-                axis=1
+        if keyword and match not in ("substring", "prefix"):
+            return func.HttpResponse("Invalid match. Must be one of: substring, prefix", status_code=400)
+        if fmt not in ("json", "ndjson"):
+            return func.HttpResponse("Invalid format. Must be one of: json, ndjson", status_code=400)
+        if layout not in LAYOUTS:
+            return func.HttpResponse(f"Invalid layout. Must be one of: {', '.join(LAYOUTS)}", status_code=400)
+        # min_protein/max_protein etc. and sort=protein|carbs|fat, order=asc|desc
+        try:
+            options = range_sort_options(req.params)
+        except ValueError as e:
+            return func.HttpResponse(str(e), status_code=400)
+
+        # Every diet if diet is "All" or not provided
+        # PHASE 3: Apply keyword search across all columns (inverted index lookup)
+        prefix = match == "prefix"
+        # Range filters and sorting use the dataset's sorted column indexes
+        query = dataset.query_key(diet, keyword, prefix, **options)
+        with stage("search"):
+            positions = dataset.filter_positions(diet, keyword, prefix=prefix, **options)
+        record(rows=len(positions))
+
+        if fmt == "ndjson":
+            # Bulk export, written chunk by chunk rather than as one list of records
+            body = io.BytesIO()
+            with stage("serialize"):
+                for chunk in dataset.iter_ndjson(positions):
+                    body.write(chunk)
+            return body_response(
+                req,
+                body.getvalue(),
+                "application/x-ndjson",
+                headers={
+                    "X-Elapsed-Seconds": str(round(time.time() - start_time, 3)),
+                    "X-Diet": diet if diet else "All",
+                    "X-Keyword": keyword if keyword else "",
+                    "X-Total-Records": str(len(positions))
+                }
             )
-            filtered_df = filtered_df[mask]
-
-        # PHASE 3: Apply pagination
-        total_records = len(filtered_df)
-        total_pages = (total_records + page_size - 1) // page_size  # Ceiling division
-
-        start_idx = (page - 1) * page_size
-        end_idx = start_idx + page_size
-        paginated_df = filtered_df.iloc[start_idx:end_idx]
-
-        # Convert to JSON for better frontend consumption
-        result = {
-            "data": paginated_df.to_dict(orient="records"),
-            "pagination": {
-                "current_page": page,
-                "page_size": page_size,
-                "total_records": total_records,
-                "total_pages": total_pages
-            }
-        }
 
+        # PHASE 3: Apply pagination, as JSON for better frontend consumption
+        try:
+            after = dataset.decode_cursor(query, cursor) if cursor else None
+        except StaleCursorError as e:
+            return func.HttpResponse(str(e), status_code=410)
+        except CursorError as e:
+            return func.HttpResponse(str(e), status_code=400)
+        with stage("search"):
+            result = dataset.page(positions, page, page_size, query=query, after=after, layout=layout)
+        pagination = result["pagination"]
         elapsed = round(time.time() - start_time, 3)
 
-        # Return JSON response
-        return func.HttpResponse(
-            json.dumps(result, indent=2),
-            mimetype="application/json",
+        # Return JSON response (compact unless ?pretty=true, compressed when accepted)
+        return json_response(
+            req,
+            result,
             headers={
                 "X-Elapsed-Seconds": str(elapsed),
                 "X-Diet": diet if diet else "All",
                 "X-Keyword": keyword if keyword else "",
-                "X-Total-Records": str(total_records),
-                "X-Total-Pages": str(total_pages),
-                "X-Current-Page": str(page)
+                "X-Total-Records": str(pagination["total_records"]),
+                "X-Total-Pages": str(pagination["total_pages"]),
+                "X-Current-Page": str(pagination["current_page"])
             }
         )
 
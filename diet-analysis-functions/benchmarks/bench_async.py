@@ -0,0 +1,135 @@
+"""
+Async Capacity Benchmark
+
+Requests per second one worker sustains when every request has to go to
+storage, with the sync helpers on a thread pool (how the worker runs sync
+functions) against the async helpers on one event loop (how it runs async
+ones). Storage is the in-memory fake with a simulated round trip, so the
+numbers show how much waiting each model overlaps, not Azure's latency.
+
+    python benchmarks/bench_async.py
+    python benchmarks/bench_async.py --latency 0.05 --concurrency 1 16 64 --threads 5
+
+A request is what DietDashboard fetches without images: the generation
+pointer, the bar, line and pie chart sections, the insights section, and the
+resident dataset's generation check. Every request uses its own connection
+string, so no request is answered from another one's in-memory copy of the
+pointer or the sections; the dataset itself stays loaded.
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from bench_startup import CONNECT_STR, build_fixture
+
+
+SECTIONS = [("bar_chart", None), ("line_chart", None), ("pie_chart", "Keto"), ("insights", None)]
+
+
+def sync_request(connect_str):
+    from utils.dataset import get_dataset
+    from utils.recompute import get_or_recompute_section_with_etag
+
+    start = time.perf_counter()
+    for section, key in SECTIONS:
+        if get_or_recompute_section_with_etag(connect_str, section, key)[0] is None:
+            raise RuntimeError(f"Section {section} missing")
+    get_dataset(CONNECT_STR)
+    return time.perf_counter() - start
+
+
+async def async_request(connect_str):
+    from utils.dataset import get_dataset_async
+    from utils.recompute import get_or_recompute_section_with_etag_async
+
+    start = time.perf_counter()
+    results = await asyncio.gather(
+        *(get_or_recompute_section_with_etag_async(connect_str, section, key) for section, key in SECTIONS),
+        get_dataset_async(CONNECT_STR)
+    )
+    if any(data is None for data, _ in results[:-1]):
+        raise RuntimeError("Section missing")
+    return time.perf_counter() - start
+
+
+def _forget():
+    from utils.cache_helper import clear_cache
+    from utils.recompute import clear_last_good
+    clear_cache()
+    clear_last_good()
+
+
+def run_sync(concurrency, rounds, threads):
+    latencies = []
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        for round_index in range(rounds):
+            _forget()
+            connect_strs = [f"{CONNECT_STR};Request={round_index}-{i}" for i in range(concurrency)]
+            latencies.extend(pool.map(sync_request, connect_strs))
+    return concurrency * rounds / (time.perf_counter() - start), latencies
+
+
+def run_async(concurrency, rounds):
+    async def all_rounds():
+        latencies = []
+        for round_index in range(rounds):
+            _forget()
+            latencies.extend(await asyncio.gather(
+                *(async_request(f"{CONNECT_STR};Request={round_index}-{i}") for i in range(concurrency))
+            ))
+        return latencies
+
+    start = time.perf_counter()
+    latencies = asyncio.run(all_rounds())
+    return concurrency * rounds / (time.perf_counter() - start), latencies
+
+
+def p95_ms(latencies):
+    return statistics.quantiles(latencies, n=20)[-1] * 1000 if len(latencies) > 1 else latencies[0] * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--latency", type=float, default=0.02, help="Simulated storage round trip in seconds")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16, 64])
+    # ThreadPoolExecutor's default size, which the worker uses for sync
+    # functions unless PYTHON_THREADPOOL_THREAD_COUNT is set
+    parser.add_argument("--threads", type=int, default=min(32, (os.cpu_count() or 1) + 4))
+    parser.add_argument("--requests", type=int, default=128, help="Requests per concurrency level")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        os.environ["AzureStorageConnection"] = CONNECT_STR
+        os.environ["SNAPSHOT_CACHE_DIR"] = os.path.join(workdir, "snapshots")
+        os.environ["DATASET_TTL_SECONDS"] = "0"
+        fixture_path = os.path.join(workdir, "blobs.pickle")
+        build_fixture(fixture_path)
+
+        from fake_storage import FakeBlobStore
+        store = FakeBlobStore.load(fixture_path).install()
+        # Load the resident dataset and import everything before timing
+        sync_request(CONNECT_STR)
+        asyncio.run(async_request(CONNECT_STR))
+        store.latency = args.latency
+
+        print(f"Storage round trip {args.latency * 1000:.0f} ms, sync thread pool of {args.threads}, "
+              f"{os.cpu_count()} CPUs\n")
+        print(f"{'concurrent':>10}{'sync req/s':>12}{'sync p95':>10}{'async req/s':>13}{'async p95':>11}{'gain':>7}")
+        for concurrency in args.concurrency:
+            rounds = max(args.requests // concurrency, 1)
+            sync_throughput, sync_latencies = run_sync(concurrency, rounds, args.threads)
+            async_throughput, async_latencies = run_async(concurrency, rounds)
+            print(f"{concurrency:>10}{sync_throughput:>12.1f}{p95_ms(sync_latencies):>8.0f}ms"
+                  f"{async_throughput:>13.1f}{p95_ms(async_latencies):>9.0f}ms"
+                  f"{async_throughput / sync_throughput:>6.1f}x")
+
+
+if __name__ == "__main__":
+    main()
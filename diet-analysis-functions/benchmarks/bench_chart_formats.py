@@ -0,0 +1,77 @@
+"""
+Chart Format Benchmark
+
+Server CPU time and response size of the chart endpoints' output formats:
+png at a few dpi values, svg and json. Charts are built from the cache
+sections computed for All_Diets.csv and rendered directly (no image cache),
+which is what a cache miss costs.
+
+    python benchmarks/bench_chart_formats.py --repeat 10
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import pandas as pd
+from utils.aggregation import build_cache_results
+from utils.charts import (
+    bar_chart_spec,
+    chart_body,
+    chart_options,
+    line_chart_spec,
+    pie_chart_spec,
+    render_bar_chart,
+    render_line_chart,
+    render_pie_chart
+)
+from utils.cleaning import clean_dataframe
+from synthetic import SOURCE_CSV
+
+
+VARIANTS = [
+    {"format": "png", "dpi": "72"},
+    {"format": "png"},
+    {"format": "png", "dpi": "300"},
+    {"format": "svg"},
+    {"format": "json"},
+]
+
+
+def chart_cases(cache):
+    return [
+        ("bar", bar_chart_spec, render_bar_chart, (cache["bar_chart"],)),
+        ("line", line_chart_spec, render_line_chart, (cache["line_chart"],)),
+        ("pie", pie_chart_spec, render_pie_chart, (cache["pie_chart"]["Keto"], "Keto")),
+    ]
+
+
+def cpu_time(fn, repeat):
+    """Median process CPU seconds per call (first call excluded as warm-up)."""
+    result = fn()
+    samples = []
+    for _ in range(repeat):
+        start = time.process_time()
+        fn()
+        samples.append(time.process_time() - start)
+    return statistics.median(samples), result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    cache = build_cache_results(clean_dataframe(pd.read_csv(SOURCE_CSV)))
+
+    print(f"{'chart':<7}{'format':<12}{'CPU ms':>9}{'bytes':>11}")
+    for chart_name, spec, render, render_args in chart_cases(cache):
+        for params in VARIANTS:
+            options = chart_options(params, chart_name)
+            seconds, (body, _) = cpu_time(
+                lambda: chart_body(None, options, spec, render, *render_args), args.repeat
+            )
+            label = options["format"] + (f"@{options['dpi']}" if options["format"] == "png" else "")
+            print(f"{chart_name:<7}{label:<12}{seconds * 1000:>9.2f}{len(body):>11,}")
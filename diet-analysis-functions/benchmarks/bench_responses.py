@@ -0,0 +1,128 @@
+"""
+Response Encoding Benchmark
+
+Bytes over the wire and server CPU time of the JSON endpoints' bodies, as
+they were encoded before utils/responses.py (indented, uncompressed) and as
+they are now: compact, columnar rows for search pages, gzip and brotli
+(when installed), and a hit on the encoded body cache.
+
+    python benchmarks/bench_responses.py
+    python benchmarks/bench_responses.py --repeat 50
+
+Payloads are built from the cache sections and resident dataset computed for
+All_Diets.csv (in-memory fake storage). CPU times are medians of process CPU
+time per call and include building the page rows for the search cases, since
+the columnar layout changes that too.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from bench_startup import CONNECT_STR, build_fixture
+
+
+def cpu_ms(fn, repeat):
+    """Median process CPU milliseconds per call (first call excluded as warm-up)."""
+    result = fn()
+    samples = []
+    for _ in range(repeat):
+        start = time.process_time()
+        fn()
+        samples.append(time.process_time() - start)
+    return statistics.median(samples) * 1000, result
+
+
+def cases(connect_str):
+    """(name, indent the endpoint used before, build(layout) -> payload) per case."""
+    from utils.dataset import get_dataset
+    from utils.recompute import get_or_recompute_section
+
+    dataset = get_dataset(connect_str)
+    positions = dataset.filter_positions()
+    cube = get_or_recompute_section(connect_str, "cube")
+    insights = get_or_recompute_section(connect_str, "insights")["diet_insights"]
+    rankings = get_or_recompute_section(connect_str, "rankings", "Keto")["top"]
+
+    def search(page_size):
+        return lambda layout: dataset.page(positions, 1, page_size, layout=layout)
+
+    def cube_rollup(layout):
+        from utils.cube import rollup
+        return {"dims": ["diet", "cuisine"], "metric": "protein", "groups": rollup(cube, ["diet", "cuisine"], "protein", {})}
+
+    return [
+        ("DietSearch page_size=20", 2, search(20)),
+        ("DietSearch page_size=100", 2, search(100)),
+        ("DietSearch page_size=1000", 2, search(1000)),
+        ("DietCube diet,cuisine", 2, cube_rollup),
+        ("DietRankings k=10", 2, lambda layout: {"diet": "Keto", "rankings": rankings["protein"][:10]}),
+        ("DietInsights", 4, lambda layout: {"diet_insights": insights}),
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        os.environ["AzureStorageConnection"] = CONNECT_STR
+        os.environ["SNAPSHOT_CACHE_DIR"] = os.path.join(workdir, "snapshots")
+        fixture_path = os.path.join(workdir, "blobs.pickle")
+        build_fixture(fixture_path)
+
+        from fake_storage import FakeBlobStore
+        FakeBlobStore.load(fixture_path).install()
+        import azure.functions as func
+        from utils.responses import (
+            body_response,
+            cached_response,
+            clear_response_cache,
+            compress,
+            encode_json,
+            supported_encodings
+        )
+
+        encodings = supported_encodings()
+        print(f"Encodings available: {', '.join(encodings)} (brotli needs the brotli package)\n")
+        header = f"{'case':<28}{'before':>10}{'compact':>10}{'columnar':>10}"
+        header += "".join(f"{encoding:>9}" for encoding in encodings)
+        header += f"{'before ms':>11}{'after ms':>10}{'hit ms':>8}"
+        print(header)
+
+        for name, indent, build in cases(CONNECT_STR):
+            is_search = name.startswith("DietSearch")
+            before_ms, before = cpu_ms(lambda: json.dumps(build("records"), indent=indent).encode("utf-8"), args.repeat)
+            compact = encode_json(build("records"))
+            columnar = encode_json(build("columnar")) if is_search else None
+            # What a browser gets now: the best layout, compressed with its preferred encoding
+            body = columnar or compact
+            sizes = [len(compress(body, encoding)) for encoding in encodings]
+
+            preferred = encodings[0]
+            req = func.HttpRequest("GET", "/api/bench", headers={"Accept-Encoding": "gzip, br"}, body=b"")
+            layout = "columnar" if is_search else "records"
+            after_ms, _ = cpu_ms(lambda: compress(encode_json(build(layout)), preferred), args.repeat)
+
+            clear_response_cache()
+            etag = '"bench"'
+            body_response(req, body, "application/json", etag=etag)
+            hit_ms, _ = cpu_ms(lambda: cached_response(req, etag), args.repeat)
+
+            line = f"{name:<28}{len(before):>10}{len(compact):>10}{len(columnar) if columnar else '-':>10}"
+            line += "".join(f"{size:>9}" for size in sizes)
+            line += f"{before_ms:>11.2f}{after_ms:>10.2f}{hit_ms:>8.3f}"
+            print(line)
+
+        print("\nBytes per body. before: indented JSON as sent until now. after: the best layout "
+              f"compressed with {encodings[0]}. hit: served from the encoded body cache (cacheable "
+              "responses with an ETag).")
+
+
+if __name__ == "__main__":
+    main()
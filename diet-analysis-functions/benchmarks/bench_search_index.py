@@ -0,0 +1,78 @@
+"""
+Keyword Search Benchmark
+
+Compares the old per-row apply() keyword scan in DietSearch with the inverted
+token index at several dataset sizes.
+
+    python benchmarks/bench_search_index.py --sizes 10000 1000000 10000000
+
+The apply() scan takes minutes per query on large frames, so above
+--scan-limit rows it is timed on a sample of that size and extrapolated
+linearly (marked with *).
+"""
+
+import argparse
+import os
+import sys
+import time
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import numpy as np
+from utils.dataset import DTYPES
+from utils.search_index import build_search_index, find_keyword_rows
+from synthetic import generate_dataset
+
+
+KEYWORDS = ["chicken", "Pot Pie", "italian", "keto", "zzqx"]
+
+
+def apply_scan(df, keyword):
+    mask = df.astype(str).apply(
+        lambda row: row.str.contains(keyword, case=False, na=False).any(),
+        axis=1
+    )
+    return np.flatnonzero(mask.to_numpy())
+
+
+def timed(fn, *args, repeat=3):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn(*args)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def run(n_rows, scan_limit):
+    df = generate_dataset(n_rows)
+    df["Diet_type"] = df["Diet_type"].str.title()
+    df = df.astype(DTYPES)
+
+    start = time.perf_counter()
+    index = build_search_index(df)
+    build_seconds = time.perf_counter() - start
+    index_bytes = len(index.to_bytes())
+    print(f"\n{n_rows:,} rows: index built in {build_seconds:.2f}s, "
+          f"{len(index.tokens):,} tokens, {index_bytes / 1e6:.1f} MB stored")
+    print(f"{'keyword':<12}{'matches':>10}{'apply scan (s)':>18}{'index (s)':>12}{'speedup':>10}")
+
+    sample = df if n_rows <= scan_limit else df.iloc[:scan_limit]
+    scale = n_rows / len(sample)
+
+    for keyword in KEYWORDS:
+        index_seconds, rows = timed(find_keyword_rows, df, keyword, index)
+        scan_seconds, sample_rows = timed(apply_scan, sample, keyword, repeat=1)
+        if scale == 1:
+            assert np.array_equal(rows, sample_rows), f"result mismatch for {keyword!r}"
+        scan_label = f"{scan_seconds * scale:.3f}{'*' if scale > 1 else ''}"
+        print(f"{keyword:<12}{len(rows):>10,}{scan_label:>18}{index_seconds:>12.4f}"
+              f"{scan_seconds * scale / index_seconds:>9.0f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 1_000_000, 10_000_000])
+    parser.add_argument("--scan-limit", type=int, default=50_000)
+    args = parser.parse_args()
+    for size in args.sizes:
+        run(size, args.scan_limit)
@@ -0,0 +1,91 @@
+"""
+Snapshot Benchmark
+
+Parse time and resident memory of the columnar snapshot against
+pd.read_csv, on the cleaned dataset scaled to several sizes.
+
+    python benchmarks/bench_snapshot.py --sizes 10000 1000000
+
+Every measurement runs in a fresh interpreter so RSS numbers don't include
+earlier runs. "chart columns" loads only Diet_type and the three macros,
+which is what the chart and insights fallbacks read.
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+CHART_COLUMNS = ["Diet_type", "Protein(g)", "Carbs(g)", "Fat(g)"]
+
+CASES = [
+    ("read_csv, all columns", "csv", None),
+    ("read_csv, chart columns", "csv", CHART_COLUMNS),
+    ("snapshot, all columns", "snapshot", None),
+    ("snapshot, chart columns", "snapshot", CHART_COLUMNS),
+]
+
+
+def measure(kind, path, columns):
+    """Runs in the child interpreter: load once, report seconds and RSS growth."""
+    import pandas as pd
+    from utils.cleaning import current_rss_bytes
+    from utils.snapshot import Snapshot
+
+    before = current_rss_bytes()
+    start = time.perf_counter()
+    if kind == "csv":
+        df = pd.read_csv(path, usecols=columns)
+    else:
+        df = Snapshot.open(path).to_frame(columns)
+    # Touch every value so lazily mapped pages count too
+    df.groupby("Diet_type", observed=True).size()
+    for col in df.select_dtypes("number").columns:
+        df[col].sum()
+    elapsed = time.perf_counter() - start
+    return {"seconds": elapsed, "rss_bytes": current_rss_bytes() - before}
+
+
+def run(n_rows, workdir):
+    import pandas as pd
+    from utils.cleaning import clean_dataframe
+    from utils.snapshot import write_snapshot
+    from synthetic import generate_dataset
+
+    df = clean_dataframe(generate_dataset(n_rows))
+    csv_path = os.path.join(workdir, f"cleaned_{n_rows}.csv")
+    snapshot_path = os.path.join(workdir, f"cleaned_{n_rows}.snapshot")
+    df.to_csv(csv_path, index=False)
+    with open(snapshot_path, "wb") as f:
+        f.write(write_snapshot(df))
+    del df
+
+    print(f"\n{n_rows:,} rows: CSV {os.path.getsize(csv_path) / 1e6:.1f} MB, "
+          f"snapshot {os.path.getsize(snapshot_path) / 1e6:.1f} MB")
+    print(f"{'case':<28}{'seconds':>10}{'RSS growth (MB)':>18}")
+    for label, kind, columns in CASES:
+        path = csv_path if kind == "csv" else snapshot_path
+        output = subprocess.run(
+            [sys.executable, __file__, "--child", kind, path, json.dumps(columns)],
+            check=True, capture_output=True, text=True
+        ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        print(f"{label:<28}{result['seconds']:>10.3f}{result['rss_bytes'] / 1e6:>18.1f}")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "--child":
+        print(json.dumps(measure(sys.argv[2], sys.argv[3], json.loads(sys.argv[4]))))
+        sys.exit(0)
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 1_000_000])
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as workdir:
+        for size in args.sizes:
+            run(size, workdir)
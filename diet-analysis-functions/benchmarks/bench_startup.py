@@ -0,0 +1,171 @@
+"""
+Cold Start Benchmark
+
+Import time and first-request latency of every HTTP function, each measured
+in a fresh interpreter against an in-memory blob store that holds what
+DataCleaningBlobTrigger publishes for All_Diets.csv.
+
+    python benchmarks/bench_startup.py                  # check against BUDGETS
+    python benchmarks/bench_startup.py --budget-scale 2 # slower machine
+    python benchmarks/bench_startup.py --no-budget      # report only
+
+Every function is run --repeat times and the median is reported. The exit
+status is 1 when an import or cold (import + first request) time is over
+its budget, so a regression that drags pandas or pyplot back onto a hot
+path fails the run.
+"""
+
+import argparse
+import asyncio
+import inspect
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+APP_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(APP_ROOT)
+
+
+CONNECT_STR = "UseFakeStorage=true"
+HEAVY_MODULES = ["numpy", "pandas", "matplotlib"]
+
+# function -> (query params, import budget ms, cold budget ms)
+# Cached paths shouldn't import pandas or matplotlib at all; DietSearch and
+# DietDashboard need the resident dataset, so they get pandas in their budget.
+BUDGETS = {
+    "DietBarChart": ({}, 600, 1500),
+    "DietLineChart": ({}, 600, 1500),
+    "DietPieChart": ({"diet": "Keto"}, 600, 1500),
+    "DietInsights": ({}, 600, 800),
+    "DietRankings": ({"diet": "Keto", "metric": "protein", "k": "5"}, 600, 800),
+    "DietCube": ({"dims": "diet,cuisine", "metric": "protein"}, 600, 800),
+    "DietSearch": ({"diet": "All", "page": "1", "page_size": "25"}, 1500, 2500),
+    "DietDashboard": ({"page_size": "25"}, 1500, 3000),
+}
+
+
+def measure(function_name, fixture_path, params):
+    """Runs in the child interpreter: import, then the first and a second request."""
+    start = time.perf_counter()
+    import azure.functions as func
+    import importlib
+    module = importlib.import_module(function_name)
+    import_seconds = time.perf_counter() - start
+    heavy_after_import = [name for name in HEAVY_MODULES if name in sys.modules]
+
+    from fake_storage import FakeBlobStore
+    FakeBlobStore.load(fixture_path).install()
+    # One loop for both requests, as in the worker (async clients are per loop)
+    loop = asyncio.new_event_loop()
+
+    def request():
+        req = func.HttpRequest("GET", f"/api/{function_name}", params=params, body=b"")
+        request_start = time.perf_counter()
+        response = module.main(req)
+        if inspect.isawaitable(response):
+            response = loop.run_until_complete(response)
+        return response.status_code, time.perf_counter() - request_start
+
+    status, first_seconds = request()
+    heavy_after_request = [name for name in HEAVY_MODULES if name in sys.modules]
+    _, warm_seconds = request()
+    return {
+        "status": status,
+        "import_seconds": import_seconds,
+        "first_request_seconds": first_seconds,
+        "warm_request_seconds": warm_seconds,
+        "heavy_after_import": heavy_after_import,
+        "heavy_after_request": heavy_after_request,
+    }
+
+
+def build_fixture(path):
+    """Runs DataCleaningBlobTrigger on All_Diets.csv into a fake store saved at path."""
+    from fake_storage import FakeBlobStore
+    import importlib
+    trigger = importlib.import_module("DataCleaningBlobTrigger")
+    store = FakeBlobStore().install()
+
+    with open(os.path.join(APP_ROOT, "All_Diets.csv"), "rb") as f:
+        raw = f.read()
+    store.put("datasets", "All_Diets.csv", raw)
+
+    class _Upload:
+        name = "datasets/All_Diets.csv"
+        length = len(raw)
+
+        def read(self):
+            return raw
+
+    trigger.main(_Upload())
+    store.save(path)
+
+
+def run_child(function_name, fixture_path, params, snapshot_dir):
+    env = dict(os.environ, AzureStorageConnection=CONNECT_STR, SNAPSHOT_CACHE_DIR=snapshot_dir)
+    output = subprocess.run(
+        [sys.executable, __file__, "--child", function_name, fixture_path, json.dumps(params)],
+        check=True, capture_output=True, text=True, env=env
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--functions", nargs="+", default=list(BUDGETS))
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--budget-scale", type=float, default=1.0)
+    parser.add_argument("--no-budget", action="store_true")
+    args = parser.parse_args()
+
+    failures = []
+    with tempfile.TemporaryDirectory() as workdir:
+        os.environ["AzureStorageConnection"] = CONNECT_STR
+        os.environ["SNAPSHOT_CACHE_DIR"] = os.path.join(workdir, "parent-snapshots")
+        fixture_path = os.path.join(workdir, "blobs.pickle")
+        build_fixture(fixture_path)
+
+        print(f"{'function':<16}{'status':>7}{'import ms':>11}{'first ms':>10}{'cold ms':>9}"
+              f"{'warm ms':>9}{'budget':>14}  heavy modules (import / first request)")
+        for function_name in args.functions:
+            params, import_budget, cold_budget = BUDGETS[function_name]
+            runs = [
+                run_child(function_name, fixture_path, params, os.path.join(workdir, f"snapshots-{function_name}-{i}"))
+                for i in range(args.repeat)
+            ]
+            import_ms = statistics.median(r["import_seconds"] for r in runs) * 1000
+            first_ms = statistics.median(r["first_request_seconds"] for r in runs) * 1000
+            cold_ms = statistics.median(r["import_seconds"] + r["first_request_seconds"] for r in runs) * 1000
+            warm_ms = statistics.median(r["warm_request_seconds"] for r in runs) * 1000
+            import_budget *= args.budget_scale
+            cold_budget *= args.budget_scale
+
+            over = []
+            if not args.no_budget:
+                if import_ms > import_budget:
+                    over.append(f"import {import_ms:.0f} > {import_budget:.0f} ms")
+                if cold_ms > cold_budget:
+                    over.append(f"cold {cold_ms:.0f} > {cold_budget:.0f} ms")
+            if runs[-1]["status"] >= 500:
+                over.append(f"HTTP {runs[-1]['status']}")
+            failures.extend(f"{function_name}: {reason}" for reason in over)
+
+            heavy = f"{','.join(runs[-1]['heavy_after_import']) or '-'} / {','.join(runs[-1]['heavy_after_request']) or '-'}"
+            print(f"{function_name:<16}{runs[-1]['status']:>7}{import_ms:>11.0f}{first_ms:>10.0f}{cold_ms:>9.0f}"
+                  f"{warm_ms:>9.1f}{f'{import_budget:.0f}/{cold_budget:.0f}':>14}  {heavy}"
+                  f"{'  OVER BUDGET' if over else ''}")
+
+    if failures:
+        print("\n❌ Cold start budget exceeded:\n  " + "\n  ".join(failures))
+        sys.exit(1)
+    print("\n✅ All functions within their cold start budget")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "--child":
+        print(json.dumps(measure(sys.argv[2], sys.argv[3], json.loads(sys.argv[4]))))
+        sys.exit(0)
+    main()
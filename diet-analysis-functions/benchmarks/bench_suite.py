@@ -0,0 +1,397 @@
+"""
+Benchmark Suite
+
+Latency percentiles, throughput and peak memory of the function app on
+synthetic datasets of the All_Diets.csv schema, run against the in-memory
+blob store (fake_storage.py), and compared with a stored baseline.
+
+    python benchmarks/bench_suite.py                        # 10k rows, compare with baseline.json
+    python benchmarks/bench_suite.py --sizes 10k 1m 10m     # larger datasets (minutes, GBs of RAM)
+    python benchmarks/bench_suite.py --update-baseline      # record this machine's numbers (median of 3 runs)
+    python benchmarks/bench_suite.py --runs 3               # compare the median of 3 runs
+
+For every size there are three scenarios, each in a fresh interpreter so its
+peak RSS is its own:
+
+    clean   DataCleaningBlobTrigger on the raw upload (throughput in rows/s);
+            its output is the store the other two scenarios start from
+    cached  every HTTP function with its caches warm, --concurrency requests
+            at a time, in --cached-rounds rounds (throughput in requests/s,
+            the median of the rounds)
+    miss    every HTTP function after the cache sections were deleted from
+            the store and the worker's in-memory caches were cleared, so each
+            request recomputes from the snapshot (DietSearch and DietDashboard
+            also reload the resident dataset); requests run one at a time, so
+            throughput is 1 / the median latency
+
+The exit status is 1 when a p50 latency, throughput or peak RSS is worse than
+the baseline by more than the tolerance. p95 and p99 are reported but not
+compared: with tens of samples they are the slowest one or two, which on a
+shared machine is mostly scheduling noise. Latencies also get LATENCY_SLACK_MS,
+and request throughput a per-request THROUGHPUT_SLACK_MS, so that jitter of
+a fraction of a millisecond doesn't fail functions that answer in
+microseconds. Sizes or functions the baseline has no numbers for are reported
+but never fail the run.
+
+With --runs N every scenario is run N times (each in its own interpreter)
+and every number is the median of the runs. The baseline is recorded that
+way, since from one run to the next the same p50 can move by a third.
+"""
+
+import argparse
+import asyncio
+import inspect
+import json
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+APP_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(APP_ROOT)
+from bench_startup import BUDGETS, CONNECT_STR
+
+
+SIZES = {"10k": 10_000, "100k": 100_000, "1m": 1_000_000, "10m": 10_000_000}
+SCENARIOS = ["clean", "cached", "miss"]
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+# Latencies this small are all noise, so p50 only regresses past the tolerance plus this
+LATENCY_SLACK_MS = 2.0
+# Same for request throughput: the time per request (1 / throughput) may grow by
+# the tolerance plus this before it counts (clean's rows/s gets no slack)
+THROUGHPUT_SLACK_MS = 0.1
+
+
+def percentile(values, p):
+    """Nearest-rank percentile of a non-empty list."""
+    ordered = sorted(values)
+    rank = max(int(-(-p * len(ordered) // 100)), 1)
+    return ordered[rank - 1]
+
+
+def summarize(latencies, throughput, unit):
+    return {
+        "requests": len(latencies),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+        "throughput": round(throughput, 1),
+        "unit": unit
+    }
+
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def _reset_store(store):
+    store.blobs.clear()
+    store.blocks.clear()
+    store.staged.clear()
+    store.leases.clear()
+    store.modified.clear()
+
+
+def run_clean(workdir, repeat):
+    """Cleans the raw upload repeat times; the last run's output becomes the fixture."""
+    import importlib
+    from fake_storage import FakeBlobStore
+    trigger = importlib.import_module("DataCleaningBlobTrigger")
+    store = FakeBlobStore().install()
+
+    with open(os.path.join(workdir, "raw.csv"), "rb") as f:
+        raw = f.read()
+    rows = raw.count(b"\n") - 1
+
+    class _Upload:
+        name = "datasets/All_Diets.csv"
+        length = len(raw)
+
+        def read(self):
+            return raw
+
+    latencies = []
+    for _ in range(repeat):
+        _reset_store(store)
+        store.put("datasets", "All_Diets.csv", raw)
+        start = time.perf_counter()
+        trigger.main(_Upload())
+        latencies.append(time.perf_counter() - start)
+        if ("datasets", "current.json") not in store.blobs:
+            raise RuntimeError("DataCleaningBlobTrigger did not publish a generation")
+
+    store.save(os.path.join(workdir, "blobs.pickle"))
+    mean_seconds = sum(latencies) / len(latencies)
+    return {"DataCleaningBlobTrigger": summarize(latencies, rows / mean_seconds, "rows/s")}
+
+
+def _load_functions(workdir, functions):
+    import azure.functions as func
+    import importlib
+    modules = {name: importlib.import_module(name) for name in functions}
+    from fake_storage import FakeBlobStore
+    store = FakeBlobStore.load(os.path.join(workdir, "blobs.pickle")).install()
+    # Async functions all run on this loop, from the main thread
+    loop = asyncio.new_event_loop()
+
+    def check(name, response):
+        if response.status_code != 200:
+            raise RuntimeError(f"{name} returned HTTP {response.status_code}: {response.get_body()[:200]!r}")
+
+    async def request_async(name):
+        req = func.HttpRequest("GET", f"/api/{name}", params=BUDGETS[name][0], body=b"")
+        start = time.perf_counter()
+        response = await modules[name].main(req)
+        seconds = time.perf_counter() - start
+        check(name, response)
+        return seconds
+
+    def request(name):
+        if is_async(name):
+            return loop.run_until_complete(request_async(name))
+        req = func.HttpRequest("GET", f"/api/{name}", params=BUDGETS[name][0], body=b"")
+        start = time.perf_counter()
+        response = modules[name].main(req)
+        seconds = time.perf_counter() - start
+        check(name, response)
+        return seconds
+
+    def is_async(name):
+        return inspect.iscoroutinefunction(modules[name].main)
+
+    request.run = loop.run_until_complete
+    request.run_async = request_async
+    request.is_async = is_async
+    return store, request
+
+
+def run_cached(workdir, functions, requests, concurrency, rounds):
+    """
+    Warm caches: one request per function first, then rounds of requests at
+    the given concurrency: on a thread pool for sync functions, as that many
+    coroutines on one event loop for async ones (as the Functions host runs
+    them). The throughput is the median of the rounds.
+    """
+    _, request = _load_functions(workdir, functions)
+
+    async def concurrently(name):
+        remaining = iter(range(requests))
+
+        async def worker():
+            return [await request.run_async(name) for _ in remaining]
+
+        return [seconds for latencies in await asyncio.gather(*(worker() for _ in range(concurrency)))
+                for seconds in latencies]
+
+    results = {}
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for name in functions:
+            request(name)
+            latencies = []
+            throughputs = []
+            for _ in range(rounds):
+                start = time.perf_counter()
+                if request.is_async(name):
+                    latencies += request.run(concurrently(name))
+                else:
+                    latencies += pool.map(lambda _: request(name), range(requests))
+                throughputs.append(requests / (time.perf_counter() - start))
+            results[name] = summarize(latencies, statistics.median(throughputs), "req/s")
+    return results
+
+
+def run_miss(workdir, functions, requests):
+    """Every request starts from deleted cache sections and empty worker caches."""
+    from utils.cache_helper import CACHE_MANIFEST_BLOB, CACHE_PREFIX, LEGACY_CACHE_BLOB, clear_cache
+    from utils.chart_cache import clear_chart_cache
+    from utils.dataset import clear_datasets
+    from utils.recompute import clear_last_good
+
+    store, request = _load_functions(workdir, functions)
+    results = {}
+    for name in functions:
+        latencies = []
+        for _ in range(requests):
+            for key in [key for key in store.blobs if key[1].startswith(CACHE_PREFIX) or key[1] == LEGACY_CACHE_BLOB
+                        or key[1].endswith("/" + CACHE_MANIFEST_BLOB)]:
+                del store.blobs[key]
+            clear_cache()
+            clear_chart_cache()
+            clear_datasets()
+            clear_last_good()
+            latencies.append(request(name))
+        results[name] = summarize(latencies, 1 / statistics.median(latencies), "req/s")
+    return results
+
+
+def run_scenario(scenario, workdir, args):
+    """Runs in the child interpreter."""
+    if scenario == "generate":
+        from synthetic import write_csv
+        write_csv(args["rows"], os.path.join(workdir, "raw.csv"))
+        return {}
+    if scenario == "clean":
+        results = run_clean(workdir, args["clean_repeat"])
+    elif scenario == "cached":
+        results = run_cached(workdir, args["functions"], args["requests"], args["concurrency"], args["cached_rounds"])
+    else:
+        results = run_miss(workdir, args["functions"], args["miss_requests"])
+    return {"peak_rss_mb": peak_rss_mb(), "functions": results}
+
+
+def median_result(results):
+    """Combines runs of one scenario: every number is the median across the runs."""
+    functions = {}
+    for name, stats in results[0]["functions"].items():
+        runs = [result["functions"][name] for result in results]
+        functions[name] = {
+            key: value if isinstance(value, str) or key == "requests"
+            else round(statistics.median(run[key] for run in runs), 3 if key.endswith("_ms") else 1)
+            for key, value in stats.items()
+        }
+    return {
+        "peak_rss_mb": round(statistics.median(result["peak_rss_mb"] for result in results), 1),
+        "functions": functions
+    }
+
+
+def run_child(scenario, workdir, args):
+    env = dict(os.environ, AzureStorageConnection=CONNECT_STR, SNAPSHOT_CACHE_DIR=os.path.join(workdir, "snapshots"))
+    output = subprocess.run(
+        [sys.executable, __file__, "--child", scenario, workdir, json.dumps(args)],
+        check=True, capture_output=True, text=True, env=env
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def compare(current, baseline, tolerance, rss_tolerance):
+    """
+    Returns:
+        list: Regressions as "size/scenario/function: reason" strings
+    """
+    failures = []
+    for size, scenarios in current.items():
+        for scenario, result in scenarios.items():
+            base = baseline.get(size, {}).get(scenario)
+            if base is None:
+                continue
+            label = f"{size}/{scenario}"
+            rss_limit = base["peak_rss_mb"] * (1 + rss_tolerance)
+            if result["peak_rss_mb"] > rss_limit:
+                failures.append(f"{label}: peak RSS {result['peak_rss_mb']} MB > {rss_limit:.1f} MB")
+            for name, stats in result["functions"].items():
+                base_stats = base["functions"].get(name)
+                if base_stats is None:
+                    continue
+                p50_limit = base_stats["p50_ms"] * (1 + tolerance) + LATENCY_SLACK_MS
+                if stats["p50_ms"] > p50_limit:
+                    failures.append(f"{label}/{name}: p50 {stats['p50_ms']:.1f} ms > {p50_limit:.1f} ms")
+                throughput_floor = base_stats["throughput"] / (1 + tolerance)
+                if stats["unit"] == "req/s":
+                    throughput_floor = 1000 / (1000 * (1 + tolerance) / base_stats["throughput"] + THROUGHPUT_SLACK_MS)
+                if stats["throughput"] < throughput_floor:
+                    failures.append(
+                        f"{label}/{name}: throughput {stats['throughput']} < {throughput_floor:.1f} {stats['unit']}"
+                    )
+    return failures
+
+
+def print_results(size, scenario, result, baseline):
+    base = baseline.get(size, {}).get(scenario, {})
+    base_rss = f" (baseline {base['peak_rss_mb']} MB)" if base else " (no baseline)"
+    print(f"\n{size} {scenario}: peak RSS {result['peak_rss_mb']} MB{base_rss}")
+    print(f"  {'function':<24}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'throughput':>14}{'base p50':>10}")
+    for name, stats in result["functions"].items():
+        base_stats = base.get("functions", {}).get(name)
+        base_p50 = f"{base_stats['p50_ms']:.1f}" if base_stats else "-"
+        print(f"  {name:<24}{stats['p50_ms']:>9.1f}{stats['p95_ms']:>9.1f}{stats['p99_ms']:>9.1f}"
+              f"{stats['throughput']:>10.1f} {stats['unit']:<5}{base_p50:>8}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", nargs="+", default=["10k"], choices=list(SIZES))
+    parser.add_argument("--scenarios", nargs="+", default=SCENARIOS, choices=SCENARIOS)
+    parser.add_argument("--functions", nargs="+", default=list(BUDGETS), choices=list(BUDGETS))
+    parser.add_argument("--requests", type=int, default=200, help="Requests per function and round, cached scenario")
+    parser.add_argument("--concurrency", type=int, default=4, help="Concurrent requests, cached scenario")
+    parser.add_argument("--cached-rounds", type=int, default=3, help="Rounds per function, cached scenario")
+    parser.add_argument("--miss-requests", type=int, default=30, help="Requests per function, miss scenario")
+    parser.add_argument("--clean-repeat", type=int, default=3, help="DataCleaningBlobTrigger runs per size")
+    parser.add_argument("--tolerance", type=float, default=0.5, help="Allowed p50/throughput regression (0.5 = 50%%)")
+    parser.add_argument("--rss-tolerance", type=float, default=0.25, help="Allowed peak RSS regression")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--update-baseline", action="store_true", help="Write these results into the baseline")
+    parser.add_argument("--runs", type=int, help="Runs per scenario, medians are kept (default 1, 3 with --update-baseline)")
+    parser.add_argument("--output", help="Also write the results to this JSON file")
+    args = parser.parse_args()
+    runs = args.runs or (3 if args.update_baseline else 1)
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f).get("results", {})
+    print(f"{platform.platform()}, {os.cpu_count()} CPUs, Python {platform.python_version()}")
+
+    current = {}
+    for size in args.sizes:
+        with tempfile.TemporaryDirectory() as workdir:
+            child_args = {
+                "rows": SIZES[size],
+                "functions": args.functions,
+                "requests": args.requests,
+                "concurrency": args.concurrency,
+                "cached_rounds": args.cached_rounds,
+                "miss_requests": args.miss_requests,
+                "clean_repeat": args.clean_repeat
+            }
+            start = time.perf_counter()
+            run_child("generate", workdir, child_args)
+            print(f"\nGenerated {SIZES[size]} rows in {time.perf_counter() - start:.1f}s")
+            # The other scenarios start from what the cleaning run published
+            scenarios = ["clean"] + [scenario for scenario in args.scenarios if scenario != "clean"]
+            results = {scenario: [] for scenario in scenarios}
+            for run in range(runs):
+                for scenario in scenarios:
+                    if run and scenario not in args.scenarios:
+                        continue
+                    results[scenario].append(run_child(scenario, workdir, child_args))
+            for scenario in args.scenarios:
+                result = median_result(results[scenario])
+                current.setdefault(size, {})[scenario] = result
+                print_results(size, scenario, result, baseline)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"results": current}, f, indent=2)
+
+    if args.update_baseline:
+        for size, scenarios in current.items():
+            baseline.setdefault(size, {}).update(scenarios)
+        with open(args.baseline, "w") as f:
+            json.dump({
+                "machine": {"platform": platform.platform(), "cpus": os.cpu_count(), "python": platform.python_version()},
+                "results": baseline
+            }, f, indent=2)
+            f.write("\n")
+        print(f"\n✅ Baseline written to {args.baseline}")
+        return
+
+    failures = compare(current, baseline, args.tolerance, args.rss_tolerance)
+    if failures:
+        print("\n❌ Regressions against the baseline:\n  " + "\n  ".join(failures))
+        sys.exit(1)
+    print("\n✅ No regressions against the baseline")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "--child":
+        print(json.dumps(run_scenario(sys.argv[2], sys.argv[3], json.loads(sys.argv[4]))))
+        sys.exit(0)
+    main()
@@ -0,0 +1,336 @@
+"""
+Fake Blob Storage
+
+In-memory stand-in for the parts of azure-storage-blob the function app uses,
+so benchmarks can run the real functions without Azurite or an account.
+
+    store = FakeBlobStore()
+    store.install()            # patch utils.storage and every loaded utils/function module
+    store.put("datasets", "All_Diets.csv", data)
+
+Supported: download_blob (readall/readinto/chunks, conditional ETags),
+get_blob_properties, upload_blob (conditional on an ETag), stage_block/commit_block_list/get_block_list,
+delete_blob, acquire_lease, list_blobs, and download_blob/get_blob_properties
+on the async clients. Only azure.core is imported, so installing the fake
+doesn't pull pandas or the storage SDK into a process being measured.
+
+FakeBlobStore(latency=0.02, bandwidth=50e6) makes every download, upload and
+properties call take a round trip plus size / bandwidth seconds (bandwidth is
+per connection, so a download_blob(max_concurrency=N) of several ranges moves
+up to N times faster). Sync clients sleep the thread, async clients await.
+"""
+
+import asyncio
+import hashlib
+import itertools
+import pickle
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from azure.core import MatchConditions
+from azure.core.exceptions import (
+    HttpResponseError,
+    ResourceExistsError,
+    ResourceModifiedError,
+    ResourceNotFoundError,
+    ResourceNotModifiedError
+)
+
+
+CHUNK_SIZE = 4 * 1024 * 1024
+
+
+class _Properties:
+    def __init__(self, name, etag, size, last_modified=None):
+        self.name = name
+        self.etag = etag
+        self.size = size
+        self.last_modified = last_modified
+
+
+class _Downloader:
+    def __init__(self, name, data, etag):
+        self._data = data
+        self.properties = _Properties(name, etag, len(data))
+
+    def readall(self):
+        return self._data
+
+    def readinto(self, stream):
+        stream.write(self._data)
+        return len(self._data)
+
+    def chunks(self):
+        for start in range(0, len(self._data), CHUNK_SIZE):
+            yield self._data[start:start + CHUNK_SIZE]
+
+
+class _Block:
+    def __init__(self, block_id, size):
+        self.id = block_id
+        self.size = size
+
+
+class _Lease:
+    def __init__(self, store, key):
+        self._store = store
+        self._key = key
+
+    def renew(self):
+        pass
+
+    def release(self):
+        with self._store._lock:
+            self._store.leases.discard(self._key)
+
+
+class FakeBlobClient:
+    def __init__(self, store, container_name, blob_name):
+        self._store = store
+        self._key = (container_name, blob_name)
+
+    def _get(self):
+        blob = self._store.blobs.get(self._key)
+        if blob is None:
+            raise ResourceNotFoundError(f"Blob {self._key[1]} not found")
+        return blob
+
+    def _download(self, etag=None, match_condition=None):
+        with self._store._lock:
+            # A download of a missing blob is still a storage transaction
+            self._store.stats["downloads"] += 1
+            data, current_etag = self._get()
+        if match_condition == MatchConditions.IfModified and etag == current_etag:
+            raise ResourceNotModifiedError("Not modified")
+        if match_condition == MatchConditions.IfNotModified and etag != current_etag:
+            raise ResourceModifiedError("Modified")
+        with self._store._lock:
+            self._store.stats["bytes_downloaded"] += len(data)
+        return _Downloader(self._key[1], data, current_etag)
+
+    def _properties(self):
+        with self._store._lock:
+            data, etag = self._get()
+            last_modified = self._store._last_modified(self._key)
+        return _Properties(self._key[1], etag, len(data), last_modified)
+
+    def download_blob(self, etag=None, match_condition=None, max_concurrency=1, **kwargs):
+        try:
+            downloader = self._download(etag, match_condition)
+        except (ResourceNotFoundError, ResourceNotModifiedError):
+            # Failed requests still pay the round trip
+            self._store._wait()
+            raise
+        self._store._wait(downloader.properties.size, max_concurrency)
+        return downloader
+
+    def get_blob_properties(self, **kwargs):
+        self._store._wait()
+        return self._properties()
+
+    def upload_blob(self, data, overwrite=False, etag=None, match_condition=None, **kwargs):
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        elif hasattr(data, "read"):
+            data = data.read()
+        self._store._wait(len(data))
+        with self._store._lock:
+            if not overwrite and self._key in self._store.blobs:
+                raise ResourceExistsError(f"Blob {self._key[1]} already exists")
+            if match_condition == MatchConditions.IfNotModified:
+                current = self._store.blobs.get(self._key)
+                if current is None or current[1] != etag:
+                    raise ResourceModifiedError("Condition not met")
+            etag = self._store._put(self._key, bytes(data))
+            # Put Blob leaves no committed blocks behind
+            self._store.blocks.pop(self._key, None)
+            self._store.stats["uploads"] += 1
+        return {"etag": etag}
+
+    def stage_block(self, block_id, data, **kwargs):
+        with self._store._lock:
+            self._store.staged.setdefault(self._key, {})[block_id] = bytes(data)
+
+    def commit_block_list(self, block_list, **kwargs):
+        with self._store._lock:
+            staged = self._store.staged.pop(self._key, {})
+            # Ids resolve to a staged block first, then to a committed one ("latest")
+            committed = dict(self._store.blocks.get(self._key, []))
+            blocks = [(block_id, staged[block_id] if block_id in staged else committed[block_id])
+                      for block_id in block_list]
+            etag = self._store._put(self._key, b"".join(data for _, data in blocks))
+            self._store.blocks[self._key] = blocks
+        return {"etag": etag}
+
+    def get_block_list(self, block_list_type="committed", **kwargs):
+        with self._store._lock:
+            self._get()
+            committed = [_Block(block_id, len(data)) for block_id, data in self._store.blocks.get(self._key, [])]
+            uncommitted = [_Block(block_id, len(data)) for block_id, data in self._store.staged.get(self._key, {}).items()]
+        return committed, uncommitted
+
+    def delete_blob(self, **kwargs):
+        with self._store._lock:
+            self._get()
+            del self._store.blobs[self._key]
+            self._store.blocks.pop(self._key, None)
+
+    def acquire_lease(self, lease_duration=-1, **kwargs):
+        with self._store._lock:
+            if self._key in self._store.leases:
+                error = HttpResponseError("LeaseAlreadyPresent")
+                error.status_code = 409
+                raise error
+            self._store.leases.add(self._key)
+        return _Lease(self._store, self._key)
+
+
+class _AsyncDownloader:
+    def __init__(self, downloader):
+        self._downloader = downloader
+        self.properties = downloader.properties
+
+    async def readall(self):
+        return self._downloader.readall()
+
+    async def readinto(self, stream):
+        return self._downloader.readinto(stream)
+
+
+class FakeAsyncBlobClient:
+    """The subset of azure.storage.blob.aio.BlobClient the async functions use."""
+
+    def __init__(self, store, container_name, blob_name):
+        self._store = store
+        self._client = FakeBlobClient(store, container_name, blob_name)
+
+    async def download_blob(self, etag=None, match_condition=None, max_concurrency=1, **kwargs):
+        try:
+            downloader = self._client._download(etag, match_condition)
+        except (ResourceNotFoundError, ResourceNotModifiedError):
+            await asyncio.sleep(self._store._delay())
+            raise
+        await asyncio.sleep(self._store._delay(downloader.properties.size, max_concurrency))
+        return _AsyncDownloader(downloader)
+
+    async def get_blob_properties(self, **kwargs):
+        await asyncio.sleep(self._store._delay())
+        return self._client._properties()
+
+
+class FakeContainerClient:
+    def __init__(self, store, container_name):
+        self._store = store
+        self._container_name = container_name
+
+    def get_blob_client(self, blob_name):
+        return FakeBlobClient(self._store, self._container_name, blob_name)
+
+    def list_blobs(self, name_starts_with=""):
+        with self._store._lock:
+            items = sorted(
+                (name, data, etag, self._store._last_modified((container, name)))
+                for (container, name), (data, etag) in self._store.blobs.items()
+                if container == self._container_name and name.startswith(name_starts_with)
+            )
+        return [_Properties(name, etag, len(data), last_modified) for name, data, etag, last_modified in items]
+
+    def delete_blob(self, blob_name, **kwargs):
+        self.get_blob_client(blob_name).delete_blob()
+
+
+class FakeBlobServiceClient:
+    def __init__(self, store):
+        self._store = store
+
+    def get_container_client(self, container_name):
+        return FakeContainerClient(self._store, container_name)
+
+    def get_blob_client(self, container, blob):
+        return FakeBlobClient(self._store, container, blob)
+
+
+class FakeBlobStore:
+    """Blobs keyed by (container, name), each held as (bytes, etag)."""
+
+    def __init__(self, blobs=None, blocks=None, latency=0.0, bandwidth=None):
+        self._lock = threading.Lock()
+        # Simulated round trip (seconds) and per-connection throughput (bytes/s)
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self._versions = itertools.count(1)
+        self.blobs = dict(blobs or {})
+        # Committed block lists of blobs written with commit_block_list
+        self.blocks = dict(blocks or {})
+        self.staged = {}
+        self.leases = set()
+        # Blobs without an entry (e.g. loaded from a file) date from the store's creation
+        self.modified = {}
+        self.created = datetime.now(timezone.utc)
+        self.stats = {"downloads": 0, "uploads": 0, "bytes_downloaded": 0}
+
+    def _put(self, key, data):
+        etag = '"0x%s"' % hashlib.md5(data + str(next(self._versions)).encode("ascii")).hexdigest()[:16].upper()
+        self.blobs[key] = (data, etag)
+        self.modified[key] = datetime.now(timezone.utc)
+        return etag
+
+    def _last_modified(self, key):
+        return self.modified.get(key, self.created)
+
+    def _delay(self, size=0, max_concurrency=1):
+        seconds = self.latency
+        if self.bandwidth and size:
+            ranges = max(-(-size // CHUNK_SIZE), 1)
+            seconds += size / (self.bandwidth * max(min(max_concurrency, ranges), 1))
+        return seconds
+
+    def _wait(self, size=0, max_concurrency=1):
+        seconds = self._delay(size, max_concurrency)
+        if seconds:
+            time.sleep(seconds)
+
+    def put(self, container_name, blob_name, data):
+        with self._lock:
+            return self._put((container_name, blob_name), data)
+
+    def get_blob_client(self, connect_str, container_name, blob_name):
+        return FakeBlobClient(self, container_name, blob_name)
+
+    def get_blob_service_client(self, connect_str):
+        return FakeBlobServiceClient(self)
+
+    def get_async_blob_client(self, connect_str, container_name, blob_name):
+        return FakeAsyncBlobClient(self, container_name, blob_name)
+
+    def install(self):
+        """
+        Points utils.storage, and every already-imported module that took its
+        own reference to get_blob_client / get_blob_service_client /
+        get_async_blob_client, at this store. Modules imported afterwards pick
+        up the patched utils.storage.
+        """
+        import utils.storage as storage
+        replacements = {
+            "get_blob_client": (storage.get_blob_client, self.get_blob_client),
+            "get_blob_service_client": (storage.get_blob_service_client, self.get_blob_service_client),
+            "get_async_blob_client": (storage.get_async_blob_client, self.get_async_blob_client),
+        }
+        for module in list(sys.modules.values()):
+            if module is None:
+                continue
+            for name, (original, replacement) in replacements.items():
+                if getattr(module, name, None) is original:
+                    setattr(module, name, replacement)
+        return self
+
+    def save(self, path):
+        """Writes the blobs to a file so another process can load them."""
+        with open(path, "wb") as f:
+            pickle.dump((self.blobs, self.blocks), f)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "rb") as f:
+            return cls(*pickle.load(f))
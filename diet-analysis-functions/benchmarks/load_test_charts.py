@@ -0,0 +1,82 @@
+"""
+Chart Rendering Load Test
+
+Renders a batch of distinct chart images (every chart, every diet, several
+dpi values and both image formats) through the shared render pool at
+increasing pool sizes. It reports throughput and checks that every image is
+byte-identical to the same chart rendered serially on the calling thread.
+
+    python benchmarks/load_test_charts.py --threads 1 2 4 8
+
+Images are rendered with no ETag, so the image cache never answers for them.
+Agg drawing holds the GIL for much of a render, so the speedup depends on how
+much of the work (PNG compression, text layout) runs outside it.
+"""
+
+import argparse
+import os
+import sys
+import time
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import pandas as pd
+from utils.aggregation import build_cache_results
+from utils.charts import chart_options, render_bar_chart, render_line_chart, render_pie_chart, set_render_threads, submit_chart
+from utils.cleaning import clean_dataframe
+from synthetic import SOURCE_CSV
+
+
+def render_jobs(cache, dpis, formats):
+    jobs = []
+    for fmt in formats:
+        for dpi in dpis:
+            params = {"format": fmt, "dpi": str(dpi)}
+            jobs.append((render_bar_chart, (cache["bar_chart"], chart_options(params, "bar"))))
+            jobs.append((render_line_chart, (cache["line_chart"], chart_options(params, "line"))))
+            for diet, macros in cache["pie_chart"].items():
+                jobs.append((render_pie_chart, (macros, diet, chart_options(params, "pie"))))
+    return jobs
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--dpis", type=int, nargs="+", default=[100, 150, 200])
+    parser.add_argument("--formats", nargs="+", default=["png", "svg"])
+    args = parser.parse_args()
+
+    cache = build_cache_results(clean_dataframe(pd.read_csv(SOURCE_CSV)))
+    jobs = render_jobs(cache, args.dpis, args.formats)
+
+    # Warm up font caches etc. so the serial run isn't penalized
+    for render, render_args in jobs[:len(jobs) // len(args.formats)]:
+        render(*render_args)
+
+    start = time.perf_counter()
+    serial = [render(*render_args) for render, render_args in jobs]
+    serial_seconds = time.perf_counter() - start
+    print(f"{len(jobs)} images, serial on the calling thread: {serial_seconds:.2f}s "
+          f"({len(jobs) / serial_seconds:.1f} images/s)\n")
+
+    print(f"{'threads':>8}{'seconds':>10}{'images/s':>10}{'speedup':>9}  identical")
+    all_identical = True
+    for threads in args.threads:
+        set_render_threads(threads)
+        # Warm each pool thread's figure templates like a long-running worker
+        for future in [submit_chart(None, render, *render_args) for render, render_args in jobs]:
+            future.result()
+
+        start = time.perf_counter()
+        futures = [submit_chart(None, render, *render_args) for render, render_args in jobs]
+        images = [future.result() for future in futures]
+        seconds = time.perf_counter() - start
+
+        identical = images == serial
+        all_identical &= identical
+        print(f"{threads:>8}{seconds:>10.2f}{len(jobs) / seconds:>10.1f}{serial_seconds / seconds:>9.2f}  "
+              f"{'yes' if identical else 'NO'}")
+
+    set_render_threads(1)
+    if not all_identical:
+        print("\n❌ Concurrent renders differ from serial renders")
+        sys.exit(1)
+    print("\n✅ Every concurrent render is byte-identical to the serial one")
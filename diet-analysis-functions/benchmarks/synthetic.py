@@ -0,0 +1,72 @@
+"""
+Synthetic Dataset Generator
+
+Scales the All_Diets.csv schema to any row count for benchmarks. Rows are
+sampled from the real file, recipe names get a random word from the real
+vocabulary appended so the token vocabulary keeps growing with the size, and
+the macros are jittered so aggregates aren't just copies of the original.
+
+    python benchmarks/synthetic.py 1000000 All_Diets_1M.csv
+
+Large sizes (10M rows) are written in chunks, so only one chunk is in memory.
+"""
+
+import os
+import sys
+import numpy as np
+import pandas as pd
+
+
+SOURCE_CSV = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "All_Diets.csv")
+MACRO_COLUMNS = ["Protein(g)", "Carbs(g)", "Fat(g)"]
+WRITE_CHUNK_ROWS = 500000
+
+
+def generate_dataset(n_rows, seed=42, source_csv=SOURCE_CSV, base=None):
+    """
+    Returns a DataFrame with n_rows rows in the All_Diets.csv schema.
+
+    Diet_type keeps the raw file's lower-case spelling so the cleaning step
+    has real work to do.
+    """
+    rng = np.random.default_rng(seed)
+    if base is None:
+        base = pd.read_csv(source_csv)
+
+    df = base.iloc[rng.integers(0, len(base), n_rows)].reset_index(drop=True)
+
+    words = pd.Series(base["Recipe_name"].astype(str).str.split().explode().unique())
+    suffixes = words.iloc[rng.integers(0, len(words), n_rows)].to_numpy()
+    numbers = rng.integers(0, max(n_rows // 10, 1), n_rows).astype(str)
+    df["Recipe_name"] = df["Recipe_name"].astype(str) + " " + suffixes + " " + numbers
+
+    for col in MACRO_COLUMNS:
+        noise = rng.normal(1.0, 0.05, n_rows)
+        df[col] = (df[col] * noise).round(2)
+
+    return df
+
+
+def generate_csv_bytes(n_rows, seed=42):
+    """Same as generate_dataset but already encoded as CSV bytes."""
+    return generate_dataset(n_rows, seed).to_csv(index=False).encode("utf-8")
+
+
+def write_csv(n_rows, path, seed=42, chunk_rows=WRITE_CHUNK_ROWS):
+    """
+    Writes n_rows synthetic rows to path. Up to chunk_rows this is the same as
+    generate_dataset(n_rows, seed); larger sizes are generated chunk by chunk,
+    each chunk with its own seed.
+    """
+    base = pd.read_csv(SOURCE_CSV)
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        for i, start in enumerate(range(0, n_rows, chunk_rows)):
+            chunk = generate_dataset(min(chunk_rows, n_rows - start), seed + i, base=base)
+            chunk.to_csv(f, index=False, header=(i == 0))
+
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    out = sys.argv[2] if len(sys.argv) > 2 else f"All_Diets_{n}.csv"
+    write_csv(n, out)
+    print(f"Wrote {n} rows to {out}")
@@ -0,0 +1,406 @@
+"""
+Aggregation Utility
+
+Single-pass aggregation engine for the cached dashboard results.
+
+Every cache section declares the (column, stat) pairs it needs. The engine
+collects them, adds any derived columns (e.g. Protein_to_Carbs_ratio), runs
+one grouped reduction producing count, sum, min, max and M2 (the sum of
+squared deviations from the group mean) per column, and derives mean/std
+from those. Partial results are merged with Chan's parallel formula, which
+stays accurate where sum of squares minus squared sum would cancel. Adding a
+dashboard widget means registering a section (and maybe a derived column),
+not another scan.
+
+    @cache_section("fat_range", requires=[("Fat(g)", "min"), ("Fat(g)", "max")])
+    def fat_range(agg):
+        return {"min": agg.get("Fat(g)", "min"), "max": agg.get("Fat(g)", "max")}
+
+Sections that need individual rows rather than group statistics (rankings)
+register with @frame_section instead. Their reduce function shrinks a chunk
+to the rows the builder could still use, which is what keeps them working
+in the chunked AggregateAccumulator.
+"""
+
+import numpy as np
+import pandas as pd
+from utils.cube import CELL_STATS, CUBE_DIMS, CUBE_METRICS
+from utils.rankings import RANKING_COLUMNS, build_rankings, top_k_candidates
+from utils.timing import stage
+
+
+MACRO_COLUMNS = ["Protein(g)", "Carbs(g)", "Fat(g)"]
+STATS = ["count", "sum", "min", "max", "mean", "std"]
+# Dataset columns read by the registered sections (derived columns come from these)
+SOURCE_COLUMNS = ["Diet_type", "Recipe_name", "Cuisine_type", "Extraction_day"] + MACRO_COLUMNS
+
+_derived_columns = {}
+_sections = {}
+_frame_sections = {}
+
+
+def derived_column(name):
+    """Decorator registering a column computed from the cleaned frame (vectorized)."""
+    def register(fn):
+        _derived_columns[name] = fn
+        return fn
+    return register
+
+
+def cache_section(name, requires, group_by=None):
+    """
+    Decorator registering a cache section builder.
+
+    requires is a list of (column, stat) pairs, stat being one of STATS. The
+    builder receives a GroupedAggregates and returns the JSON-ready section.
+    Sections are grouped by the build's group_by (Diet_type) unless they name
+    their own column or list of columns; one reduction runs per distinct group_by.
+    """
+    for column, stat in requires:
+        if stat not in STATS:
+            raise ValueError(f"Unknown stat '{stat}' for {column}. Must be one of: {', '.join(STATS)}")
+
+    def register(fn):
+        _sections[name] = (list(requires), fn, tuple(group_by) if isinstance(group_by, list) else group_by)
+        return fn
+    return register
+
+
+def frame_section(name, columns, reduce):
+    """
+    Decorator registering a cache section built from rows.
+
+    The builder receives a DataFrame with the given columns (derived columns
+    included). reduce(frame) returns the rows of frame the builder could use,
+    so that building from the reduced chunks gives the same section as
+    building from the whole dataset.
+    """
+    def register(fn):
+        _frame_sections[name] = (list(columns), reduce, fn)
+        return fn
+    return register
+
+
+def section_frame(df, columns):
+    """Returns the given columns of df, computing derived ones."""
+    return pd.DataFrame({
+        column: _derived_columns[column](df) if column in _derived_columns else df[column]
+        for column in columns
+    }, index=df.index)
+
+
+class GroupedAggregates:
+    """Result of the grouped reduction, indexed by group key."""
+
+    def __init__(self, table):
+        self.table = table
+
+    @property
+    def groups(self):
+        return list(self.table.index)
+
+    def get(self, column, stat):
+        """Returns {group: value} for one column and stat."""
+        return self.series(column, stat).to_dict()
+
+    def series(self, column, stat):
+        """Returns one column and stat as a Series indexed by group."""
+        count = self.table[(column, "count")]
+        if stat in ("count", "sum", "min", "max"):
+            series = self.table[(column, stat)]
+            return series.astype("int64") if stat == "count" else series
+        total = self.table[(column, "sum")]
+        if stat == "mean":
+            return total / count
+        # Sample standard deviation (ddof=1, same as pandas .std())
+        return np.sqrt(self.table[(column, "m2")] / (count - 1)).where(count > 1)
+
+    def frame(self, columns, stat):
+        """Returns a DataFrame with one stat for several columns."""
+        return pd.DataFrame({column: self.series(column, stat) for column in columns})
+
+
+def compute_aggregates(df, requirements, group_by="Diet_type"):
+    """
+    Runs the single grouped reduction for the given (column, stat) pairs.
+
+    Returns:
+        GroupedAggregates: count, sum, min, max and m2 per group and column
+    """
+    columns = sorted({column for column, _ in requirements})
+    frame = section_frame(df, columns)
+    frame[group_by] = df[group_by]
+    grouped = frame.groupby(group_by, observed=True, sort=True)
+
+    # Columns that need std also get the sample variance from the same
+    # reduction, turned into M2 = var * (count - 1)
+    deviated = {column for column, stat in requirements if stat == "std"}
+    table = grouped[columns].agg({
+        column: ["count", "sum", "min", "max"] + (["var"] if column in deviated else [])
+        for column in columns
+    })
+    for column in sorted(deviated):
+        count = table[(column, "count")]
+        table[(column, "m2")] = (table.pop((column, "var")).astype("float64") * (count - 1)).fillna(0.0)
+    return GroupedAggregates(table)
+
+
+def merge_aggregates(parts):
+    """
+    Combines GroupedAggregates computed on separate chunks of the same data.
+    count and sum add up; min and max take the extremes; m2 is merged with
+    Chan's formula: the parts' m2 plus count * (part mean - merged mean)^2.
+
+    Returns:
+        GroupedAggregates: Same result as one reduction over all the chunks
+    """
+    if len(parts) == 1:
+        return parts[0]
+    combined = pd.concat([part.table for part in parts])
+    reducers = {
+        (column, stat): stat if stat in ("min", "max") else "sum"
+        for column, stat in combined.columns
+        if stat != "m2"
+    }
+    levels = list(range(combined.index.nlevels))
+    merged = combined.groupby(level=levels, sort=True).agg(reducers)
+    for column in [column for column, stat in combined.columns if stat == "m2"]:
+        count = combined[(column, "count")]
+        mean = combined[(column, "sum")] / count
+        merged_mean = (merged[(column, "sum")] / merged[(column, "count")]).reindex(combined.index)
+        # Parts without values for the column (count 0) add nothing
+        shift = (count * (mean - merged_mean) ** 2).fillna(0.0)
+        merged[(column, "m2")] = (combined[(column, "m2")] + shift).groupby(level=levels, sort=True).sum()
+    return GroupedAggregates(merged)
+
+
+def _split_sections(sections=None):
+    """Splits section names into (aggregate sections, frame sections)."""
+    if sections is None:
+        return list(_sections), list(_frame_sections)
+    return [name for name in sections if name in _sections], [name for name in sections if name in _frame_sections]
+
+
+def section_requirements(sections=None):
+    """Returns the (column, stat) pairs needed by the named (or all) sections."""
+    names = _split_sections(sections)[0]
+    return {pair for name in names for pair in _sections[name][0]}
+
+
+def build_sections(aggregates, sections=None):
+    """Runs the builders of the named (or all) sections on computed aggregates."""
+    names = _split_sections(sections)[0]
+    return {name: _sections[name][1](aggregates) for name in names}
+
+
+def _section_groups(sections, group_by):
+    """Returns {group_by: [section names]} for the named (or all) aggregate sections."""
+    groups = {}
+    for name in _split_sections(sections)[0]:
+        groups.setdefault(_sections[name][2] or group_by, []).append(name)
+    return groups
+
+
+def _group_columns(group_by):
+    return list(group_by) if isinstance(group_by, tuple) else group_by
+
+
+def reduce_frame_section(name, df):
+    """Returns the rows of df that frame section name needs, as a section frame."""
+    columns, reduce, _ = _frame_sections[name]
+    return reduce(section_frame(df, columns))
+
+
+def build_frame_sections(df, sections=None, reduced=False):
+    """
+    Runs the builders of the named (or all) frame sections on df, or on
+    {name: frame} already passed through reduce_frame_section when reduced.
+    """
+    names = _split_sections(sections)[1]
+    results = {}
+    for name in names:
+        columns, _, fn = _frame_sections[name]
+        results[name] = fn(df[name] if reduced else section_frame(df, columns))
+    return results
+
+
+def build_cache_results(df, sections=None, group_by="Diet_type"):
+    """
+    Builds every registered cache section (or the named ones): the aggregate
+    sections from one grouped pass per group_by, then the frame sections.
+
+    Returns:
+        dict: section name -> section payload
+    """
+    results = {}
+    with stage("groupby"):
+        for key, names in _section_groups(sections, group_by).items():
+            aggregates = compute_aggregates(df, section_requirements(names), _group_columns(key))
+            results.update(build_sections(aggregates, names))
+        results.update(build_frame_sections(df, sections))
+    return results
+
+
+class AggregateAccumulator:
+    """Builds the cache sections incrementally from chunks of a dataset."""
+
+    # Merge partial results every this many chunks to keep memory flat
+    MERGE_EVERY = 16
+
+    def __init__(self, sections=None, group_by="Diet_type"):
+        self.sections = sections
+        self.group_by = group_by
+        # group_by -> (section names, requirements, partial aggregates)
+        self.groups = {
+            key: (names, section_requirements(names), [])
+            for key, names in _section_groups(sections, group_by).items()
+        }
+        # Frame section -> reduced chunks
+        self.rows = {name: [] for name in _split_sections(sections)[1]}
+        self.chunks = 0
+
+    def add(self, df):
+        if df.empty:
+            return
+        with stage("groupby"):
+            for key, (_, requirements, parts) in self.groups.items():
+                parts.append(compute_aggregates(df, requirements, _group_columns(key)))
+                if len(parts) >= self.MERGE_EVERY:
+                    parts[:] = [merge_aggregates(parts)]
+            for name, frames in self.rows.items():
+                frames.append(reduce_frame_section(name, df))
+                if len(frames) >= self.MERGE_EVERY:
+                    frames[:] = [_frame_sections[name][1](pd.concat(frames))]
+        self.chunks += 1
+
+    def aggregates(self, group_by=None):
+        """Returns the merged aggregates for a group_by (the default one when None)."""
+        _, _, parts = self.groups[group_by or self.group_by]
+        return merge_aggregates(parts) if parts else None
+
+    def state(self):
+        """
+        Returns the merged partial results for persisting: {group_by: aggregate
+        table} and {frame section: reduced rows}. load_state() restores them.
+        """
+        tables = {}
+        for key, (_, _, parts) in self.groups.items():
+            if parts:
+                parts[:] = [merge_aggregates(parts)]
+                tables[key] = parts[0].table
+        rows = {}
+        for name, frames in self.rows.items():
+            if frames:
+                frames[:] = [pd.concat(frames)]
+                rows[name] = frames[0]
+        return tables, rows
+
+    def load_state(self, tables, rows):
+        """Continues from the partial results of state(), as if their chunks had been added."""
+        for key, table in tables.items():
+            if key in self.groups:
+                self.groups[key][2][:] = [GroupedAggregates(table)]
+        for name, frame in rows.items():
+            if name in self.rows:
+                self.rows[name][:] = [frame]
+        self.chunks = 1 if tables else 0
+
+    def results(self):
+        """Returns the cache sections for everything added so far."""
+        if not self.chunks:
+            return {}
+        results = {}
+        with stage("groupby"):
+            for key, (names, _, parts) in self.groups.items():
+                results.update(build_sections(merge_aggregates(parts), names))
+            results.update(build_frame_sections(
+                {name: pd.concat(frames) for name, frames in self.rows.items()}, self.sections, reduced=True
+            ))
+        return results
+
+
+# ===== DERIVED COLUMNS (same formulas as data_analysis.py) =====
+
+@derived_column("Protein_to_Carbs_ratio")
+def protein_to_carbs_ratio(df):
+    return df["Protein(g)"] / (df["Carbs(g)"] + 0.001)
+
+
+@derived_column("Carbs_to_Fat_ratio")
+def carbs_to_fat_ratio(df):
+    return df["Carbs(g)"] / (df["Fat(g)"] + 0.001)
+
+
+# ===== CACHE SECTIONS =====
+
+@cache_section("bar_chart", requires=[("Protein(g)", "mean")])
+def bar_chart(agg):
+    return {
+        "data": agg.get("Protein(g)", "mean"),
+        "title": "Average Protein by Diet Type"
+    }
+
+
+@cache_section("line_chart", requires=[(col, "mean") for col in MACRO_COLUMNS])
+def line_chart(agg):
+    return {
+        "data": agg.frame(MACRO_COLUMNS, "mean").to_dict(orient="index"),
+        "title": "Average Macronutrients by Diet Type"
+    }
+
+
+@cache_section("pie_chart", requires=[(col, "mean") for col in MACRO_COLUMNS])
+def pie_chart(agg):
+    return agg.frame(MACRO_COLUMNS, "mean").to_dict(orient="index")
+
+
+@cache_section("insights", requires=[(col, "mean") for col in MACRO_COLUMNS])
+def insights(agg):
+    avg_macros = agg.frame(MACRO_COLUMNS, "mean").rename_axis("Diet_type").reset_index()
+    return {
+        "diet_insights": avg_macros.to_dict(orient="records")
+    }
+
+
+@cache_section("diet_stats", requires=[
+    ("Protein(g)", "count"),
+    *[(col, stat) for col in MACRO_COLUMNS for stat in ("min", "max", "std")],
+    ("Protein_to_Carbs_ratio", "mean"),
+    ("Carbs_to_Fat_ratio", "mean")
+])
+def diet_stats(agg):
+    stats = {}
+    for diet in agg.groups:
+        stats[diet] = {"recipe_count": int(agg.series("Protein(g)", "count")[diet])}
+    for col in MACRO_COLUMNS:
+        for stat in ("min", "max", "std"):
+            for diet, value in agg.get(col, stat).items():
+                stats[diet][f"{col}_{stat}"] = None if pd.isna(value) else float(value)
+    for col in ("Protein_to_Carbs_ratio", "Carbs_to_Fat_ratio"):
+        for diet, value in agg.get(col, "mean").items():
+            stats[diet][f"{col}_mean"] = float(value)
+    return stats
+
+
+@cache_section("cube", group_by=list(CUBE_DIMS.values()), requires=[
+    (col, stat) for col in CUBE_METRICS.values() for stat in ("min", "max", "std")
+])
+def cube(agg):
+    table = agg.table
+    stats = {}
+    for col in CUBE_METRICS.values():
+        stats[col] = {
+            stat: [None if pd.isna(value) else value for value in table[(col, stat)].tolist()]
+            for stat in CELL_STATS
+        }
+        stats[col]["count"] = table[(col, "count")].astype("int64").tolist()
+    return {
+        "dims": list(CUBE_DIMS.values()),
+        "cells": [list(key) for key in table.index],
+        "stats": stats
+    }
+
+
+@frame_section("rankings", columns=RANKING_COLUMNS, reduce=top_k_candidates)
+def rankings(frame):
+    return build_rankings(frame)
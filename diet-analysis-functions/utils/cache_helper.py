@@ -3,34 +3,686 @@ Cache Helper Utility
 
 Provides functions to read cached results from blob storage.
 Phase 3 Requirement: Use cached data instead of recalculating.
+
+The parsed cache is also kept in memory for the lifetime of the worker.
+Once CACHE_TTL_SECONDS has passed the stale copy keeps being served while a
+background thread revalidates it with a conditional GET (If-None-Match), so a
+slow storage call never blocks a request.
+
+Cache layout (written by save_cache_results):
+
+    cache/manifest.json                   section -> blob name + content hash
+    cache/<section>/<hash>.json           one compact blob per section
+    cache/<section>/<key>/<hash>.json     one blob per key for PARTITIONED_SECTIONS
+
+Section blobs are content-addressed, so they never change once written: only
+the small manifest goes through TTL revalidation, and a reader downloads just
+the section (or the single diet) it needs. When there is no manifest yet the
+legacy cached_results.json document is read; it is no longer written, so it
+only serves storage that hasn't been republished since. A document that
+doesn't exist is remembered as missing and revalidated like any other copy,
+so the legacy layout doesn't cost a 404 per lookup.
+
+Since generations (utils/generations.py) each published generation has its
+own manifest, generations/<id>/cache/manifest.json, found through the
+CURRENT_BLOB pointer. The pointer is the only document that changes, so it
+is the only one revalidated; documents under a generation prefix are kept
+until the worker recycles. A request pins the pointer once with
+pin_generation() / pin_generation_async(), so every lookup it makes (and
+every task or thread it starts) reads the same generation even if the
+pointer flips halfway through.
+
+The *_async variants serve the async functions from the same in-memory
+copies and download misses with the aio client; the parts of a partitioned
+section are fetched concurrently, and concurrent misses on the same document
+(e.g. the manifest, for every dashboard section) share one download.
 """
 
+import asyncio
+import contextvars
+import hashlib
 import json
 import logging
-from azure.storage.blob import BlobServiceClient
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from urllib.parse import quote
+from azure.core import MatchConditions
+from azure.core.exceptions import ResourceNotFoundError, ResourceNotModifiedError
+from utils.storage import get_async_blob_client, get_blob_client, get_blob_service_client
+from utils.timing import record, stage
+
+
+# Seconds a cached copy is considered fresh before it gets revalidated
+CACHE_TTL_SECONDS = float(os.environ.get("CACHE_TTL_SECONDS", "30"))
+
+LEGACY_CACHE_BLOB = "cached_results.json"
+CACHE_PREFIX = "cache/"
+CACHE_MANIFEST_BLOB = CACHE_PREFIX + "manifest.json"
+MANIFEST_VERSION = 1
+# Pointer to the published generation, and the prefix generations are written under
+CURRENT_BLOB = "current.json"
+GENERATIONS_PREFIX = "generations/"
+# Sections stored as one blob per top-level key (per diet)
+PARTITIONED_SECTIONS = ("pie_chart", "diet_stats", "rankings")
+# Section blobs kept in memory (they are immutable, so no revalidation)
+SECTION_CACHE_SIZE = int(os.environ.get("SECTION_CACHE_SIZE", "256"))
+# Unreferenced blobs younger than this are kept (runs in progress, pinned readers)
+GC_GRACE_SECONDS = float(os.environ.get("GC_GRACE_SECONDS", "3600"))
+
+_lock = threading.Lock()
+_entries = {}
+_section_blobs = OrderedDict()
+# (event loop, document key) -> download task shared by concurrent misses
+_async_downloads = {}
+# (connect_str, container_name) -> generation pointer pinned by the current request
+_pins = contextvars.ContextVar("generation_pins", default=None)
+_stats = {
+    "hits": 0,
+    "misses": 0,
+    "stale_hits": 0,
+    "revalidations": 0,
+    "not_modified": 0,
+    "refreshed": 0,
+    "errors": 0,
+    "section_hits": 0,
+    "section_downloads": 0,
+}
+
+
+class _CacheEntry:
+    """
+    Parsed cache document plus the ETag it was downloaded with. A document
+    that doesn't exist in storage is held as data and etag None.
+    """
+
+    def __init__(self, data, etag):
+        self.data = data
+        self.etag = etag
+        self.checked_at = time.monotonic()
+        self.revalidating = False
+
+
+def _count(name):
+    with _lock:
+        _stats[name] += 1
+
+
+def _download(connect_str, container_name, cache_blob_name):
+    """Unconditional download of the cache blob. Returns a new _CacheEntry."""
+    blob_client = get_blob_client(connect_str, container_name, cache_blob_name)
+    with stage("storage"):
+        downloader = blob_client.download_blob()
+        cache_data = downloader.readall()
+    record(bytes_downloaded=len(cache_data))
+    with stage("parse"):
+        return _CacheEntry(json.loads(cache_data), downloader.properties.etag)
+
+
+async def _download_async(connect_str, container_name, cache_blob_name):
+    """Same as _download, with the aio client."""
+    blob_client = get_async_blob_client(connect_str, container_name, cache_blob_name)
+    with stage("storage"):
+        downloader = await blob_client.download_blob()
+        cache_data = await downloader.readall()
+    record(bytes_downloaded=len(cache_data))
+    with stage("parse"):
+        return _CacheEntry(json.loads(cache_data), downloader.properties.etag)
+
 
+def _revalidate(key, entry):
+    """Conditional GET of the cache blob; swaps in the new copy when it changed."""
+    connect_str, container_name, cache_blob_name = key
+    _count("revalidations")
+    try:
+        blob_client = get_blob_client(connect_str, container_name, cache_blob_name)
+        # A missing document has no ETag to compare: any copy is new
+        conditions = {"etag": entry.etag, "match_condition": MatchConditions.IfModified} if entry.etag else {}
+        downloader = blob_client.download_blob(**conditions)
+        fresh = _CacheEntry(json.loads(downloader.readall()), downloader.properties.etag)
+        with _lock:
+            _entries[key] = fresh
+        _count("refreshed")
+        logging.info("🔄 Cached results changed in storage, refreshed local copy")
+
+    except ResourceNotModifiedError:
+        _count("not_modified")
+        entry.checked_at = time.monotonic()
+
+    except ResourceNotFoundError:
+        if entry.etag is None:
+            _count("not_modified")
+            entry.checked_at = time.monotonic()
+            return
+        # Cache blob was deleted: remember it as missing so callers fall back to the CSV
+        with _lock:
+            if _entries.get(key) is entry:
+                _entries[key] = _CacheEntry(None, None)
+        logging.warning("⚠️ Cache blob no longer exists, dropped local copy")
+
+    except Exception as e:
+        # Keep serving the stale copy and retry after another TTL
+        _count("errors")
+        entry.checked_at = time.monotonic()
+        logging.warning(f"⚠️ Cache revalidation failed: {str(e)}")
+
+    finally:
+        entry.revalidating = False
 
-def get_cached_results(connect_str, container_name="datasets", cache_blob_name="cached_results.json"):
+
+def get_cached_results(connect_str, container_name="datasets", cache_blob_name=LEGACY_CACHE_BLOB):
     """
     Retrieves cached calculation results from blob storage.
 
+    The first call in a worker downloads the blob; later calls are served from
+    memory and only revalidated in the background once the TTL expires.
+
     Returns:
         dict: Cached results or None if cache doesn't exist
     """
+    return get_cached_results_with_etag(connect_str, container_name, cache_blob_name)[0]
+
+
+def get_cached_results_with_etag(connect_str, container_name="datasets", cache_blob_name=LEGACY_CACHE_BLOB):
+    """
+    Same as get_cached_results, but also returns the ETag of the copy that was
+    served. The ETag identifies the cache generation, so anything derived from
+    the results (e.g. rendered charts) can be keyed on it.
+
+    Returns:
+        tuple: (dict or None, str or None)
+    """
+    key = (connect_str, container_name, cache_blob_name)
+    entry = _cached_entry(key)
+    if entry is not None:
+        return entry.data, entry.etag
+
     try:
-        blob_service_client = BlobServiceClient.from_connection_string(connect_str)
-        blob_client = blob_service_client.get_blob_client(
-            container=container_name,
-            blob=cache_blob_name
-        )
+        entry = _download(connect_str, container_name, cache_blob_name)
+        with _lock:
+            _entries[key] = entry
+
+        logging.info("✅ Successfully loaded cached results")
+        return entry.data, entry.etag
+
+    except ResourceNotFoundError:
+        _remember_missing(key)
+        return None, None
+
+    except Exception as e:
+        logging.warning(f"⚠️ Cache not found or invalid: {str(e)}")
+        return None, None
 
-        # Download cache
-        cache_data = blob_client.download_blob().readall()
-        cache_results = json.loads(cache_data)
+
+async def get_cached_results_with_etag_async(connect_str, container_name="datasets",
+                                             cache_blob_name=LEGACY_CACHE_BLOB):
+    """Same as get_cached_results_with_etag, downloading a miss with the aio client."""
+    key = (connect_str, container_name, cache_blob_name)
+    entry = _cached_entry(key)
+    if entry is not None:
+        return entry.data, entry.etag
+
+    flight_key = (asyncio.get_running_loop(), key)
+    download = _async_downloads.get(flight_key)
+    if download is None:
+        download = asyncio.ensure_future(_download_async(connect_str, container_name, cache_blob_name))
+        _async_downloads[flight_key] = download
+        download.add_done_callback(lambda _: _async_downloads.pop(flight_key, None))
+    try:
+        # Shielded, so one cancelled request doesn't cancel the others' download
+        entry = await asyncio.shield(download)
+        with _lock:
+            _entries[key] = entry
 
         logging.info("✅ Successfully loaded cached results")
-        return cache_results
+        return entry.data, entry.etag
+
+    except ResourceNotFoundError:
+        _remember_missing(key)
+        return None, None
 
     except Exception as e:
         logging.warning(f"⚠️ Cache not found or invalid: {str(e)}")
+        return None, None
+
+
+def _remember_missing(key):
+    """Serves a document that doesn't exist as None until its copy is revalidated."""
+    with _lock:
+        _entries[key] = _CacheEntry(None, None)
+    if key[2] == CURRENT_BLOB:
+        logging.info("ℹ️ No generation published yet, reading the legacy cache layout")
+    else:
+        logging.info(f"ℹ️ {key[2]} not found, rechecking in {CACHE_TTL_SECONDS:g}s")
+
+
+def _cached_entry(key):
+    """
+    Returns the in-memory copy of a cached document, starting a background
+    revalidation when it is past its TTL, or None (counted as a miss).
+    """
+    with _lock:
+        entry = _entries.get(key)
+        start_revalidation = False
+        if entry is not None:
+            _stats["hits"] += 1
+            # Documents under a generation prefix are never rewritten (but may be written late)
+            if time.monotonic() - entry.checked_at >= CACHE_TTL_SECONDS and (
+                entry.etag is None or not key[2].startswith(GENERATIONS_PREFIX)
+            ):
+                _stats["stale_hits"] += 1
+                if not entry.revalidating:
+                    entry.revalidating = True
+                    start_revalidation = True
+
+    if entry is None:
+        _count("misses")
+        record(cache_misses=1)
         return None
+
+    record(cache_hits=1)
+    if start_revalidation:
+        threading.Thread(target=_revalidate, args=(key, entry), daemon=True).start()
+    return entry
+
+
+def _content_hash(payload):
+    return hashlib.sha1(payload).hexdigest()[:16]
+
+
+def _encode(data):
+    return json.dumps(data, separators=(",", ":")).encode("utf-8")
+
+
+def _cached_section_blob(key):
+    """Returns the in-memory copy of a section blob, or None."""
+    with _lock:
+        if key in _section_blobs:
+            _section_blobs.move_to_end(key)
+            _stats["section_hits"] += 1
+            record(cache_hits=1)
+            return _section_blobs[key]
+    record(cache_misses=1)
+    return None
+
+
+def _store_section_blob(key, payload):
+    record(bytes_downloaded=len(payload))
+    with stage("parse"):
+        data = json.loads(payload)
+    with _lock:
+        _stats["section_downloads"] += 1
+        _section_blobs[key] = data
+        while len(_section_blobs) > SECTION_CACHE_SIZE:
+            _section_blobs.popitem(last=False)
+    return data
+
+
+def _fetch_section_blob(connect_str, container_name, blob_name):
+    """Downloads a section blob once per worker (they never change)."""
+    key = (connect_str, container_name, blob_name)
+    data = _cached_section_blob(key)
+    if data is not None:
+        return data
+    with stage("storage"):
+        payload = get_blob_client(connect_str, container_name, blob_name).download_blob().readall()
+    return _store_section_blob(key, payload)
+
+
+async def _fetch_section_blobs_async(connect_str, container_name, blob_names):
+    """
+    Same as _fetch_section_blob for several blobs, downloading the ones not
+    in memory concurrently with the aio client.
+    """
+    keys = [(connect_str, container_name, blob_name) for blob_name in blob_names]
+    blobs = [_cached_section_blob(key) for key in keys]
+    missing = [i for i, data in enumerate(blobs) if data is None]
+    if not missing:
+        # Every part in memory: no tasks to schedule
+        return blobs
+
+    async def download(blob_name):
+        downloader = await get_async_blob_client(connect_str, container_name, blob_name).download_blob()
+        return await downloader.readall()
+
+    with stage("storage"):
+        payloads = await asyncio.gather(*(download(blob_names[i]) for i in missing))
+    for i, payload in zip(missing, payloads):
+        blobs[i] = _store_section_blob(keys[i], payload)
+    return blobs
+
+
+def remember_cached_results(connect_str, container_name, cache_blob_name, data, etag):
+    """Serves a document this worker just wrote from memory right away instead of after the TTL."""
+    with _lock:
+        _entries[(connect_str, container_name, cache_blob_name)] = _CacheEntry(data, etag)
+
+
+def get_current_generation(connect_str, container_name="datasets"):
+    """
+    Returns the published generation pointer: the one pinned by the current
+    request, otherwise this worker's copy of CURRENT_BLOB.
+
+    Returns:
+        dict: The pointer, or None when nothing was published as a generation
+    """
+    pins = _pins.get()
+    if pins is not None and (connect_str, container_name) in pins:
+        return pins[(connect_str, container_name)]
+    return get_cached_results_with_etag(connect_str, container_name, CURRENT_BLOB)[0]
+
+
+async def get_current_generation_async(connect_str, container_name="datasets"):
+    """Same as get_current_generation for async functions."""
+    pins = _pins.get()
+    if pins is not None and (connect_str, container_name) in pins:
+        return pins[(connect_str, container_name)]
+    return (await get_cached_results_with_etag_async(connect_str, container_name, CURRENT_BLOB))[0]
+
+
+def _pin(connect_str, container_name, pointer):
+    # A new dict, so a context this one was copied from keeps its own pins
+    _pins.set({**(_pins.get() or {}), (connect_str, container_name): pointer})
+    if pointer is not None:
+        record(generation=pointer["generation"])
+    return pointer
+
+
+def pin_generation(connect_str, container_name="datasets"):
+    """
+    Resolves the current generation and pins it for the rest of this request.
+
+    Returns:
+        dict: The pointer, or None (also pinned) without generations
+    """
+    return _pin(connect_str, container_name, get_current_generation(connect_str, container_name))
+
+
+async def pin_generation_async(connect_str, container_name="datasets"):
+    """Same as pin_generation for async functions. Call it before starting tasks."""
+    return _pin(connect_str, container_name, await get_current_generation_async(connect_str, container_name))
+
+
+def _manifest_blob_name(pointer):
+    return pointer["blobs"]["manifest"] if pointer is not None else CACHE_MANIFEST_BLOB
+
+
+def get_cache_manifest(connect_str, container_name="datasets"):
+    """
+    Returns the cache manifest of the current generation (kept in memory; the
+    legacy cache/manifest.json is revalidated like any cached document).
+
+    Returns:
+        dict: The manifest or None if it doesn't exist
+    """
+    manifest_blob_name = _manifest_blob_name(get_current_generation(connect_str, container_name))
+    return get_cached_results_with_etag(connect_str, container_name, manifest_blob_name)[0]
+
+
+async def get_cache_manifest_async(connect_str, container_name="datasets"):
+    """Same as get_cache_manifest for async functions."""
+    manifest_blob_name = _manifest_blob_name(await get_current_generation_async(connect_str, container_name))
+    return (await get_cached_results_with_etag_async(connect_str, container_name, manifest_blob_name))[0]
+
+
+def get_cache_section(connect_str, section, key=None, container_name="datasets"):
+    """
+    Retrieves one cache section, or one key of it (e.g. a single diet).
+
+    Returns:
+        The section data, or None if it isn't cached
+    """
+    return get_cache_section_with_etag(connect_str, section, key, container_name)[0]
+
+
+def get_cache_section_with_etag(connect_str, section, key=None, container_name="datasets"):
+    """
+    Same as get_cache_section, but also returns a generation identifier that
+    only changes when this section (or key) changes.
+
+    Returns:
+        tuple: (data or None, str or None)
+    """
+    manifest = get_cache_manifest(connect_str, container_name)
+    if manifest is None:
+        # Cache written before the manifest layout existed
+        cache, etag = get_cached_results_with_etag(connect_str, container_name, LEGACY_CACHE_BLOB)
+        return _legacy_section(cache, etag, section, key)
+
+    plan = _section_plan(manifest, section, key)
+    if plan is None:
+        return None, None
+    blob_names, generation, assemble = plan
+    try:
+        data = assemble([_fetch_section_blob(connect_str, container_name, name) for name in blob_names])
+    except Exception as e:
+        logging.warning(f"⚠️ Cache section '{section}' not available: {str(e)}")
+        return None, None
+    return (data, generation) if data is not None else (None, None)
+
+
+async def get_cache_section_with_etag_async(connect_str, section, key=None, container_name="datasets"):
+    """Same as get_cache_section_with_etag, fetching the blobs concurrently with the aio client."""
+    manifest = await get_cache_manifest_async(connect_str, container_name)
+    if manifest is None:
+        cache, etag = await get_cached_results_with_etag_async(connect_str, container_name, LEGACY_CACHE_BLOB)
+        return _legacy_section(cache, etag, section, key)
+
+    plan = _section_plan(manifest, section, key)
+    if plan is None:
+        return None, None
+    blob_names, generation, assemble = plan
+    try:
+        data = assemble(await _fetch_section_blobs_async(connect_str, container_name, blob_names))
+    except Exception as e:
+        logging.warning(f"⚠️ Cache section '{section}' not available: {str(e)}")
+        return None, None
+    return (data, generation) if data is not None else (None, None)
+
+
+def _legacy_section(cache, etag, section, key):
+    data = (cache or {}).get(section)
+    if key is not None:
+        data = data.get(key) if isinstance(data, dict) else None
+    return (data, etag) if data is not None else (None, None)
+
+
+def _section_plan(manifest, section, key):
+    """
+    Works out which section blobs answer a lookup.
+
+    Returns:
+        tuple: (blob names, generation, assemble), where assemble builds the
+        result from the downloaded blobs, or None when the section or key
+        isn't in the manifest
+    """
+    entry = manifest.get("sections", {}).get(section)
+    if entry is None:
+        return None
+
+    if "parts" in entry:
+        if key is None:
+            part_keys = list(entry["parts"])
+            return ([entry["parts"][part_key]["blob"] for part_key in part_keys], entry["hash"],
+                    lambda blobs: dict(zip(part_keys, blobs)))
+        part = entry["parts"].get(key)
+        if part is None:
+            return None
+        return [part["blob"]], part["hash"], lambda blobs: blobs[0]
+
+    if key is None:
+        return [entry["blob"]], entry["hash"], lambda blobs: blobs[0]
+
+    def pick(blobs):
+        data = blobs[0]
+        return data[key] if isinstance(data, dict) and key in data else None
+    return [entry["blob"]], entry["hash"], pick
+
+
+def has_cache_section(connect_str, section, container_name="datasets", key=None):
+    """
+    True when the current cache (manifest or legacy document) lists the
+    section, or that key of it. Only the manifest is read, so a listed
+    section blob may still fail to download.
+    """
+    manifest = get_cache_manifest(connect_str, container_name)
+    if manifest is not None:
+        return _section_plan(manifest, section, key) is not None
+    cache = get_cached_results(connect_str, container_name, LEGACY_CACHE_BLOB)
+    return _legacy_section(cache, None, section, key)[0] is not None
+
+
+def _section_blob_name(section, payload, key=None):
+    name = CACHE_PREFIX + section + "/"
+    if key is not None:
+        name += quote(str(key), safe="") + "/"
+    return name + _content_hash(payload) + ".json"
+
+
+def referenced_section_blobs(manifest):
+    """Every section blob name a manifest refers to."""
+    names = set()
+    for entry in manifest.get("sections", {}).values():
+        if "parts" in entry:
+            names.update(part["blob"] for part in entry["parts"].values())
+        else:
+            names.add(entry["blob"])
+    return names
+
+
+def restore_cache_sections(connect_str, container_name, cache_results, manifest):
+    """
+    Uploads the section blobs of cache_results that the manifest already
+    lists, leaving the manifest as it is. Blobs are content-addressed, so a
+    recompute of the same data puts back the blob the manifest points at;
+    this is how a section blob of a published generation (whose manifest
+    never changes) is repaired.
+
+    Returns:
+        int: Number of section blobs uploaded
+    """
+    listed = referenced_section_blobs(manifest)
+    uploaded = 0
+    for section, data in cache_results.items():
+        partitioned = section in PARTITIONED_SECTIONS and isinstance(data, dict)
+        for key, value in data.items() if partitioned else [(None, data)]:
+            payload = _encode(value)
+            blob_name = _section_blob_name(section, payload, key)
+            if blob_name not in listed:
+                continue
+            with stage("storage"):
+                get_blob_client(connect_str, container_name, blob_name).upload_blob(payload, overwrite=True)
+            record(bytes_uploaded=len(payload))
+            uploaded += 1
+    return uploaded
+
+
+def save_cache_results(connect_str, container_name, cache_results, manifest_blob_name=CACHE_MANIFEST_BLOB,
+                       previous_manifest_blob_name=None, reupload=False):
+    """
+    Publishes cache results in the per-section layout. Only sections (or keys)
+    whose content changed since the previous manifest are uploaded; the
+    manifest is written last so it never points at a blob that doesn't exist
+    yet. Blobs referenced by neither the new nor the previous manifest are
+    deleted afterwards once they are older than GC_GRACE_SECONDS; for a
+    generation's manifest that is left to Generation.collect_garbage after
+    the pointer flip.
+
+    manifest_blob_name defaults to the legacy cache/manifest.json; a new
+    generation passes its own, and its parent's as
+    previous_manifest_blob_name. A published generation's manifest is never
+    rewritten (see restore_cache_sections). With reupload
+    every section blob is uploaded, even the ones the previous manifest
+    lists, which restores a listed blob that can't be downloaded.
+
+    Returns:
+        dict: Number of blobs uploaded, unchanged and deleted
+    """
+    try:
+        previous = json.loads(
+            get_blob_client(connect_str, container_name, previous_manifest_blob_name or manifest_blob_name)
+            .download_blob().readall()
+        )
+    except ResourceNotFoundError:
+        previous = {"sections": {}}
+
+    existing = referenced_section_blobs(previous)
+    summary = {"uploaded": 0, "unchanged": 0, "deleted": 0}
+
+    def publish(section, data, key=None):
+        payload = _encode(data)
+        blob_name = _section_blob_name(section, payload, key)
+        if blob_name in existing and not reupload:
+            summary["unchanged"] += 1
+        else:
+            with stage("storage"):
+                get_blob_client(connect_str, container_name, blob_name).upload_blob(payload, overwrite=True)
+            record(bytes_uploaded=len(payload))
+            summary["uploaded"] += 1
+        return {"blob": blob_name, "hash": _content_hash(payload)}
+
+    sections = {}
+    for section, data in cache_results.items():
+        if section in PARTITIONED_SECTIONS and isinstance(data, dict):
+            parts = {key: publish(section, value, key) for key, value in data.items()}
+            combined = "|".join(f"{key}={part['hash']}" for key, part in sorted(parts.items()))
+            sections[section] = {"hash": _content_hash(combined.encode("utf-8")), "parts": parts}
+        else:
+            sections[section] = publish(section, data)
+
+    manifest = {"version": MANIFEST_VERSION, "sections": sections}
+    with stage("storage"):
+        upload_result = get_blob_client(connect_str, container_name, manifest_blob_name).upload_blob(
+            _encode(manifest), overwrite=True
+        )
+    remember_cached_results(connect_str, container_name, manifest_blob_name, manifest, upload_result.get("etag"))
+    if manifest_blob_name.startswith(GENERATIONS_PREFIX):
+        logging.info(f"✅ Published cache manifest {manifest_blob_name}: {summary['uploaded']} section blobs "
+                     f"uploaded, {summary['unchanged']} unchanged")
+        return summary
+
+    # Readers may still hold the previous manifest until their TTL expires, and
+    # a concurrent run may have uploaded blobs its manifest doesn't list yet
+    keep = referenced_section_blobs(manifest) | existing | {CACHE_MANIFEST_BLOB}
+    cutoff = datetime.now(timezone.utc) - timedelta(seconds=GC_GRACE_SECONDS)
+    container_client = get_blob_service_client(connect_str).get_container_client(container_name)
+    for blob in container_client.list_blobs(name_starts_with=CACHE_PREFIX):
+        if blob.name not in keep and blob.last_modified < cutoff:
+            try:
+                container_client.delete_blob(blob.name)
+                summary["deleted"] += 1
+            except ResourceNotFoundError:
+                pass
+
+    logging.info(
+        f"✅ Published cache manifest: {summary['uploaded']} section blobs uploaded, "
+        f"{summary['unchanged']} unchanged, {summary['deleted']} deleted"
+    )
+    return summary
+
+
+def get_cache_stats():
+    """
+    Returns a snapshot of the in-memory cache counters for this worker.
+
+    Returns:
+        dict: hits, misses, stale_hits, revalidations, not_modified, refreshed,
+        errors, section_hits, section_downloads and the number of cached
+        documents
+    """
+    with _lock:
+        stats = dict(_stats)
+        stats["entries"] = len(_entries)
+    return stats
+
+
+def clear_cache():
+    """Drops every cached document and resets the counters."""
+    with _lock:
+        _entries.clear()
+        _section_blobs.clear()
+        for name in _stats:
+            _stats[name] = 0
+
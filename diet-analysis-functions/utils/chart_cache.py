@@ -0,0 +1,120 @@
+"""
+Chart Cache Utility
+
+Bounded LRU cache of rendered chart images for the chart endpoints.
+
+Chart inputs only change when DataCleaningBlobTrigger rewrites the cache
+section they are drawn from, so images are keyed by that section's generation
+(its content hash) plus the request parameters. The same key becomes the strong ETag of the
+response, which lets browsers revalidate and get 304 Not Modified.
+"""
+
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+import azure.functions as func
+from utils.timing import record
+
+
+CHART_CACHE_SIZE = int(os.environ.get("CHART_CACHE_SIZE", "32"))
+CHART_MAX_AGE_SECONDS = int(os.environ.get("CHART_MAX_AGE_SECONDS", "60"))
+
+_lock = threading.Lock()
+_images = OrderedDict()
+_stats = {"hits": 0, "misses": 0, "not_modified": 0, "evictions": 0}
+
+
+def chart_etag(chart_name, generation, **params):
+    """
+    Builds the strong ETag for a chart rendered from a cache generation.
+
+    Returns:
+        str: Quoted ETag, or None when there is no generation to key on
+    """
+    if not generation:
+        return None
+    parts = [chart_name, generation] + [f"{k}={params[k]}" for k in sorted(params)]
+    return '"' + hashlib.sha1("|".join(parts).encode("utf-8")).hexdigest() + '"'
+
+
+def is_not_modified(req, etag):
+    """True when the request's If-None-Match already names this ETag."""
+    if not etag:
+        return False
+    header = req.headers.get("If-None-Match")
+    if not header:
+        return False
+    for tag in header.split(","):
+        tag = tag.strip()
+        # If-None-Match uses weak comparison, so W/"x" matches "x"
+        if tag.startswith("W/"):
+            tag = tag[2:]
+        if tag == "*" or tag == etag:
+            return True
+    return False
+
+
+def cache_headers(etag):
+    """ETag and Cache-Control headers for a cacheable chart response."""
+    if not etag:
+        return {}
+    return {
+        "ETag": etag,
+        "Cache-Control": f"public, max-age={CHART_MAX_AGE_SECONDS}"
+    }
+
+
+def not_modified_response(etag, headers=None):
+    """Empty 304 response for a matching conditional request."""
+    with _lock:
+        _stats["not_modified"] += 1
+    return func.HttpResponse(status_code=304, headers={**cache_headers(etag), **(headers or {})})
+
+
+def get_chart(etag):
+    """Returns the cached image bytes for an ETag, or None."""
+    if not etag:
+        return None
+    with _lock:
+        image = _images.get(etag)
+        if image is None:
+            _stats["misses"] += 1
+        else:
+            _images.move_to_end(etag)
+            _stats["hits"] += 1
+    record(**{"cache_hits" if image is not None else "cache_misses": 1})
+    return image
+
+
+def put_chart(etag, image):
+    """Stores rendered image bytes, evicting the least recently used entries."""
+    if not etag:
+        return
+    with _lock:
+        _images[etag] = image
+        _images.move_to_end(etag)
+        while len(_images) > CHART_CACHE_SIZE:
+            _images.popitem(last=False)
+            _stats["evictions"] += 1
+
+
+def get_chart_cache_stats():
+    """
+    Returns a snapshot of the chart cache counters for this worker.
+
+    Returns:
+        dict: hits, misses, not_modified, evictions and cached image count
+    """
+    with _lock:
+        stats = dict(_stats)
+        stats["entries"] = len(_images)
+    return stats
+
+
+def clear_chart_cache():
+    """Drops every cached image and resets the counters."""
+    with _lock:
+        _images.clear()
+        for name in _stats:
+            _stats[name] = 0
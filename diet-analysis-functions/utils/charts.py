@@ -0,0 +1,336 @@
+"""
+Charts Utility
+
+Renders the dashboard charts from their cache sections, shared by the chart
+endpoints and DietDashboard. Images go through the LRU in utils/chart_cache.py.
+
+Output formats (the chart endpoints' format query parameter):
+    png   raster image, dpi and size configurable (default)
+    svg   vector image, no rasterization
+    json  chart spec with the aggregated series; the browser draws it and
+          matplotlib isn't involved at all
+
+Rendering uses matplotlib's object-oriented API (Figure + FigureCanvasAgg),
+not pyplot's global figure state, so requests can render concurrently. Each
+thread keeps a reusable Figure per chart size and clears it between renders.
+Renders run on a bounded pool (CHART_RENDER_THREADS), and concurrent requests
+for the same image share one render.
+
+matplotlib is imported on the first render, not at module load, so requests
+answered from the image cache (or with a 304) never pay for it.
+
+The async functions use chart_body_async, which awaits the render pool's
+future instead of blocking a thread on it.
+"""
+
+import asyncio
+import io
+import json
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from utils.chart_cache import get_chart, put_chart
+from utils.timing import stage
+
+
+MACRO_COLUMNS = ["Protein(g)", "Carbs(g)", "Fat(g)"]
+MACRO_LABELS = ["Protein", "Carbs", "Fat"]
+
+FORMATS = {
+    "png": "image/png",
+    "svg": "image/svg+xml",
+    "json": "application/json"
+}
+CHART_DPI = int(os.environ.get("CHART_DPI", "150"))
+MIN_DPI, MAX_DPI = 50, 300
+MIN_SIZE, MAX_SIZE = 2.0, 20.0
+# Figure size in inches per chart
+DEFAULT_SIZES = {
+    "bar": (8, 5),
+    "line": (10, 6),
+    "pie": (6, 6)
+}
+
+CHART_RENDER_THREADS = int(os.environ.get("CHART_RENDER_THREADS", "4"))
+# Reusable figures kept per thread (one per chart name, size and dpi)
+FIGURE_TEMPLATES_PER_THREAD = 8
+
+_lock = threading.Lock()
+_local = threading.local()
+_pool = None
+_pending = {}
+
+
+def _figure(chart_name, options):
+    """
+    Returns this thread's Figure for the chart and size, cleared, with an Agg
+    canvas attached. matplotlib is imported here on first use.
+    """
+    import matplotlib
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+    # Fixed SVG element ids, so the same chart always gives the same bytes
+    matplotlib.rcParams["svg.hashsalt"] = "diet-charts"
+
+    templates = getattr(_local, "templates", None)
+    if templates is None:
+        templates = _local.templates = {}
+    key = (chart_name, options["width"], options["height"], options["dpi"])
+    fig = templates.get(key)
+    if fig is None:
+        if len(templates) >= FIGURE_TEMPLATES_PER_THREAD:
+            templates.clear()
+        fig = Figure(figsize=(options["width"], options["height"]), dpi=options["dpi"])
+        FigureCanvasAgg(fig)
+        templates[key] = fig
+    else:
+        # tight_layout() moved the subplot margins and left its layout engine
+        # behind on the last render
+        fig.clear()
+        fig.set_layout_engine(None)
+        fig.subplots_adjust(**{
+            name: matplotlib.rcParams[f"figure.subplot.{name}"]
+            for name in ("left", "right", "bottom", "top", "wspace", "hspace")
+        })
+    return fig
+
+
+def chart_options(params, chart_name):
+    """
+    Reads format, dpi, width and height (inches) from the query parameters.
+    dpi and size only apply to png and svg.
+
+    Returns:
+        dict: format, dpi, width, height (also used as chart ETag parameters)
+
+    Raises:
+        ValueError: When a parameter is invalid or out of range
+    """
+    fmt = (params.get("format") or "png").strip().lower()
+    if fmt not in FORMATS:
+        raise ValueError(f"Invalid format. Must be one of: {', '.join(FORMATS)}")
+    if fmt == "json":
+        return {"format": fmt, "dpi": None, "width": None, "height": None}
+
+    default_width, default_height = DEFAULT_SIZES[chart_name]
+    try:
+        dpi = int(params.get("dpi") or CHART_DPI)
+        width = float(params.get("width") or default_width)
+        height = float(params.get("height") or default_height)
+    except ValueError:
+        raise ValueError("dpi, width and height must be numbers")
+    if not MIN_DPI <= dpi <= MAX_DPI:
+        raise ValueError(f"dpi must be between {MIN_DPI} and {MAX_DPI}")
+    if not (MIN_SIZE <= width <= MAX_SIZE and MIN_SIZE <= height <= MAX_SIZE):
+        raise ValueError(f"width and height must be between {MIN_SIZE:g} and {MAX_SIZE:g} inches")
+    return {"format": fmt, "dpi": dpi, "width": width, "height": height}
+
+
+def _default_options(chart_name):
+    width, height = DEFAULT_SIZES[chart_name]
+    return {"format": "png", "dpi": CHART_DPI, "width": width, "height": height}
+
+
+def _save(fig, options):
+    buf = io.BytesIO()
+    # No creation date in SVGs, so the same data gives the same bytes
+    metadata = {"Date": None} if options["format"] == "svg" else None
+    fig.savefig(buf, format=options["format"], dpi=options["dpi"], metadata=metadata)
+    return buf.getvalue()
+
+
+def render_bar_chart(section, options=None):
+    """
+    Renders the bar_chart cache section.
+
+    Returns:
+        bytes: PNG or SVG image
+    """
+    options = options or _default_options("bar")
+    avg_protein = section["data"]
+    fig = _figure("bar", options)
+    ax = fig.add_subplot()
+    # Same look as pandas' Series.plot(kind="bar")
+    ax.bar(list(avg_protein), list(avg_protein.values()), width=0.5, color="steelblue")
+    ax.tick_params(axis="x", labelrotation=90)
+    ax.set_title("Average Protein by Diet Type")
+    ax.set_xlabel("Diet Type")
+    ax.set_ylabel("Protein (g)")
+    fig.tight_layout()
+    return _save(fig, options)
+
+
+def render_line_chart(section, options=None):
+    """
+    Renders the line_chart cache section.
+
+    Returns:
+        bytes: PNG or SVG image
+    """
+    options = options or _default_options("line")
+    avg_macros = section["data"]
+    diets = list(avg_macros)
+    fig = _figure("line", options)
+    ax = fig.add_subplot()
+    for col, label in zip(MACRO_COLUMNS, MACRO_LABELS):
+        ax.plot(diets, [avg_macros[diet][col] for diet in diets], marker="o", label=label)
+    ax.set_title("Average Macronutrients by Diet Type")
+    ax.set_xlabel("Diet Type")
+    ax.set_ylabel("Grams")
+    ax.legend()
+    fig.tight_layout()
+    return _save(fig, options)
+
+
+def render_pie_chart(macros, diet, options=None):
+    """
+    Renders one diet's entry of the pie_chart cache section.
+
+    Returns:
+        bytes: PNG or SVG image
+    """
+    options = options or _default_options("pie")
+    fig = _figure("pie", options)
+    ax = fig.add_subplot()
+    ax.pie([macros[col] for col in MACRO_COLUMNS], labels=MACRO_LABELS, autopct="%1.1f%%")
+    ax.set_title(f"Macronutrient Composition for {diet} Diet")
+    fig.tight_layout()
+    return _save(fig, options)
+
+
+def bar_chart_spec(section):
+    """Chart spec (JSON format) for the bar_chart cache section."""
+    diets = list(section["data"])
+    return {
+        "type": "bar",
+        "title": "Average Protein by Diet Type",
+        "x_label": "Diet Type",
+        "y_label": "Protein (g)",
+        "labels": diets,
+        "series": [{"name": "Protein", "values": [section["data"][diet] for diet in diets]}]
+    }
+
+
+def line_chart_spec(section):
+    """Chart spec (JSON format) for the line_chart cache section."""
+    diets = list(section["data"])
+    return {
+        "type": "line",
+        "title": "Average Macronutrients by Diet Type",
+        "x_label": "Diet Type",
+        "y_label": "Grams",
+        "labels": diets,
+        "series": [
+            {"name": label, "values": [section["data"][diet][col] for diet in diets]}
+            for col, label in zip(MACRO_COLUMNS, MACRO_LABELS)
+        ]
+    }
+
+
+def pie_chart_spec(macros, diet):
+    """Chart spec (JSON format) for one diet of the pie_chart cache section."""
+    return {
+        "type": "pie",
+        "title": f"Macronutrient Composition for {diet} Diet",
+        "labels": MACRO_LABELS,
+        "series": [{"name": diet, "values": [macros[col] for col in MACRO_COLUMNS]}]
+    }
+
+
+def chart_body(etag, options, spec, render, *args):
+    """
+    Builds the response body in the requested format: the spec as JSON, or
+    the (cached) rendered image.
+
+    Returns:
+        tuple: (bytes, mimetype)
+    """
+    if options["format"] == "json":
+        with stage("serialize"):
+            return json.dumps(spec(*args)).encode("utf-8"), FORMATS["json"]
+    return chart_image(etag, render, *args, options), FORMATS[options["format"]]
+
+
+async def chart_body_async(etag, options, spec, render, *args):
+    """Same as chart_body for async functions."""
+    if options["format"] == "json":
+        with stage("serialize"):
+            return json.dumps(spec(*args)).encode("utf-8"), FORMATS["json"]
+    return await chart_image_async(etag, render, *args, options), FORMATS[options["format"]]
+
+
+def _render_pool():
+    global _pool
+    with _lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=CHART_RENDER_THREADS, thread_name_prefix="chart-render")
+        return _pool
+
+
+def set_render_threads(count):
+    """Replaces the render pool with one of the given size (load tests, tuning)."""
+    global _pool, CHART_RENDER_THREADS
+    with _lock:
+        old, _pool = _pool, None
+        CHART_RENDER_THREADS = count
+    if old is not None:
+        old.shutdown(wait=True)
+
+
+def _render_and_store(etag, render, args):
+    try:
+        image = render(*args)
+        put_chart(etag, image)
+        return image
+    finally:
+        if etag:
+            with _lock:
+                _pending.pop(etag, None)
+
+
+def submit_chart(etag, render, *args):
+    """
+    Starts rendering an image on the render pool, unless it is cached or
+    already being rendered for another request.
+
+    Returns:
+        Future: Resolves to the PNG or SVG bytes
+    """
+    image = get_chart(etag)
+    if image is not None:
+        future = Future()
+        future.set_result(image)
+        return future
+
+    pool = _render_pool()
+    with _lock:
+        future = _pending.get(etag) if etag else None
+        if future is None:
+            future = pool.submit(_render_and_store, etag, render, args)
+            if etag:
+                _pending[etag] = future
+    return future
+
+
+def chart_image(etag, render, *args):
+    """
+    Returns the cached image for an ETag, rendering it on the render pool
+    and caching it on a miss.
+
+    Returns:
+        bytes: PNG or SVG image
+    """
+    future = submit_chart(etag, render, *args)
+    if future.done():
+        return future.result()
+    with stage("render"):
+        return future.result()
+
+
+async def chart_image_async(etag, render, *args):
+    """Same as chart_image for async functions."""
+    future = submit_chart(etag, render, *args)
+    if future.done():
+        return future.result()
+    with stage("render"):
+        return await asyncio.wrap_future(future)
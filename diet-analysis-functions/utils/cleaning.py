@@ -0,0 +1,364 @@
+"""
+Cleaning Utility
+
+Data cleaning rules for All_Diets.csv, shared by DataCleaningBlobTrigger.
+
+clean_dataframe() cleans a frame that fits in memory. clean_blob_streaming()
+applies the same rules to a blob of any size in fixed-size chunks:
+
+    Pass 1  stream the source from storage, normalize Diet_type, drop invalid
+            diets, drop duplicates across chunks with a set of 64-bit row
+            hashes, and accumulate the column means used for imputation.
+            Surviving rows are spooled to a local temp file.
+    Pass 2  read the spool back in chunks, impute missing values, stage each
+            chunk as a block of the cleaned blob and feed the aggregation
+            engine, then commit the block list.
+
+Chunk size is derived from STREAMING_MEMORY_TARGET_MB and halved whenever
+resident memory goes over it. The target steers the chunk size; it is not a
+hard limit: the row-hash set grows with the input (8 bytes per unique row)
+and is never shrunk or spilled, and the chunk size is only halved after RSS
+has already gone over.
+
+clean_delta() applies the same rules to a batch of new rows, given the row
+hashes and running column sums of everything loaded before (utils/ingest.py).
+"""
+
+import base64
+import io
+import logging
+import os
+import tempfile
+import numpy as np
+import pandas as pd
+from azure.core import MatchConditions
+from pandas.api.types import is_bool_dtype, is_numeric_dtype
+from utils.aggregation import AggregateAccumulator
+from utils.storage import get_blob_client
+from utils.timing import record, stage
+
+
+VALID_DIETS = ["Paleo", "Vegan", "Keto", "Mediterranean", "Dash"]
+NUMERIC_COLUMNS = ["Protein(g)", "Carbs(g)", "Fat(g)", "Calories"]
+
+# Resident memory the chunk size aims for (STREAMING_MEMORY_BUDGET_MB is the old name)
+STREAMING_MEMORY_TARGET_MB = int(os.environ.get(
+    "STREAMING_MEMORY_TARGET_MB", os.environ.get("STREAMING_MEMORY_BUDGET_MB", "512")
+))
+MIN_CHUNK_ROWS = 1000
+PROBE_CHUNK_ROWS = 10000
+# In-memory size of a chunk relative to the target left after the baseline
+# (parser buffers, hashes and CSV text all hold copies of a chunk)
+CHUNK_COPIES = 8
+
+
+def clean_dataframe(df):
+    """
+    Cleans a whole dataset in memory.
+
+    Returns:
+        DataFrame: The cleaned dataset
+    """
+    # 1. Standardize Diet_type column (capitalize first letter, strip whitespace)
+    df["Diet_type"] = df["Diet_type"].astype(str).str.strip().str.title()
+
+    # 2. Remove duplicate rows
+    original_count = len(df)
+    df = df.drop_duplicates()
+    duplicates_removed = original_count - len(df)
+    if duplicates_removed > 0:
+        logging.info(f"🧹 Removed {duplicates_removed} duplicate rows")
+
+    # 3. Remove rows with invalid diet types
+    df = df[df["Diet_type"].isin(VALID_DIETS)].copy()
+
+    # 4. Handle missing values in numeric columns
+    for col in NUMERIC_COLUMNS:
+        if col in df.columns:
+            # Fill missing values with column mean
+            df[col] = pd.to_numeric(df[col], errors='coerce')
+            df[col] = df[col].fillna(df[col].mean())
+
+    # 5. Remove rows with all NaN values
+    df = df.dropna(how='all')
+
+    return df
+
+
+def current_rss_bytes():
+    """Resident set size of this process, or 0 where /proc isn't available."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return 0
+
+
+class _BlobStream(io.RawIOBase):
+    """Read-only file object over an iterator of byte chunks."""
+
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._pending = b""
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while not self._pending:
+            try:
+                self._pending = next(self._chunks)
+            except StopIteration:
+                return 0
+        size = min(len(buffer), len(self._pending))
+        buffer[:size] = self._pending[:size]
+        self._pending = self._pending[size:]
+        return size
+
+
+class RowHashSet:
+    """Set of uint64 row hashes kept as sorted numpy arrays (8 bytes per row)."""
+
+    def __init__(self, hashes=None):
+        self._sorted = np.empty(0, dtype=np.uint64) if hashes is None else np.asarray(hashes, dtype=np.uint64)
+        self._pending = []
+        self._pending_size = 0
+
+    def __len__(self):
+        return len(self._sorted) + self._pending_size
+
+    @property
+    def nbytes(self):
+        return len(self) * 8
+
+    def _contains(self, hashes):
+        found = np.zeros(len(hashes), dtype=bool)
+        if len(self._sorted):
+            positions = np.searchsorted(self._sorted, hashes).clip(max=len(self._sorted) - 1)
+            found |= self._sorted[positions] == hashes
+        for batch in self._pending:
+            found |= np.isin(hashes, batch)
+        return found
+
+    def add_new(self, hashes):
+        """Adds the hashes and returns a mask of the ones not seen before."""
+        hashes = np.asarray(hashes, dtype=np.uint64)
+        new = ~self._contains(hashes) & ~pd.Series(hashes).duplicated().to_numpy()
+        if new.any():
+            self._pending.append(np.sort(hashes[new]))
+            self._pending_size += int(new.sum())
+            # Fold pending batches in once they outgrow a fraction of the set
+            if len(self._pending) > 8 or self._pending_size > len(self._sorted) // 4:
+                self._sorted = np.sort(np.concatenate([self._sorted, *self._pending]))
+                self._pending = []
+                self._pending_size = 0
+        return new
+
+    def to_array(self):
+        """Returns every hash as one sorted array."""
+        if self._pending:
+            self._sorted = np.sort(np.concatenate([self._sorted, *self._pending]))
+            self._pending = []
+            self._pending_size = 0
+        return self._sorted
+
+
+class _MemoryTarget:
+    """Tracks peak RSS and shrinks the chunk size after it goes over the target."""
+
+    def __init__(self, target_mb):
+        self.target_bytes = target_mb * 1024 * 1024
+        self.baseline_bytes = current_rss_bytes()
+        self.peak_bytes = self.baseline_bytes
+        self.over_target = 0
+
+    def chunk_rows_for(self, bytes_per_row):
+        available = max(self.target_bytes - self.baseline_bytes, self.target_bytes // 4)
+        return max(MIN_CHUNK_ROWS, int(available / (max(bytes_per_row, 1) * CHUNK_COPIES)))
+
+    def check(self, chunk_rows):
+        rss = current_rss_bytes()
+        self.peak_bytes = max(self.peak_bytes, rss)
+        if rss > self.target_bytes and chunk_rows > MIN_CHUNK_ROWS:
+            self.over_target += 1
+            chunk_rows = max(MIN_CHUNK_ROWS, chunk_rows // 2)
+            logging.warning(f"⚠️ RSS {rss / 1e6:.0f} MB over target, chunk size now {chunk_rows} rows")
+        return chunk_rows
+
+
+def _row_hashes(chunk):
+    """
+    64-bit hash per row. Numeric columns are hashed as float64 so a column
+    read as int in one chunk and float in another still hashes the same.
+    """
+    canonical = chunk.astype({
+        col: "float64" for col in chunk.columns
+        if is_numeric_dtype(chunk[col]) and not is_bool_dtype(chunk[col])
+    })
+    return pd.util.hash_pandas_object(canonical, index=False).to_numpy()
+
+
+def _block_id(number):
+    return base64.b64encode(f"{number:08d}".encode("ascii")).decode("ascii")
+
+
+def accept_new_rows(df, seen, sums, counts):
+    """
+    Normalizes Diet_type, drops invalid diets and rows whose hash is already
+    in seen (a RowHashSet, updated), and adds the remaining rows' numeric
+    values to sums and counts (updated). Missing values are left in place.
+
+    Returns:
+        tuple: (accepted rows, report with invalid_removed and duplicates_removed)
+    """
+    df = df.copy()
+    df["Diet_type"] = df["Diet_type"].astype(str).str.strip().str.title()
+    valid = df["Diet_type"].isin(VALID_DIETS).to_numpy()
+    df = df[valid]
+    new = seen.add_new(_row_hashes(df))
+    df = df[new].copy()
+    for col in NUMERIC_COLUMNS:
+        if col in df.columns:
+            df[col] = pd.to_numeric(df[col], errors='coerce')
+            sums[col] = sums.get(col, 0.0) + float(df[col].sum())
+            counts[col] = counts.get(col, 0) + int(df[col].count())
+    return df, {"invalid_removed": int((~valid).sum()), "duplicates_removed": int((~new).sum())}
+
+
+def clean_delta(df, seen, sums, counts):
+    """
+    Cleans a batch of new rows with the same rules as clean_dataframe, against
+    the state of everything loaded before: duplicates of earlier rows are
+    dropped too, and missing values are imputed with the running column means.
+
+    Returns:
+        tuple: (cleaned rows, report)
+    """
+    rows_read = len(df)
+    df, report = accept_new_rows(df, seen, sums, counts)
+    for col in NUMERIC_COLUMNS:
+        if col in df.columns and counts.get(col):
+            df[col] = df[col].fillna(sums[col] / counts[col])
+    df = df.dropna(how='all')
+    report.update({"rows_read": rows_read, "rows_written": len(df)})
+    return df, report
+
+
+def clean_blob_streaming(connect_str, container_name, source_blob_name, cleaned_blob_name,
+                         memory_target_mb=STREAMING_MEMORY_TARGET_MB, chunk_rows=None, state=None,
+                         source_etag=None):
+    """
+    Cleans a blob of any size in chunks sized for memory_target_mb and writes
+    the cleaned CSV (peak RSS can exceed the target, see the module docstring).
+    When an IngestState is given, it is filled in with the row hashes, column
+    sums and partial aggregates for later delta batches. With source_etag the
+    download fails (ResourceModifiedError) unless the source still has it.
+
+    Returns:
+        tuple: (cache_results, report) where report holds row counts, the chunk
+        size used, the dedup set size and the peak RSS in bytes
+    """
+    target = _MemoryTarget(memory_target_mb)
+    report = {"rows_read": 0, "duplicates_removed": 0, "invalid_removed": 0, "rows_written": 0}
+    sums = {}
+    counts = {}
+    seen = RowHashSet()
+
+    # ===== PASS 1: dedup + filter, spool to local disk =====
+    conditions = {"etag": source_etag, "match_condition": MatchConditions.IfNotModified} if source_etag else {}
+    source = get_blob_client(connect_str, container_name, source_blob_name).download_blob(**conditions)
+    reader = pd.read_csv(io.BufferedReader(_BlobStream(source.chunks()), buffer_size=1024 * 1024), iterator=True)
+    spool = tempfile.TemporaryFile()
+    columns = None
+    rows = PROBE_CHUNK_ROWS if chunk_rows is None else chunk_rows
+
+    try:
+        while True:
+            try:
+                # Blob chunks are downloaded as the parser asks for them
+                with stage("parse"):
+                    chunk = reader.get_chunk(rows)
+            except StopIteration:
+                break
+            if chunk_rows is None and columns is None:
+                # Size the following chunks from the first one
+                bytes_per_row = chunk.memory_usage(deep=True).sum() / max(len(chunk), 1)
+                rows = target.chunk_rows_for(bytes_per_row)
+                logging.info(f"📏 ~{bytes_per_row:.0f} bytes/row, reading {rows} rows per chunk")
+
+            report["rows_read"] += len(chunk)
+            with stage("clean"):
+                chunk["Diet_type"] = chunk["Diet_type"].astype(str).str.strip().str.title()
+                valid = chunk["Diet_type"].isin(VALID_DIETS).to_numpy()
+                report["invalid_removed"] += int((~valid).sum())
+                chunk = chunk[valid]
+                # Only valid rows are hashed, so invalid rows cost no dedup memory
+                new = seen.add_new(_row_hashes(chunk))
+                report["duplicates_removed"] += int((~new).sum())
+                chunk = chunk[new].copy()
+
+                for col in NUMERIC_COLUMNS:
+                    if col in chunk.columns:
+                        chunk[col] = pd.to_numeric(chunk[col], errors='coerce')
+                        sums[col] = sums.get(col, 0.0) + float(chunk[col].sum())
+                        counts[col] = counts.get(col, 0) + int(chunk[col].count())
+
+            chunk.to_csv(spool, index=False, header=columns is None)
+            columns = list(chunk.columns)
+            rows = target.check(rows)
+
+        means = {col: sums[col] / counts[col] if counts[col] else np.nan for col in sums}
+
+        # ===== PASS 2: impute, upload as staged blocks, aggregate =====
+        spool.seek(0)
+        blob_client = get_blob_client(connect_str, container_name, cleaned_blob_name)
+        accumulator = AggregateAccumulator()
+        block_ids = []
+
+        if columns is not None:
+            reader = pd.read_csv(spool, iterator=True)
+            while True:
+                try:
+                    chunk = reader.get_chunk(rows)
+                except StopIteration:
+                    break
+                for col, mean in means.items():
+                    chunk[col] = chunk[col].fillna(mean)
+                chunk = chunk.dropna(how='all')
+
+                block = chunk.to_csv(index=False, header=not block_ids).encode("utf-8")
+                block_id = _block_id(len(block_ids))
+                with stage("storage"):
+                    blob_client.stage_block(block_id, block)
+                record(bytes_uploaded=len(block))
+                block_ids.append(block_id)
+
+                accumulator.add(chunk)
+                report["rows_written"] += len(chunk)
+                rows = target.check(rows)
+
+        with stage("storage"):
+            commit_result = blob_client.commit_block_list(block_ids)
+    finally:
+        spool.close()
+
+    if state is not None:
+        state.hashes, state.sums, state.counts = seen, sums, counts
+        state.accumulator, state.columns = accumulator, columns or []
+
+    record(rows=report["rows_read"])
+    report.update({
+        "chunk_rows": rows,
+        "blocks": len(block_ids),
+        "etag": commit_result.get("etag"),
+        "dedup_set_bytes": seen.nbytes,
+        "peak_rss_bytes": target.peak_bytes,
+        "memory_target_bytes": target.target_bytes,
+        "chunks_over_target": target.over_target
+    })
+    logging.info(
+        f"✅ Streamed {report['rows_read']} rows -> {report['rows_written']} cleaned rows in "
+        f"{len(block_ids)} blocks, peak RSS {target.peak_bytes / 1e6:.0f} MB "
+        f"(target {target.target_bytes / 1e6:.0f} MB)"
+    )
+    return accumulator.results(), report
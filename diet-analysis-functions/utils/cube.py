@@ -0,0 +1,100 @@
+"""
+Cube Utility
+
+Roll-ups of the Diet_type x Cuisine_type x Extraction_day cube stored in the
+"cube" cache section, for DietCube.
+
+Every cell holds count, sum, M2 (sum of squared deviations from the cell
+mean), min and max of each metric, so grouping by any subset of the
+dimensions is a fold over cells: count and sum add up, min and max take the
+extremes, and M2 is merged with Chan's parallel formula, the same as
+merge_aggregates. mean = sum / count and the sample variance is
+M2 / (count - 1). Nothing here needs pandas, and the dataset is never
+rescanned.
+"""
+
+import math
+from utils.rankings import RANKING_METRICS
+
+
+# Query parameter name -> cube dimension
+CUBE_DIMS = {
+    "diet": "Diet_type",
+    "cuisine": "Cuisine_type",
+    "day": "Extraction_day"
+}
+# Same metric names as DietRankings
+CUBE_METRICS = RANKING_METRICS
+CELL_STATS = ["count", "sum", "m2", "min", "max"]
+
+
+def parse_dims(value):
+    """
+    Reads a comma-separated dims parameter (e.g. "diet,cuisine").
+
+    Returns:
+        list: Dimension names, empty for a grand total
+
+    Raises:
+        ValueError: When a dimension is unknown or repeated
+    """
+    dims = [dim.strip().lower() for dim in (value or "").split(",") if dim.strip()]
+    for dim in dims:
+        if dim not in CUBE_DIMS:
+            raise ValueError(f"Invalid dims. Must be a comma-separated list of: {', '.join(CUBE_DIMS)}")
+    if len(set(dims)) != len(dims):
+        raise ValueError("dims must not repeat a dimension")
+    return dims
+
+
+def rollup(cube, dims, metric, filters=None):
+    """
+    Sums the cube cells into one group per combination of dims, keeping only
+    cells whose dimensions match filters ({dim: value}).
+
+    Returns:
+        list: One dict per group with the dims, count, sum, mean, std, min and max,
+        ordered by the dims
+    """
+    column = CUBE_METRICS[metric]
+    positions = [cube["dims"].index(CUBE_DIMS[dim]) for dim in dims]
+    wanted = [(cube["dims"].index(CUBE_DIMS[dim]), value) for dim, value in (filters or {}).items()]
+    stats = cube["stats"][column]
+
+    groups = {}
+    for i, cell in enumerate(cube["cells"]):
+        if any(cell[position] != value for position, value in wanted):
+            continue
+        key = tuple(cell[position] for position in positions)
+        group = groups.get(key)
+        if group is None:
+            group = groups[key] = {"count": 0, "sum": 0.0, "mean": 0.0, "m2": 0.0, "min": math.inf, "max": -math.inf}
+        count = stats["count"][i]
+        # No values for this metric in the cell (min is None)
+        if not count:
+            continue
+        # Chan's parallel update: M2 grows by delta^2 * n_a * n_b / n
+        total = group["count"] + count
+        delta = stats["sum"][i] / count - group["mean"]
+        group["m2"] += stats["m2"][i] + delta * delta * group["count"] * count / total
+        group["mean"] += delta * count / total
+        group["count"] = total
+        group["sum"] += stats["sum"][i]
+        group["min"] = min(group["min"], stats["min"][i])
+        group["max"] = max(group["max"], stats["max"][i])
+
+    results = []
+    for key in sorted(groups):
+        group = groups[key]
+        count = group["count"]
+        std = math.sqrt(group["m2"] / (count - 1)) if count > 1 else None
+        results.append({
+            **dict(zip(dims, key)),
+            "count": count,
+            "sum": group["sum"],
+            "mean": group["sum"] / count if count else None,
+            "std": std,
+            "min": group["min"] if count else None,
+            "max": group["max"] if count else None
+        })
+    return results
@@ -0,0 +1,625 @@
+"""
+Dataset Utility
+
+Keeps the diet dataset resident in worker memory for DietSearch so a page
+request doesn't download and re-parse the whole CSV.
+
+The columnar snapshot and cleaned file written by DataCleaningBlobTrigger are
+preferred over the raw upload. Columns use compact dtypes (category for the
+text columns used in filters, float32 for the macros, so responses carry the
+macros rounded to float32 precision) and row positions are partitioned by
+diet once at load time, so a diet filter is a dict lookup instead of a full
+scan.
+Keyword search goes through the inverted index from utils/search_index.py.
+Filter results are kept per query (QUERY_CACHE_SIZE per dataset), so paging
+through a search doesn't redo the filter or recount total_records.
+
+Protein(g), Carbs(g) and Fat(g) also get a sorted permutation of the rows
+(ascending and descending) at load time, so a min_/max_ range is a binary
+search and a sorted result is the permutation with the other filters applied,
+never a sort per request.
+
+Pages can be addressed by number or by an opaque cursor. A cursor carries the
+dataset generation, the query and the last row position returned, and the
+next page starts right after that position (a binary search in the cached
+result). Cursors from an older generation of the dataset are rejected.
+A page's rows are one dict per row, or in the "columnar" layout the column
+names once and one array of values per column, which is smaller on the wire
+and compresses better.
+
+The source is the published generation (utils/generations.py): its snapshot,
+else its cleaned CSV parts. Generation blobs never change, so a copy is
+found by the request's pinned generation with no storage call. A request
+only ever gets the copy of its own generation; the last DATASET_KEEP copies
+are kept, so requests still pinned to the previous generation after a flip
+don't reload it. Without generations the copy is invalidated when the
+source blob's ETag changes; the ETag is checked at most every
+DATASET_TTL_SECONDS.
+
+get_dataset_async is the same for the async functions: the source blobs are
+checked concurrently with the aio client and a CSV is downloaded as parallel
+range GETs without blocking the event loop; parsing runs on a worker thread.
+Concurrent misses for the same source and generation share one download.
+"""
+
+import asyncio
+import base64
+import binascii
+import hashlib
+import io
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+from azure.core.exceptions import ResourceNotFoundError
+from utils.cache_helper import GENERATIONS_PREFIX, get_current_generation, get_current_generation_async
+from utils.generations import download_cleaned, download_cleaned_async
+from utils.search_index import SEARCH_INDEX_BLOB, SearchIndex, build_search_index, find_keyword_rows
+from utils.snapshot import SNAPSHOT_BLOB, get_snapshot
+from utils.storage import download_kwargs, get_async_blob_client, get_blob_client
+from utils.timing import record, stage
+
+
+# Seconds between ETag checks against blob storage
+DATASET_TTL_SECONDS = float(os.environ.get("DATASET_TTL_SECONDS", "30"))
+
+# Filter results kept per dataset (query -> row positions)
+QUERY_CACHE_SIZE = int(os.environ.get("QUERY_CACHE_SIZE", "64"))
+
+# Query parameter name -> numeric column for min_*/max_* and sort
+RANGE_COLUMNS = {
+    "protein": "Protein(g)",
+    "carbs": "Carbs(g)",
+    "fat": "Fat(g)"
+}
+
+# Rows converted per chunk by the NDJSON export
+EXPORT_CHUNK_ROWS = int(os.environ.get("EXPORT_CHUNK_ROWS", "5000"))
+
+# Preferred source first
+SOURCE_BLOBS = [SNAPSHOT_BLOB, "All_Diets_cleaned.csv", "All_Diets.csv"]
+
+MACRO_COLUMNS = ["Protein(g)", "Carbs(g)", "Fat(g)"]
+# Row layouts of a page: one dict per row, or column names plus value arrays
+LAYOUTS = ("records", "columnar")
+DTYPES = {
+    "Diet_type": "category",
+    "Cuisine_type": "category",
+    "Protein(g)": "float32",
+    "Carbs(g)": "float32",
+    "Fat(g)": "float32",
+    "Extraction_day": "category",
+    "Extraction_time": "category"
+}
+
+# Copies kept per dataset key: the current generation's and the previous one
+DATASET_KEEP = 2
+
+_lock = threading.Lock()
+# Dataset key -> OrderedDict of (source blob, ETag or generation) -> DietDataset, newest last
+_datasets = {}
+# (event loop, dataset key, source blob, ETag or generation) -> load task shared by concurrent misses
+_async_loads = {}
+
+
+class CursorError(ValueError):
+    """A pagination cursor that is malformed or belongs to another query."""
+
+
+class StaleCursorError(CursorError):
+    """A pagination cursor issued for an older generation of the dataset."""
+
+
+def _digest(value):
+    return hashlib.sha1(value.encode("utf-8")).hexdigest()[:12]
+
+
+def range_sort_options(params):
+    """
+    Reads the min_*/max_* range filters and sort/order from the query
+    parameters (names from RANGE_COLUMNS, e.g. min_protein=50&sort=fat).
+
+    Returns:
+        dict: ranges ({column: (low, high)}, either bound may be None), sort, order
+
+    Raises:
+        ValueError: When a parameter is invalid
+    """
+    ranges = {}
+    for name, col in RANGE_COLUMNS.items():
+        try:
+            low = params.get(f"min_{name}")
+            high = params.get(f"max_{name}")
+            bounds = (float(low) if low else None, float(high) if high else None)
+        except ValueError:
+            raise ValueError(f"min_{name} and max_{name} must be numbers")
+        if bounds != (None, None):
+            ranges[col] = bounds
+
+    sort = (params.get("sort") or "").strip().lower()
+    if sort and sort not in RANGE_COLUMNS:
+        raise ValueError(f"Invalid sort. Must be one of: {', '.join(RANGE_COLUMNS)}")
+    order = (params.get("order") or "asc").strip().lower()
+    if order not in ("asc", "desc"):
+        raise ValueError("Invalid order. Must be one of: asc, desc")
+    return {"ranges": ranges, "sort": RANGE_COLUMNS.get(sort), "order": order}
+
+
+class DietDataset:
+    """Parsed dataset plus its per-diet row partitions and sorted column indexes."""
+
+    def __init__(self, df, blob_name, etag, search_index=None):
+        self.df = df
+        self.blob_name = blob_name
+        self.etag = etag
+        self.search_index = search_index
+        self.checked_at = time.monotonic()
+        # Changes whenever the source blob does; stamped into cursors
+        self.generation = _digest(f"{blob_name}:{etag}")
+        self._queries = OrderedDict()
+        self._queries_lock = threading.Lock()
+        # Diet -> sorted row positions, computed once per load
+        self.diet_rows = {
+            diet: positions
+            for diet, positions in df.groupby("Diet_type", observed=True, sort=False).indices.items()
+        }
+        # (column, order) -> sort keys and row positions ordered by (key, position).
+        # desc sorts on the negated values; NaN sorts last either way.
+        self.sorted_rows = {}
+        for col in RANGE_COLUMNS.values():
+            if col in df.columns:
+                values = df[col].to_numpy()
+                for order, keys in (("asc", values), ("desc", -values)):
+                    permutation = np.argsort(keys, kind="stable")
+                    self.sorted_rows[(col, order)] = (keys, permutation, keys[permutation])
+
+    def __len__(self):
+        return len(self.df)
+
+    def rows_for_diet(self, diet):
+        """Returns the row positions for a diet (empty array when unknown)."""
+        return self.diet_rows.get(diet, np.empty(0, dtype=np.intp))
+
+    def keyword_rows(self, keyword, prefix=False):
+        """Returns the sorted row positions matching a keyword (see find_keyword_rows)."""
+        return find_keyword_rows(self.df, keyword, self.search_index, prefix)
+
+    def range_rows(self, col, low=None, high=None):
+        """
+        Returns the row positions with low <= col <= high (in ascending value
+        order), a binary search into the column's sorted permutation.
+        """
+        _, permutation, sorted_values = self.sorted_rows[(col, "asc")]
+        dtype = sorted_values.dtype.type
+        start = 0 if low is None else np.searchsorted(sorted_values, dtype(low), side="left")
+        # NaN sorts last, so an open upper bound stops before the missing values
+        stop = (
+            np.searchsorted(sorted_values, np.inf, side="right") if high is None
+            else np.searchsorted(sorted_values, dtype(high), side="right")
+        )
+        return permutation[start:stop]
+
+    def filter_positions(self, diet=None, keyword="", prefix=False, ranges=None, sort=None, order="asc"):
+        """
+        Returns the row positions for a diet ("All" or empty for every diet),
+        narrowed to the keyword matches and the {column: (low, high)} ranges,
+        in row order or ordered by the sort column.
+        Results are cached per query for the life of the dataset.
+        """
+        return self._query(self.query_key(diet, keyword, prefix, ranges, sort, order))[0]
+
+    def _query(self, key):
+        """Returns the cached (positions, sort keys or None) for a query key."""
+        with self._queries_lock:
+            entry = self._queries.get(key)
+            if entry is not None:
+                self._queries.move_to_end(key)
+                return entry
+
+        diet, keyword, prefix, ranges, sort, order = key
+        if diet != "All":
+            positions = self.rows_for_diet(diet)
+        else:
+            positions = np.arange(len(self))
+        if keyword:
+            positions = np.intersect1d(positions, self.keyword_rows(keyword, prefix), assume_unique=True)
+
+        sort_keys = None
+        if ranges or sort:
+            selected = np.zeros(len(self), dtype=bool)
+            selected[positions] = True
+            for col, low, high in ranges:
+                in_range = np.zeros(len(self), dtype=bool)
+                in_range[self.range_rows(col, low, high)] = True
+                selected &= in_range
+            if sort:
+                _, permutation, sorted_keys = self.sorted_rows[(sort, order)]
+                keep = selected[permutation]
+                positions, sort_keys = permutation[keep], sorted_keys[keep]
+            else:
+                positions = np.flatnonzero(selected)
+        positions.flags.writeable = False
+
+        entry = (positions, sort_keys)
+        with self._queries_lock:
+            self._queries[key] = entry
+            while len(self._queries) > QUERY_CACHE_SIZE:
+                self._queries.popitem(last=False)
+        return entry
+
+    @staticmethod
+    def query_key(diet=None, keyword="", prefix=False, ranges=None, sort=None, order="asc"):
+        """Normalized query tuple used for the filter cache and cursors."""
+        return (
+            diet if diet and diet != "All" else "All",
+            keyword,
+            bool(prefix) and bool(keyword),
+            tuple((col, low, high) for col, (low, high) in sorted((ranges or {}).items())),
+            sort,
+            order if sort else "asc"
+        )
+
+    def encode_cursor(self, query, last_position):
+        """
+        Returns the opaque cursor for the page after last_position.
+
+        Returns:
+            str: URL-safe cursor
+        """
+        payload = json.dumps({"g": self.generation, "q": _digest(json.dumps(query)), "p": int(last_position)})
+        return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii").rstrip("=")
+
+    def decode_cursor(self, query, cursor):
+        """
+        Returns the last row position stored in a cursor.
+
+        Raises:
+            CursorError: When the cursor is malformed or was issued for another query
+            StaleCursorError: When the dataset changed since the cursor was issued
+        """
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+            generation, query_digest, last_position = payload["g"], payload["q"], int(payload["p"])
+        except (binascii.Error, ValueError, TypeError, KeyError):
+            raise CursorError("Invalid cursor")
+        if query_digest != _digest(json.dumps(query)):
+            raise CursorError("Cursor doesn't match this query")
+        if generation != self.generation:
+            raise StaleCursorError("The dataset changed since this cursor was issued, start again from the first page")
+        return last_position
+
+    def page(self, positions, page, page_size, query=None, after=None, layout="records"):
+        """
+        Slices one page out of the given row positions: page number page, or
+        the rows after row position after (a decoded cursor) when given.
+        positions must be the result of filter_positions for query.
+        A next_cursor is included when query is given and more rows follow.
+
+        Returns:
+            dict: data (JSON-ready rows in the given layout) and pagination
+        """
+        total_records = len(positions)
+        total_pages = (total_records + page_size - 1) // page_size  # Ceiling division
+        if after is not None:
+            start_idx = self._resume_index(positions, query, after)
+            page = start_idx // page_size + 1
+        else:
+            start_idx = (page - 1) * page_size
+        page_positions = positions[start_idx:start_idx + page_size]
+        pagination = {
+            "current_page": page,
+            "page_size": page_size,
+            "total_records": total_records,
+            "total_pages": total_pages
+        }
+        if query is not None:
+            more = start_idx + len(page_positions) < total_records
+            pagination["next_cursor"] = self.encode_cursor(query, page_positions[-1]) if more else None
+        if layout == "columnar":
+            return {"data": self.columns(page_positions), "pagination": pagination}
+        return {"data": self.records(page_positions), "pagination": pagination}
+
+    def _resume_index(self, positions, query, after):
+        """
+        Index in positions just past row position after. Results are ordered
+        by (sort key, row position), or by row position alone when unsorted,
+        so both are binary searches.
+        """
+        sort_keys = self._query(query)[1] if query is not None else None
+        if sort_keys is None:
+            return int(np.searchsorted(positions, after, side="right"))
+        if not 0 <= after < len(self):
+            raise CursorError("Invalid cursor")
+        key = self.sorted_rows[(query[4], query[5])][0][after]
+        start = np.searchsorted(sort_keys, key, side="left")
+        stop = np.searchsorted(sort_keys, key, side="right")
+        return int(start + np.searchsorted(positions[start:stop], after, side="right"))
+
+    def iter_ndjson(self, positions, chunk_rows=EXPORT_CHUNK_ROWS):
+        """
+        Yields the given rows as newline-delimited JSON, EXPORT_CHUNK_ROWS
+        rows at a time, so an export never holds every row as a dict.
+
+        Returns:
+            generator: bytes chunks, each a run of complete lines
+        """
+        for start in range(0, len(positions), chunk_rows):
+            chunk = self.df.iloc[positions[start:start + chunk_rows]]
+            for col in MACRO_COLUMNS:
+                if col in chunk.columns:
+                    # Shortest float32 representation, like records() (rounded to float32 precision)
+                    chunk = chunk.assign(**{col: chunk[col].astype(str).astype("float64")})
+            yield chunk.to_json(orient="records", lines=True).encode("utf-8")
+
+    def records(self, positions):
+        """
+        Converts the given row positions into JSON-ready dicts.
+
+        float32 macros are emitted with their shortest representation
+        (238.42, not 238.4199981689453). They are rounded to float32
+        precision (about 7 significant digits), so a CSV value with more
+        digits than that comes out rounded.
+        """
+        page_df = self.df.iloc[positions].copy()
+        for col in MACRO_COLUMNS:
+            if col in page_df.columns:
+                page_df[col] = [float(str(v)) for v in page_df[col].to_numpy()]
+        return page_df.to_dict(orient="records")
+
+    def columns(self, positions):
+        """
+        Converts the given row positions into the columnar layout: the column
+        names once and one JSON-ready array of values per column, with the
+        same values as records() (macros rounded to float32 precision).
+        """
+        page_df = self.df.iloc[positions]
+        values = []
+        for col in page_df.columns:
+            if col in MACRO_COLUMNS:
+                values.append([float(str(v)) for v in page_df[col].to_numpy()])
+            else:
+                values.append(page_df[col].tolist())
+        return {"columns": list(page_df.columns), "values": values}
+
+
+def _load(connect_str, container_name, blob_name, downloaded=None, pointer=None):
+    """
+    Downloads and parses one source blob into a DietDataset. downloaded is
+    (bytes, etag) of a CSV the caller already fetched; pointer is the
+    generation blob_name belongs to.
+    """
+    index_blob_name = pointer["blobs"].get("search_index") if pointer is not None else SEARCH_INDEX_BLOB
+    if blob_name.endswith(SNAPSHOT_BLOB):
+        snapshot = get_snapshot(connect_str, container_name, blob_name)
+        with stage("parse"):
+            df = snapshot.to_frame().astype(DTYPES)
+        # The stored search index is keyed by the cleaned CSV the snapshot came from
+        index_etag = snapshot.source_etag
+        etag = pointer["generation"] if pointer is not None else snapshot.etag
+    else:
+        if downloaded is None and pointer is not None:
+            downloaded = (download_cleaned(connect_str, container_name, pointer), pointer["generation"])
+        elif downloaded is None:
+            blob_client = get_blob_client(connect_str, container_name, blob_name)
+            with stage("storage"):
+                downloader = blob_client.download_blob(**download_kwargs())
+                downloaded = (downloader.readall(), downloader.properties.etag)
+        blob_data, etag = downloaded
+        record(bytes_downloaded=len(blob_data))
+        with stage("parse"):
+            df = pd.read_csv(io.BytesIO(blob_data), dtype=DTYPES)
+        index_etag = etag
+
+    # Normalize Diet_type once per load (the raw upload is lower case)
+    df["Diet_type"] = df["Diet_type"].astype(str).str.strip().str.title().astype("category")
+    record(rows_loaded=len(df))
+
+    logging.info(f"✅ Loaded {blob_name} into memory ({len(df)} rows)")
+    search_index = _load_search_index(connect_str, container_name, df, index_etag, index_blob_name)
+    return DietDataset(df, blob_name, etag, search_index)
+
+
+def _load_search_index(connect_str, container_name, df, etag, blob_name=SEARCH_INDEX_BLOB):
+    """
+    Loads the keyword index stored by DataCleaningBlobTrigger, or builds one
+    in memory when it is missing or was built from a different file.
+    """
+    if blob_name is None:
+        logging.info("ℹ️ This generation has no stored search index, building in memory")
+        return build_search_index(df, etag)
+    try:
+        with stage("storage"):
+            index_data = get_blob_client(connect_str, container_name, blob_name).download_blob(
+                **download_kwargs()
+            ).readall()
+        record(bytes_downloaded=len(index_data))
+        with stage("parse"):
+            index = SearchIndex.from_bytes(index_data)
+        if index is not None and index.source_etag == etag and index.n_rows == len(df):
+            return index
+        logging.info("ℹ️ Stored search index is out of date, rebuilding in memory")
+    except ResourceNotFoundError:
+        logging.info("ℹ️ No stored search index, building in memory")
+    return build_search_index(df, etag)
+
+
+def _generation_source(pointer):
+    """
+    Returns (blob_name, etag) of a generation's preferred source. Its blobs
+    never change, so the generation id stands in for their ETags.
+    """
+    blobs = pointer["blobs"]
+    return blobs.get("snapshot") or blobs["cleaned"][0], pointer["generation"]
+
+
+def _find(key, blob_name, etag):
+    """The resident copy loaded from exactly (blob_name, etag), or None."""
+    return _datasets.get(key, {}).get((blob_name, etag))
+
+
+def _latest(key):
+    """The most recently loaded copy, or None."""
+    copies = _datasets.get(key)
+    return next(reversed(copies.values()), None) if copies else None
+
+
+def _keep(key, dataset):
+    """Adds a loaded copy, dropping the oldest beyond DATASET_KEEP. Call with _lock held."""
+    # A new dict, so readers iterating without the lock never see it change
+    copies = OrderedDict(_datasets.get(key, {}))
+    copies.pop((dataset.blob_name, dataset.etag), None)
+    copies[(dataset.blob_name, dataset.etag)] = dataset
+    while len(copies) > DATASET_KEEP:
+        copies.popitem(last=False)
+    _datasets[key] = copies
+
+
+def _current_source(connect_str, container_name):
+    """Returns (blob_name, etag) of the preferred legacy source blob that exists."""
+    for blob_name in SOURCE_BLOBS:
+        try:
+            properties = get_blob_client(connect_str, container_name, blob_name).get_blob_properties()
+            return blob_name, properties.etag
+        except ResourceNotFoundError:
+            continue
+    raise ResourceNotFoundError(f"None of {', '.join(SOURCE_BLOBS)} found in '{container_name}'")
+
+
+async def _current_source_async(connect_str, container_name):
+    """Same as _current_source, checking every candidate blob at once."""
+    async def etag_of(blob_name):
+        try:
+            return (await get_async_blob_client(connect_str, container_name, blob_name).get_blob_properties()).etag
+        except ResourceNotFoundError:
+            return None
+
+    with stage("storage"):
+        etags = await asyncio.gather(*(etag_of(blob_name) for blob_name in SOURCE_BLOBS))
+    for blob_name, etag in zip(SOURCE_BLOBS, etags):
+        if etag is not None:
+            return blob_name, etag
+    raise ResourceNotFoundError(f"None of {', '.join(SOURCE_BLOBS)} found in '{container_name}'")
+
+
+def _resident(key, pointer):
+    """The resident dataset when it can be served without a storage call, else None."""
+    if pointer is not None:
+        dataset = _find(key, *_generation_source(pointer))
+    else:
+        dataset = _latest(key)
+        if dataset is not None and (
+            dataset.blob_name.startswith(GENERATIONS_PREFIX)
+            or time.monotonic() - dataset.checked_at >= DATASET_TTL_SECONDS
+        ):
+            dataset = None
+    if dataset is not None:
+        record(cache_hits=1)
+        return dataset
+    return None
+
+
+def get_dataset(connect_str, container_name="datasets"):
+    """
+    Returns the worker-resident dataset, reloading it if the published
+    generation (or, without generations, the source blob) changed.
+
+    Returns:
+        DietDataset: The current dataset
+    """
+    key = (connect_str, container_name)
+    pointer = get_current_generation(connect_str, container_name)
+    dataset = _resident(key, pointer)
+    if dataset is not None:
+        return dataset
+
+    with _lock:
+        dataset = _resident(key, pointer)
+        if dataset is not None:
+            return dataset
+
+        if pointer is not None:
+            blob_name, etag = _generation_source(pointer)
+        else:
+            blob_name, etag = _current_source(connect_str, container_name)
+            dataset = _find(key, blob_name, etag)
+            if dataset is not None:
+                dataset.checked_at = time.monotonic()
+                record(cache_hits=1)
+                return dataset
+
+        record(cache_misses=1)
+        dataset = _load(connect_str, container_name, blob_name, pointer=pointer)
+        _keep(key, dataset)
+        return dataset
+
+
+async def get_dataset_async(connect_str, container_name="datasets"):
+    """
+    Same as get_dataset for async functions.
+
+    Returns:
+        DietDataset: The current dataset
+    """
+    key = (connect_str, container_name)
+    pointer = await get_current_generation_async(connect_str, container_name)
+    dataset = _resident(key, pointer)
+    if dataset is not None:
+        return dataset
+
+    if pointer is not None:
+        blob_name, etag = _generation_source(pointer)
+    else:
+        blob_name, etag = await _current_source_async(connect_str, container_name)
+        dataset = _find(key, blob_name, etag)
+        if dataset is not None:
+            dataset.checked_at = time.monotonic()
+            record(cache_hits=1)
+            return dataset
+
+    record(cache_misses=1)
+    flight_key = (asyncio.get_running_loop(), key, blob_name, etag)
+    load = _async_loads.get(flight_key)
+    if load is None:
+        load = asyncio.ensure_future(_load_async(key, connect_str, container_name, blob_name, etag, pointer))
+        _async_loads[flight_key] = load
+        load.add_done_callback(lambda _: _async_loads.pop(flight_key, None))
+    # Shielded, so one cancelled request doesn't cancel the others' load
+    return await asyncio.shield(load)
+
+
+async def _load_async(key, connect_str, container_name, blob_name, etag, pointer):
+    """Downloads a CSV source with the aio client, then parses and installs it on a worker thread."""
+    downloaded = None
+    if not blob_name.endswith(SNAPSHOT_BLOB):
+        # The snapshot is memory-mapped from a local file, written on the worker thread
+        if pointer is not None:
+            downloaded = (await download_cleaned_async(connect_str, container_name, pointer), etag)
+        else:
+            blob_client = get_async_blob_client(connect_str, container_name, blob_name)
+            with stage("storage"):
+                downloader = await blob_client.download_blob(**download_kwargs())
+                downloaded = (await downloader.readall(), downloader.properties.etag)
+    return await asyncio.to_thread(
+        _install_dataset, key, connect_str, container_name, blob_name, etag, downloaded, pointer
+    )
+
+
+def _install_dataset(key, connect_str, container_name, blob_name, etag, downloaded, pointer):
+    with _lock:
+        # Another request may have loaded this generation in the meantime
+        dataset = _find(key, blob_name, etag)
+        if dataset is None:
+            dataset = _load(connect_str, container_name, blob_name, downloaded, pointer)
+            _keep(key, dataset)
+        dataset.checked_at = time.monotonic()
+        return dataset
+
+
+def clear_datasets():
+    """Drops every resident dataset."""
+    with _lock:
+        _datasets.clear()
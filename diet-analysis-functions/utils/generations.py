@@ -0,0 +1,280 @@
+"""
+Generations Utility
+
+Atomic, generation-versioned publishing of the cleaned dataset and its cache.
+
+Every full clean (DataCleaningBlobTrigger) and every delta batch
+(DeltaIngestBlobTrigger) writes what it produces under a prefix of its own,
+
+    generations/<id>/All_Diets_cleaned.csv         cleaned rows (delta batches:
+    generations/<id>/delta.csv                      only the new rows, no header)
+    generations/<id>/All_Diets_cleaned.snapshot
+    generations/<id>/All_Diets_cleaned_index.npz
+    generations/<id>/cache/manifest.json            (section blobs stay shared
+    generations/<id>/ingest/state.npz                under cache/, by content)
+
+and only then flips CURRENT_BLOB (current.json) to it with a conditional
+write. The pointer lists every blob of the generation; "cleaned" is a list
+of CSV parts, the full clean's file followed by one part per delta batch, so
+a batch never rewrites rows an earlier generation published. Blobs written
+under a generation are never changed, so readers that pinned a generation
+(cache_helper.pin_generation) see one consistent dataset and cache, and
+anything derived from them can be keyed by the generation id.
+
+A full clean is tied to the ETag of the upload it started from. It checks
+that ETag against All_Diets.csv before each expensive stage (after waiting
+PUBLISH_DEBOUNCE_SECONDS first, when set) and gives up with SupersededError
+as soon as a newer upload exists, since the run for that upload will
+publish instead. After each flip, generation and cache section blobs that
+neither the new pointer nor the previous one refers to are deleted, once they
+are older than GC_GRACE_SECONDS: a run still in progress, or a reader pinned
+to an older generation, may still need them.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from azure.core import MatchConditions
+from azure.core.exceptions import ResourceExistsError, ResourceModifiedError, ResourceNotFoundError
+from utils.cache_helper import (
+    CACHE_PREFIX,
+    CURRENT_BLOB,
+    GC_GRACE_SECONDS,
+    GENERATIONS_PREFIX,
+    get_cached_results,
+    referenced_section_blobs,
+    remember_cached_results
+)
+from utils.storage import download_kwargs, get_async_blob_client, get_blob_client, get_blob_service_client
+from utils.timing import record, stage
+
+
+POINTER_VERSION = 1
+# Seconds a full clean waits before starting, so a burst of uploads is cleaned once
+PUBLISH_DEBOUNCE_SECONDS = float(os.environ.get("PUBLISH_DEBOUNCE_SECONDS", "0"))
+# Pointer writes retried when another run flipped it in between
+PUBLISH_ATTEMPTS = 3
+
+
+class SupersededError(Exception):
+    """A newer upload (or an identical run) makes this run's generation pointless."""
+
+
+class PublishConflictError(Exception):
+    """The pointer moved while a generation built on it was being written."""
+
+
+def read_pointer(connect_str, container_name="datasets"):
+    """
+    Reads the pointer from storage, bypassing the in-memory copy.
+
+    Returns:
+        tuple: (pointer dict or None, its ETag or None)
+    """
+    try:
+        with stage("storage"):
+            downloader = get_blob_client(connect_str, container_name, CURRENT_BLOB).download_blob()
+            return json.loads(downloader.readall()), downloader.properties.etag
+    except ResourceNotFoundError:
+        return None, None
+
+
+def referenced_blobs(pointer):
+    """Every blob name a pointer refers to."""
+    names = set()
+    for value in (pointer or {}).get("blobs", {}).values():
+        names.update(value if isinstance(value, list) else [value])
+    return names
+
+
+def download_cleaned(connect_str, container_name, pointer):
+    """
+    Downloads a generation's cleaned CSV parts.
+
+    Returns:
+        bytes: One CSV (the parts after the first have no header)
+    """
+    parts = []
+    for blob_name in pointer["blobs"]["cleaned"]:
+        with stage("storage"):
+            parts.append(get_blob_client(connect_str, container_name, blob_name).download_blob(
+                **download_kwargs()
+            ).readall())
+    return b"".join(parts)
+
+
+async def download_cleaned_async(connect_str, container_name, pointer):
+    """Same as download_cleaned, downloading the parts concurrently."""
+    async def download(blob_name):
+        downloader = await get_async_blob_client(connect_str, container_name, blob_name).download_blob(
+            **download_kwargs()
+        )
+        return await downloader.readall()
+
+    with stage("storage"):
+        parts = await asyncio.gather(*(download(blob_name) for blob_name in pointer["blobs"]["cleaned"]))
+    return b"".join(parts)
+
+
+def _new_generation_id():
+    # Sorts by creation time; the random suffix keeps concurrent runs apart
+    return time.strftime("%Y%m%dT%H%M%SZ", time.gmtime()) + "-" + uuid.uuid4().hex[:8]
+
+
+class Generation:
+    """
+    One run's generation: where its blobs go, whether it is still wanted,
+    and the pointer flip that publishes it.
+
+    A full clean passes the source blob and the ETag of the upload it is
+    cleaning; a delta batch passes neither and builds on self.parent.
+    """
+
+    def __init__(self, connect_str, container_name, source_blob_name=None, source_etag=None):
+        self.connect_str = connect_str
+        self.container_name = container_name
+        self.source_blob_name = source_blob_name
+        self.source_etag = source_etag
+        self.id = _new_generation_id()
+        self.parent, self._parent_etag = read_pointer(connect_str, container_name)
+
+    @property
+    def prefix(self):
+        return f"{GENERATIONS_PREFIX}{self.id}/"
+
+    def blob_name(self, name):
+        """Name of one of this generation's blobs."""
+        return self.prefix + name
+
+    def check(self):
+        """
+        Raises SupersededError when the source blob no longer has the ETag this
+        run started from. Delta generations have no source to check.
+        """
+        if self.source_blob_name is None:
+            return
+        try:
+            with stage("storage"):
+                etag = get_blob_client(self.connect_str, self.container_name, self.source_blob_name) \
+                    .get_blob_properties().etag
+        except ResourceNotFoundError:
+            etag = None
+        if etag != self.source_etag:
+            raise SupersededError(f"{self.source_blob_name} changed since this run started")
+
+    def debounce(self):
+        """
+        Waits PUBLISH_DEBOUNCE_SECONDS, then checks the run is still wanted: its
+        upload is the newest and not already published (a redelivered event).
+        """
+        if PUBLISH_DEBOUNCE_SECONDS > 0:
+            time.sleep(PUBLISH_DEBOUNCE_SECONDS)
+        self.check()
+        if self.parent is not None and self.parent.get("source_etag") == self.source_etag:
+            raise SupersededError(f"Generation {self.parent['generation']} already has this upload")
+
+    def publish(self, blobs, on_retry=None, **fields):
+        """
+        Flips the pointer to this generation, then deletes generations no
+        pointer refers to any more.
+
+        A full clean whose pointer write loses a race rereads the pointer: if
+        the winner cleaned the same upload this run is redundant, otherwise
+        this run (still on the newest upload) retries over it, with the winner
+        as its parent. on_retry(winner) is called first, to rebuild whatever
+        was written against the old parent (the cache manifest only uploaded
+        the sections that parent didn't already have). A delta batch raises
+        PublishConflictError instead, so it is retried against the new parent.
+
+        Returns:
+            dict: The published pointer
+
+        Raises:
+            SupersededError: When a newer upload exists or an identical run published first
+            PublishConflictError: When the parent of a delta generation was replaced
+        """
+        pointer = {
+            "version": POINTER_VERSION,
+            "generation": self.id,
+            "parent": (self.parent or {}).get("generation"),
+            "source_etag": self.source_etag if self.source_blob_name else (self.parent or {}).get("source_etag"),
+            "published_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "blobs": blobs,
+            **fields
+        }
+        data = json.dumps(pointer, indent=2).encode("utf-8")
+        blob_client = get_blob_client(self.connect_str, self.container_name, CURRENT_BLOB)
+
+        for attempt in range(PUBLISH_ATTEMPTS):
+            self.check()
+            try:
+                with stage("storage"):
+                    if self._parent_etag is None:
+                        result = blob_client.upload_blob(data, overwrite=False)
+                    else:
+                        result = blob_client.upload_blob(
+                            data, overwrite=True, etag=self._parent_etag, match_condition=MatchConditions.IfNotModified
+                        )
+                break
+            except (ResourceExistsError, ResourceModifiedError):
+                winner, winner_etag = read_pointer(self.connect_str, self.container_name)
+                if self.source_blob_name is None:
+                    raise PublishConflictError("The published generation changed while this batch was ingested")
+                if winner is not None and winner.get("source_etag") == self.source_etag:
+                    raise SupersededError(f"Generation {winner['generation']} already has this upload")
+                logging.info(f"🔁 Generation {(winner or {}).get('generation')} was published meanwhile, retrying")
+                self.parent, self._parent_etag = winner, winner_etag
+                if on_retry is not None:
+                    on_retry(winner)
+                pointer["parent"] = (winner or {}).get("generation")
+                data = json.dumps(pointer, indent=2).encode("utf-8")
+        else:
+            raise PublishConflictError(f"Could not publish generation {self.id} after {PUBLISH_ATTEMPTS} attempts")
+
+        record(bytes_uploaded=len(data))
+        remember_cached_results(self.connect_str, self.container_name, CURRENT_BLOB, pointer, result.get("etag"))
+        logging.info(f"✅ Published generation {self.id}")
+        self.collect_garbage(pointer)
+        return pointer
+
+    def discard(self):
+        """Deletes whatever this run wrote under its prefix (a superseded or failed run)."""
+        _delete_blobs(self.connect_str, self.container_name, self.prefix, lambda blob: True)
+
+    def collect_garbage(self, pointer):
+        """
+        Deletes generation blobs, and cache section blobs, referenced by
+        neither the new pointer nor the one it replaced.
+        """
+        keep = referenced_blobs(pointer) | referenced_blobs(self.parent)
+        for manifest_pointer in (pointer, self.parent):
+            manifest_blob_name = (manifest_pointer or {}).get("blobs", {}).get("manifest")
+            if manifest_blob_name:
+                manifest = get_cached_results(self.connect_str, self.container_name, manifest_blob_name)
+                keep |= referenced_section_blobs(manifest or {})
+
+        cutoff = datetime.now(timezone.utc) - timedelta(seconds=GC_GRACE_SECONDS)
+        deleted = sum(
+            _delete_blobs(self.connect_str, self.container_name, prefix,
+                          lambda blob: blob.name not in keep and blob.last_modified < cutoff)
+            for prefix in (GENERATIONS_PREFIX, CACHE_PREFIX)
+        )
+        if deleted:
+            logging.info(f"🧹 Deleted {deleted} blobs of superseded generations")
+
+
+def _delete_blobs(connect_str, container_name, prefix, predicate):
+    container_client = get_blob_service_client(connect_str).get_container_client(container_name)
+    deleted = 0
+    for blob in container_client.list_blobs(name_starts_with=prefix):
+        if predicate(blob):
+            try:
+                container_client.delete_blob(blob.name)
+                deleted += 1
+            except ResourceNotFoundError:
+                pass
+    return deleted
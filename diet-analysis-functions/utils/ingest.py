@@ -0,0 +1,296 @@
+"""
+Ingest Utility
+
+Incremental ingestion of new recipe batches (daily extraction feeds) without
+reprocessing the whole history.
+
+A full upload of All_Diets.csv (DataCleaningBlobTrigger) saves an ingest
+state in the generation it publishes (INGEST_STATE_BLOB under its prefix):
+
+    - the 64-bit hash of every accepted raw row (dedup fingerprints)
+    - sums and counts of the numeric columns (the imputation means)
+    - the aggregation engine's partial results: count, sum, min, max and M2
+      per group for every group_by, and the reduced rows of the frame
+      sections (utils/aggregation.py)
+    - the cleaned CSV's columns and the batches already ingested
+
+Each batch blob dropped under incoming/ (DeltaIngestBlobTrigger) is cleaned
+on its own with clean_delta() and merged into the partial results, from which
+every cache section is republished. The batch is published as a new
+generation (utils/generations.py) whose cleaned CSV is the parent's parts
+plus one part holding only the batch's rows. The work is proportional to the
+batch; the history is only touched through the state blob (8 bytes per row
+of hashes plus a few KB of statistics). The snapshot and search index
+describe the whole dataset, so a delta generation has neither and readers
+use the cleaned CSV parts until the next full upload, as after a streaming
+clean.
+
+Batches are ingested one at a time under a lease on INGEST_LOCK_BLOB. Nothing
+is visible until the pointer flips, so a batch that fails halfway leaves
+nothing behind; a batch already recorded in the parent's state (a
+redelivery) is skipped. When a full upload publishes while a batch is being
+ingested, the batch fails with PublishConflictError and is retried on top of
+the new generation.
+
+State layout (.npz, no pickles): meta JSON, hashes, and one snapshot-encoded
+frame (utils/snapshot.py) per aggregate table and frame section.
+"""
+
+import hashlib
+import io
+import json
+import logging
+import os
+import time
+import numpy as np
+import pandas as pd
+from azure.core.exceptions import HttpResponseError, ResourceExistsError, ResourceNotFoundError
+from utils.aggregation import AggregateAccumulator
+from utils.cache_helper import CACHE_MANIFEST_BLOB, save_cache_results
+from utils.cleaning import RowHashSet, accept_new_rows, clean_delta
+from utils.generations import Generation, PublishConflictError, download_cleaned
+from utils.snapshot import Snapshot, write_snapshot
+from utils.storage import get_blob_client
+from utils.timing import record, stage
+
+
+CLEANED_BLOB = "All_Diets_cleaned.csv"
+DELTA_BLOB = "delta.csv"
+INCOMING_PREFIX = "incoming/"
+INGEST_STATE_BLOB = "ingest/state.npz"
+INGEST_LOCK_BLOB = "ingest/ingest.lock"
+STATE_VERSION = 1
+INGEST_LEASE_SECONDS = int(os.environ.get("INGEST_LEASE_SECONDS", "60"))
+# How long a batch waits for another batch's ingest before failing (and being retried)
+INGEST_WAIT_SECONDS = float(os.environ.get("INGEST_WAIT_SECONDS", "120"))
+# Ingested batch ids remembered for skipping redelivered batches
+INGEST_HISTORY = 1000
+
+
+def _group_key_to_json(key):
+    return list(key) if isinstance(key, tuple) else key
+
+
+def _group_key_from_json(key):
+    return tuple(key) if isinstance(key, list) else key
+
+
+def _encode_frame(frame):
+    return np.frombuffer(write_snapshot(frame.reset_index(drop=True)), dtype=np.uint8)
+
+
+def _decode_frame(array):
+    frame = Snapshot(array.tobytes()).to_frame()
+    # Snapshot text columns come back as categoricals and numbers as read-only views
+    text_columns = [col for col in frame.columns if isinstance(frame[col].dtype, pd.CategoricalDtype)]
+    return frame.astype({col: object for col in text_columns}).copy()
+
+
+class IngestState:
+    """Everything a delta batch is cleaned and merged against."""
+
+    def __init__(self):
+        self.columns = []
+        self.hashes = RowHashSet()
+        self.sums = {}
+        self.counts = {}
+        self.accumulator = AggregateAccumulator()
+        self.batches = []
+
+    def observe(self, raw_df):
+        """Records the row hashes and column sums of a full raw upload."""
+        accept_new_rows(raw_df, self.hashes, self.sums, self.counts)
+
+    def to_bytes(self):
+        """Serializes the state to .npz bytes for blob storage."""
+        tables, rows = self.accumulator.state()
+        meta = {
+            "version": STATE_VERSION,
+            "columns": self.columns,
+            "sums": self.sums,
+            "counts": self.counts,
+            "batches": self.batches[-INGEST_HISTORY:],
+            "tables": [],
+            "rows": list(rows)
+        }
+        arrays = {"hashes": self.hashes.to_array()}
+        for i, (key, table) in enumerate(tables.items()):
+            flat = table.copy()
+            flat.columns = [f"{column}|{stat}" for column, stat in table.columns]
+            meta["tables"].append({"group_by": _group_key_to_json(key), "index": list(table.index.names)})
+            arrays[f"table_{i}"] = _encode_frame(flat.reset_index())
+        for i, frame in enumerate(rows.values()):
+            arrays[f"rows_{i}"] = _encode_frame(frame)
+
+        buf = io.BytesIO()
+        np.savez_compressed(buf, meta=np.frombuffer(json.dumps(meta).encode("utf-8"), dtype=np.uint8), **arrays)
+        return buf.getvalue()
+
+    @classmethod
+    def from_bytes(cls, data):
+        """
+        Loads a state written by to_bytes. Returns None for other versions or
+        when the registered cache sections changed since it was written.
+        """
+        state = cls()
+        with np.load(io.BytesIO(data), allow_pickle=False) as archive:
+            meta = json.loads(archive["meta"].tobytes().decode("utf-8"))
+            if meta.get("version") != STATE_VERSION:
+                return None
+            tables = {}
+            for i, table_meta in enumerate(meta["tables"]):
+                flat = _decode_frame(archive[f"table_{i}"]).set_index(table_meta["index"])
+                flat.columns = pd.MultiIndex.from_tuples([tuple(col.split("|", 1)) for col in flat.columns])
+                tables[_group_key_from_json(table_meta["group_by"])] = flat
+            rows = {name: _decode_frame(archive[f"rows_{i}"]) for i, name in enumerate(meta["rows"])}
+            if set(tables) != set(state.accumulator.groups) or set(rows) != set(state.accumulator.rows):
+                return None
+            state.hashes = RowHashSet(archive["hashes"])
+
+        state.columns = meta["columns"]
+        state.sums = meta["sums"]
+        state.counts = meta["counts"]
+        state.batches = meta["batches"]
+        state.accumulator.load_state(tables, rows)
+        return state
+
+
+def save_ingest_state(connect_str, container_name, state, blob_name=INGEST_STATE_BLOB):
+    """Uploads the ingest state (blob_name is a generation's, or the legacy one)."""
+    blob_client = get_blob_client(connect_str, container_name, blob_name)
+    with stage("serialize"):
+        data = state.to_bytes()
+    with stage("storage"):
+        blob_client.upload_blob(data, overwrite=True)
+    record(bytes_uploaded=len(data))
+    logging.info(f"✅ Saved ingest state ({len(data)} bytes, {len(state.hashes)} row hashes)")
+
+
+def load_ingest_state(connect_str, container_name, blob_name=INGEST_STATE_BLOB):
+    """Returns the stored IngestState, or None when missing or out of date."""
+    try:
+        with stage("storage"):
+            data = get_blob_client(connect_str, container_name, blob_name).download_blob().readall()
+    except ResourceNotFoundError:
+        return None
+    record(bytes_downloaded=len(data))
+    with stage("parse"):
+        return IngestState.from_bytes(data)
+
+
+def _bootstrap_state(connect_str, container_name, parent):
+    """
+    Builds an ingest state from the parent generation's cleaned CSV, for data
+    published before ingest states existed. Reads the whole history once.
+
+    Dedup after a bootstrap is best-effort: delta rows are hashed raw, but
+    these hashes and sums come from cleaned rows (title-cased diets, imputed
+    values), so a batch row that repeats a row of the history only matches
+    when cleaning left that row unchanged. The next full upload saves a
+    state built from the raw rows.
+    """
+    logging.info(f"ℹ️ No usable ingest state, building one from {', '.join(parent['blobs']['cleaned'])} (best-effort dedup until the next full upload)")
+    blob_data = download_cleaned(connect_str, container_name, parent)
+    df = pd.read_csv(io.BytesIO(blob_data))
+    state = IngestState()
+    state.observe(df)
+    state.columns = list(df.columns)
+    state.accumulator.add(df)
+    return state
+
+
+def _acquire_lease(connect_str, container_name):
+    """Waits for the ingest lease. Raises TimeoutError so the host retries the batch."""
+    blob_client = get_blob_client(connect_str, container_name, INGEST_LOCK_BLOB)
+    try:
+        blob_client.upload_blob(b"", overwrite=False)
+    except ResourceExistsError:
+        pass
+    deadline = time.monotonic() + INGEST_WAIT_SECONDS
+    while True:
+        try:
+            return blob_client.acquire_lease(lease_duration=INGEST_LEASE_SECONDS)
+        except HttpResponseError as e:
+            # 409: another batch holds the lease
+            if e.status_code != 409:
+                raise
+        if time.monotonic() > deadline:
+            raise TimeoutError("Timed out waiting for another batch's ingest")
+        time.sleep(1)
+
+
+def ingest_delta(connect_str, container_name, batch_name, data):
+    """
+    Cleans one batch of new rows and publishes it, with the updated cache
+    sections, as a new generation on top of the current one.
+
+    Returns:
+        dict: Report with rows read, duplicates and invalid rows removed, rows
+        appended, and skipped=True for a batch that was already ingested
+
+    Raises:
+        PublishConflictError: When a full upload was published meanwhile (retry the batch)
+    """
+    # Same name and contents = same batch (a redelivery or a retry)
+    batch_id = f"{batch_name}@{hashlib.sha1(data).hexdigest()[:16]}"
+    lease = _acquire_lease(connect_str, container_name)
+    try:
+        generation = Generation(connect_str, container_name)
+        # Data published before generations: the fixed-name blobs
+        parent = generation.parent or {"blobs": {"cleaned": [CLEANED_BLOB], "ingest_state": INGEST_STATE_BLOB}}
+        state = None
+        if parent["blobs"].get("ingest_state"):
+            state = load_ingest_state(connect_str, container_name, parent["blobs"]["ingest_state"])
+        state = state or _bootstrap_state(connect_str, container_name, parent)
+        if batch_id in state.batches:
+            logging.info(f"ℹ️ {batch_name} was already ingested, skipping")
+            return {"skipped": True}
+
+        with stage("parse"):
+            df = pd.read_csv(io.BytesIO(data))
+        record(rows=len(df), bytes_downloaded=len(data))
+        if state.columns:
+            # Same column order as the history, so row hashes and CSV rows line up
+            df = df.reindex(columns=state.columns)
+        with stage("clean"):
+            cleaned, report = clean_delta(df, state.hashes, state.sums, state.counts)
+        logging.info(f"📈 Delta report for {batch_name}: {report}")
+        lease.renew()
+
+        try:
+            cleaned_parts = list(parent["blobs"]["cleaned"])
+            if len(cleaned):
+                delta_data = cleaned.to_csv(index=False, header=False).encode("utf-8")
+                with stage("storage"):
+                    get_blob_client(connect_str, container_name, generation.blob_name(DELTA_BLOB)).upload_blob(
+                        delta_data, overwrite=True
+                    )
+                record(bytes_uploaded=len(delta_data))
+                cleaned_parts.append(generation.blob_name(DELTA_BLOB))
+                state.accumulator.add(cleaned)
+            save_cache_results(
+                connect_str, container_name, state.accumulator.results(),
+                manifest_blob_name=generation.blob_name(CACHE_MANIFEST_BLOB),
+                previous_manifest_blob_name=parent["blobs"].get("manifest", CACHE_MANIFEST_BLOB)
+            )
+
+            state.batches.append(batch_id)
+            save_ingest_state(connect_str, container_name, state, generation.blob_name(INGEST_STATE_BLOB))
+            lease.renew()
+            # The snapshot and search index describe the dataset before this batch
+            generation.publish({
+                "cleaned": cleaned_parts,
+                "manifest": generation.blob_name(CACHE_MANIFEST_BLOB),
+                "ingest_state": generation.blob_name(INGEST_STATE_BLOB)
+            })
+        except PublishConflictError:
+            logging.warning(f"⚠️ A new generation was published while {batch_name} was ingested, retrying it")
+            generation.discard()
+            raise
+        except Exception:
+            generation.discard()
+            raise
+        return report
+    finally:
+        lease.release()
+
@@ -0,0 +1,118 @@
+"""
+Rankings Utility
+
+Top-k recipes per diet and per diet x cuisine for every macro and ratio
+metric, stored as the "rankings" cache section (one blob per diet) and served
+by DietRankings.
+
+Selection is partial: np.partition finds a group's k-th largest value in
+linear time and only the rows at or above it get sorted, instead of sorting
+the whole frame like data_analysis.py's sort_values(...).groupby(...).head(5).
+Ties keep row order, the same as a stable descending sort.
+
+Because the top k of a dataset only ever comes from the top k of its parts,
+top_k_candidates() lets the streaming cleaner keep just those rows per chunk.
+
+numpy is imported inside the builders, so DietRankings can use the metric
+names and k limit without loading it.
+"""
+
+import os
+
+
+# Longest list kept per group and metric (the k limit of DietRankings)
+RANKINGS_TOP_K = int(os.environ.get("RANKINGS_TOP_K", "10"))
+
+# Query parameter name -> column ranked
+RANKING_METRICS = {
+    "protein": "Protein(g)",
+    "carbs": "Carbs(g)",
+    "fat": "Fat(g)",
+    "protein_to_carbs": "Protein_to_Carbs_ratio",
+    "carbs_to_fat": "Carbs_to_Fat_ratio"
+}
+ENTRY_COLUMNS = ["Recipe_name", "Cuisine_type", "Protein(g)", "Carbs(g)", "Fat(g)"]
+# Columns build_rankings() needs (the ratios are derived columns)
+RANKING_COLUMNS = ["Diet_type"] + ENTRY_COLUMNS + ["Protein_to_Carbs_ratio", "Carbs_to_Fat_ratio"]
+
+
+def top_k_positions(values, k):
+    """
+    Returns the positions of the k largest values (NaN excluded), largest
+    first, ties in position order.
+    """
+    import numpy as np
+
+    candidates = np.flatnonzero(~np.isnan(values))
+    if len(candidates) > k:
+        candidate_values = values[candidates]
+        threshold = np.partition(candidate_values, len(candidates) - k)[len(candidates) - k]
+        candidates = candidates[candidate_values >= threshold]
+    order = np.lexsort((candidates, -values[candidates]))
+    return candidates[order][:k]
+
+
+def _group_tops(frame, k):
+    """Yields (diet, cuisine or None, metric, row positions) for every ranking."""
+    metric_values = {
+        metric: frame[col].to_numpy(dtype="float64")
+        for metric, col in RANKING_METRICS.items()
+    }
+    groups = [
+        ((diet, None), positions)
+        for diet, positions in frame.groupby("Diet_type", observed=True, sort=True).indices.items()
+    ] + list(frame.groupby(["Diet_type", "Cuisine_type"], observed=True, sort=True).indices.items())
+    for (diet, cuisine), positions in groups:
+        for metric, values in metric_values.items():
+            yield diet, cuisine, metric, positions[top_k_positions(values[positions], k)]
+
+
+def top_k_candidates(frame, k=RANKINGS_TOP_K):
+    """
+    Returns the rows of frame that appear in any ranking, in row order.
+    Rankings built from these rows are the same as from the whole frame.
+    """
+    import numpy as np
+
+    keep = np.zeros(len(frame), dtype=bool)
+    for _, _, _, positions in _group_tops(frame, k):
+        keep[positions] = True
+    return frame.iloc[np.flatnonzero(keep)]
+
+
+def _json_value(value):
+    import numpy as np
+    if isinstance(value, (float, np.floating)):
+        if np.isnan(value):
+            return None
+        # Shortest representation for float32 (238.42, not 238.4199981689453)
+        return float(str(value)) if isinstance(value, np.float32) else float(value)
+    return value
+
+
+def build_rankings(frame, k=RANKINGS_TOP_K):
+    """
+    Builds the rankings cache section from a frame with RANKING_COLUMNS.
+
+    Returns:
+        dict: diet -> {"top": {metric: entries}, "cuisines": {cuisine: {metric: entries}}},
+        each entry being the recipe's ENTRY_COLUMNS plus the ranked "value"
+    """
+    columns = {col: frame[col].to_numpy() for col in ENTRY_COLUMNS}
+    metric_values = {metric: frame[col].to_numpy() for metric, col in RANKING_METRICS.items()}
+
+    rankings = {}
+    for diet, cuisine, metric, positions in _group_tops(frame, k):
+        entries = [
+            {
+                **{col: _json_value(columns[col][position]) for col in ENTRY_COLUMNS},
+                "value": _json_value(metric_values[metric][position])
+            }
+            for position in positions
+        ]
+        diet_rankings = rankings.setdefault(diet, {"top": {}, "cuisines": {}})
+        if cuisine is None:
+            diet_rankings["top"][metric] = entries
+        else:
+            diet_rankings["cuisines"].setdefault(cuisine, {})[metric] = entries
+    return rankings
@@ -0,0 +1,442 @@
+"""
+Recompute Utility
+
+Single-flight recompute of the cache sections when they are missing.
+
+Without coordination a cache gap makes every chart and insights request on
+every worker download and aggregate the dataset on its own. Here:
+
+    - within a worker, one thread recomputes and the others wait for it
+      (or, when this worker has served the section before, get the last
+      known good value immediately while the recompute runs in background)
+    - across workers, the recompute runs under a lease on RECOMPUTE_LOCK_BLOB,
+      renewed in the background for as long as it runs; workers that can't
+      get the lease poll until the section can be read
+    - the result is published (save_cache_results, or restore_cache_sections
+      for a generation), so the gap closes for everyone instead of being
+      recomputed again on the next request
+
+A section the manifest lists but whose blob can't be downloaded (deleted,
+or a storage error) counts as missing too: the recompute uploads its blobs
+again. Only a key the manifest doesn't list (e.g. an unknown diet) is
+reported as not found.
+
+pandas and the aggregation engine are only imported when a recompute
+actually runs; the cache-hit path needs neither.
+
+A recompute is tied to the generation the request pinned: flights and the
+last known good copies are kept per generation (last known good copies only
+for the latest generation seen, so older ones don't pile up for the life of
+the worker), and the pointer is passed
+to the recompute (and the thread it may run on) explicitly. A published
+generation's manifest never changes, so its recompute only uploads again
+the section blobs that manifest lists; anything else is served from the
+worker's own results.
+
+The async functions read through get_or_recompute_section_with_etag_async;
+a recompute (CPU-bound, and coordinated with threads) runs on a worker
+thread so the event loop keeps serving other requests.
+"""
+
+import asyncio
+import contextlib
+import contextvars
+import io
+import logging
+import os
+import threading
+import time
+from azure.core.exceptions import HttpResponseError, ResourceExistsError, ResourceNotFoundError
+from utils.cache_helper import (
+    get_cache_section_with_etag,
+    get_cached_results,
+    get_current_generation,
+    get_current_generation_async,
+    get_cache_section_with_etag_async,
+    has_cache_section,
+    restore_cache_sections,
+    save_cache_results
+)
+from utils.storage import download_kwargs, get_blob_client
+from utils.timing import record, stage
+
+
+RECOMPUTE_LOCK_BLOB = "cache-recompute.lock"
+# Lease length (15-60 seconds, as allowed by blob leases)
+RECOMPUTE_LEASE_SECONDS = int(os.environ.get("RECOMPUTE_LEASE_SECONDS", "60"))
+# How long a caller waits for another worker's (or thread's) recompute
+RECOMPUTE_WAIT_SECONDS = float(os.environ.get("RECOMPUTE_WAIT_SECONDS", "30"))
+RECOMPUTE_POLL_SECONDS = float(os.environ.get("RECOMPUTE_POLL_SECONDS", "0.5"))
+
+_lock = threading.Lock()
+_flights = {}
+# (connect_str, container_name) -> (generation, {(section, key): (data, generation)})
+_last_good = {}
+# (connect_str, container_name, generation) -> sections recomputed here that
+# the generation's manifest can't serve (its blobs are immutable, so these stay valid)
+_local_results = {}
+_stats = {
+    "recomputes": 0,
+    "joined": 0,
+    "stale_served": 0,
+    "lease_busy": 0,
+    "published": 0,
+    "local_only": 0,
+}
+
+
+def _count(name):
+    with _lock:
+        _stats[name] += 1
+
+
+class _Flight:
+    """One in-progress recompute that other threads can wait on."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.results = None
+        self.published = False
+        self.error = None
+
+
+def _generation_id(pointer):
+    return pointer["generation"] if pointer is not None else None
+
+
+def _load_cleaned_frame(connect_str, container_name, pointer):
+    """
+    Cleaned dataset columns needed by the cache sections: the generation's
+    snapshot or cleaned CSV parts, else (no generations) the legacy
+    snapshot, cleaned CSV, then raw CSV.
+    """
+    import pandas as pd
+    from utils.aggregation import SOURCE_COLUMNS
+    from utils.cleaning import clean_dataframe
+    from utils.generations import download_cleaned
+    from utils.snapshot import load_snapshot_frame
+
+    if pointer is not None:
+        if "snapshot" in pointer["blobs"]:
+            df = load_snapshot_frame(connect_str, container_name, SOURCE_COLUMNS, pointer["blobs"]["snapshot"])
+            if df is not None:
+                # Plain strings, as in the frame the generation was published from: groups then come
+                # out in the same order, so the sections encode to the blobs its manifest lists
+                return df.astype({col: object for col in df.columns if df[col].dtype == "category"})
+        blob_data = download_cleaned(connect_str, container_name, pointer)
+        record(bytes_downloaded=len(blob_data))
+        with stage("parse"):
+            return pd.read_csv(io.BytesIO(blob_data), usecols=SOURCE_COLUMNS)
+
+    df = load_snapshot_frame(connect_str, container_name, SOURCE_COLUMNS)
+    if df is not None:
+        return df
+    try:
+        with stage("storage"):
+            blob_data = get_blob_client(connect_str, container_name, "All_Diets_cleaned.csv").download_blob(
+                **download_kwargs()
+            ).readall()
+        record(bytes_downloaded=len(blob_data))
+        with stage("parse"):
+            return pd.read_csv(io.BytesIO(blob_data), usecols=SOURCE_COLUMNS)
+    except ResourceNotFoundError:
+        with stage("storage"):
+            blob_data = get_blob_client(connect_str, container_name, "All_Diets.csv").download_blob(**download_kwargs()).readall()
+        record(bytes_downloaded=len(blob_data))
+        with stage("parse"):
+            df = pd.read_csv(io.BytesIO(blob_data))
+        with stage("clean"):
+            return clean_dataframe(df)
+
+
+def _acquire_lease(connect_str, container_name):
+    """Returns a lease on the lock blob, or None if another worker holds it."""
+    blob_client = get_blob_client(connect_str, container_name, RECOMPUTE_LOCK_BLOB)
+    try:
+        blob_client.upload_blob(b"", overwrite=False)
+    except ResourceExistsError:
+        pass
+    except HttpResponseError as e:
+        # Uploading over a leased blob fails the same way
+        if e.status_code != 412:
+            raise
+    try:
+        return blob_client.acquire_lease(lease_duration=RECOMPUTE_LEASE_SECONDS)
+    except HttpResponseError as e:
+        if e.status_code == 409:
+            return None
+        raise
+
+
+@contextlib.contextmanager
+def _renewing(lease):
+    """Renews the lease in the background until the block exits, however long the recompute takes."""
+    stopped = threading.Event()
+
+    def renew():
+        while not stopped.wait(RECOMPUTE_LEASE_SECONDS / 3):
+            try:
+                lease.renew()
+            except HttpResponseError as e:
+                logging.warning(f"⚠️ Could not renew recompute lease: {str(e)}")
+                return
+
+    thread = threading.Thread(target=renew, daemon=True)
+    thread.start()
+    try:
+        yield lease
+    finally:
+        stopped.set()
+        thread.join()
+
+
+def _section_available(connect_str, container_name, section):
+    """True when the section is listed and its blobs can be downloaded."""
+    return get_cache_section_with_etag(connect_str, section, None, container_name)[0] is not None
+
+
+def _key_missing(connect_str, container_name, section, key):
+    """True when the cache lists the section but not this key of it (recomputing won't add it)."""
+    return (key is not None and has_cache_section(connect_str, section, container_name)
+            and not has_cache_section(connect_str, section, container_name, key))
+
+
+def _wait_for_section(connect_str, container_name, section):
+    deadline = time.monotonic() + RECOMPUTE_WAIT_SECONDS
+    while time.monotonic() < deadline:
+        time.sleep(RECOMPUTE_POLL_SECONDS)
+        if _section_available(connect_str, container_name, section):
+            return True
+    return False
+
+
+def _publish(connect_str, container_name, results, pointer):
+    if pointer is None:
+        # Blobs the manifest already lists are uploaded too, in case one of them is what went missing
+        save_cache_results(connect_str, container_name, results, reupload=True)
+        return
+    manifest = get_cached_results(connect_str, container_name, pointer["blobs"]["manifest"])
+    restored = restore_cache_sections(connect_str, container_name, results, manifest or {})
+    logging.info(f"✅ Restored {restored} section blobs of generation {pointer['generation']}")
+
+
+def _recompute(connect_str, container_name, section, flight, pointer):
+    """Runs one recompute of the pointer's generation under the blob lease and publishes the result."""
+    from utils.aggregation import build_cache_results
+
+    lease = _acquire_lease(connect_str, container_name)
+    if lease is None:
+        _count("lease_busy")
+        logging.info("⏳ Cache recompute running on another worker, waiting for it")
+        if _wait_for_section(connect_str, container_name, section):
+            flight.published = True
+            return
+        logging.warning("⚠️ Timed out waiting for another worker's recompute, computing locally")
+        _count("local_only")
+        with stage("recompute"):
+            flight.results = build_cache_results(_load_cleaned_frame(connect_str, container_name, pointer))
+        return
+
+    try:
+        with _renewing(lease):
+            _recompute_leased(connect_str, container_name, section, flight, pointer)
+    finally:
+        try:
+            lease.release()
+        except HttpResponseError as e:
+            # The lease expires by itself
+            logging.warning(f"⚠️ Could not release recompute lease: {str(e)}")
+
+
+def _recompute_leased(connect_str, container_name, section, flight, pointer):
+    """The part of _recompute that runs while this worker holds the lease."""
+    from utils.aggregation import build_cache_results
+
+    # Another worker may have published while we were acquiring the lease
+    if _section_available(connect_str, container_name, section):
+        flight.published = True
+        return
+
+    _count("recomputes")
+    start_time = time.time()
+    with stage("recompute"):
+        flight.results = build_cache_results(_load_cleaned_frame(connect_str, container_name, pointer))
+    _publish(connect_str, container_name, flight.results, pointer)
+    # A generation's manifest may not list the section at all (it only serves locally then)
+    flight.published = pointer is None or _section_available(connect_str, container_name, section)
+    _count("published")
+    logging.info(f"✅ Recomputed and published cache sections in {time.time() - start_time:.3f}s")
+
+
+def _get_last_good(connect_str, container_name, pointer, section, key):
+    generation_id, copies = _last_good.get((connect_str, container_name), (None, {}))
+    return copies.get((section, key)) if generation_id == _generation_id(pointer) else None
+
+
+def _set_last_good(connect_str, container_name, pointer, section, key, value):
+    kept = _last_good.get((connect_str, container_name))
+    if kept is not None and kept[0] == _generation_id(pointer):
+        # The cache-hit path: no lock needed to update the current generation's copies
+        kept[1][(section, key)] = value
+        return
+    with _lock:
+        generation_id, copies = _last_good.get((connect_str, container_name), (None, None))
+        if copies is None or generation_id != _generation_id(pointer):
+            # Another generation: its copies replace the ones kept so far
+            copies = {}
+            _last_good[(connect_str, container_name)] = (_generation_id(pointer), copies)
+        copies[(section, key)] = value
+
+
+def _run_flight(key, flight, section, pointer):
+    connect_str, container_name, _ = key
+    try:
+        _recompute(connect_str, container_name, section, flight, pointer)
+    except Exception as e:
+        flight.error = e
+        logging.error(f"❌ Cache recompute failed: {str(e)}")
+    finally:
+        with _lock:
+            if _flights.get(key) is flight:
+                del _flights[key]
+        flight.done.set()
+
+
+def _join_flight(connect_str, container_name, section, pointer, wait=True):
+    """
+    Starts a recompute of the pointer's generation or joins the one in progress.
+
+    Returns:
+        _Flight: The finished flight, or None when wait is False
+    """
+    key = (connect_str, container_name, _generation_id(pointer))
+    with _lock:
+        flight = _flights.get(key)
+        leader = flight is None
+        if leader:
+            flight = _flights[key] = _Flight()
+        else:
+            _stats["joined"] += 1
+
+    if not wait:
+        if leader:
+            # The thread runs in a copy of this context, so its reads see the same pinned generation
+            threading.Thread(
+                target=contextvars.copy_context().run, args=(_run_flight, key, flight, section, pointer), daemon=True
+            ).start()
+        return None
+
+    if leader:
+        _run_flight(key, flight, section, pointer)
+    elif not flight.done.wait(RECOMPUTE_WAIT_SECONDS):
+        raise TimeoutError("Timed out waiting for the cache recompute")
+    if flight.error is not None:
+        raise flight.error
+    return flight
+
+
+def get_or_recompute_section_with_etag(connect_str, section, key=None, container_name="datasets"):
+    """
+    Same as get_cache_section_with_etag, but when the section is missing from
+    the cache, or can't be downloaded, it is recomputed once (per worker and
+    across workers) and written back.
+
+    Returns:
+        tuple: (data or None, str or None). The data is None when the cache
+        lists the section but not the key, or when the section is still
+        unavailable after the recompute. The generation is None when the
+        data was computed locally and not published.
+    """
+    pointer = get_current_generation(connect_str, container_name)
+    data, generation = get_cache_section_with_etag(connect_str, section, key, container_name)
+    if data is not None:
+        _set_last_good(connect_str, container_name, pointer, section, key, (data, generation))
+        return data, generation
+    if _key_missing(connect_str, container_name, section, key):
+        # The section exists, this key just isn't in it
+        return None, None
+    local = _local_results.get((connect_str, container_name, _generation_id(pointer)))
+    if local is not None and section in local:
+        return _pick(local, section, key), None
+
+    last_good = _get_last_good(connect_str, container_name, pointer, section, key)
+    if last_good is not None:
+        _count("stale_served")
+        _join_flight(connect_str, container_name, section, pointer, wait=False)
+        return last_good
+
+    flight = _join_flight(connect_str, container_name, section, pointer)
+    data, generation = None, None
+    if flight.published:
+        data, generation = get_cache_section_with_etag(connect_str, section, key, container_name)
+    if data is None and flight.results is not None:
+        data = _pick(flight.results, section, key)
+        if pointer is not None:
+            with _lock:
+                # Only the newest generation's local results are kept
+                _local_results.clear()
+                _local_results[(connect_str, container_name, _generation_id(pointer))] = flight.results
+    if data is not None and generation is not None:
+        _set_last_good(connect_str, container_name, pointer, section, key, (data, generation))
+    return data, generation
+
+
+def _pick(results, section, key):
+    data = results.get(section)
+    if key is not None:
+        data = data.get(key) if isinstance(data, dict) else None
+    return data
+
+
+def get_or_recompute_section(connect_str, section, key=None, container_name="datasets"):
+    """
+    Same as get_cache_section, recomputing missing sections once.
+
+    Returns:
+        The section data, or None if it doesn't exist even after recomputing
+    """
+    return get_or_recompute_section_with_etag(connect_str, section, key, container_name)[0]
+
+
+async def get_or_recompute_section_with_etag_async(connect_str, section, key=None, container_name="datasets"):
+    """
+    Same as get_or_recompute_section_with_etag for async functions: cached
+    sections are fetched with the aio client, anything else goes through the
+    sync path on a worker thread.
+
+    Returns:
+        tuple: (data or None, str or None)
+    """
+    pointer = await get_current_generation_async(connect_str, container_name)
+    data, generation = await get_cache_section_with_etag_async(connect_str, section, key, container_name)
+    if data is not None:
+        _set_last_good(connect_str, container_name, pointer, section, key, (data, generation))
+        return data, generation
+    # to_thread runs in a copy of this context, so the pinned generation carries over
+    return await asyncio.to_thread(get_or_recompute_section_with_etag, connect_str, section, key, container_name)
+
+
+async def get_or_recompute_section_async(connect_str, section, key=None, container_name="datasets"):
+    """Same as get_or_recompute_section for async functions."""
+    return (await get_or_recompute_section_with_etag_async(connect_str, section, key, container_name))[0]
+
+
+def get_recompute_stats():
+    """
+    Returns a snapshot of the recompute counters for this worker.
+
+    Returns:
+        dict: recomputes, joined, stale_served, lease_busy, published,
+        local_only and recomputes in progress
+    """
+    with _lock:
+        stats = dict(_stats)
+        stats["in_flight"] = len(_flights)
+    return stats
+
+
+def clear_last_good():
+    """Forgets the last good copy of every section, so a missing section is recomputed again."""
+    with _lock:
+        _last_good.clear()
+        _local_results.clear()
@@ -0,0 +1,244 @@
+"""
+Responses Utility
+
+Shared encoder for the bodies of the HTTP functions.
+
+    - JSON is compact (no indentation, no spaces after separators) unless the
+      request asks for ?pretty=true
+    - text bodies (JSON, NDJSON, SVG) of at least RESPONSE_COMPRESS_MIN_BYTES
+      are compressed with brotli or gzip, whichever the client's
+      Accept-Encoding prefers; brotli only when the brotli package is
+      installed, gzip always
+    - bodies of responses with an ETag only change with the ETag, so they are
+      kept per (ETag, encoding) in a bounded LRU: a hit pays neither
+      serialization nor compression, and can be served with cached_response()
+      before any of the work that builds the body
+    - a body is first compressed at the default level; only when it is served
+      again from the cache is it recompressed once at the best ratio, so a
+      one-off query doesn't pay for brotli q11
+
+A compressed body is a different representation, so it goes out with the
+weak form of the ETag (W/"...", which If-None-Match still matches) and
+Vary: Accept-Encoding.
+"""
+
+import gzip
+import json
+import os
+import threading
+from collections import OrderedDict
+import azure.functions as func
+from utils.timing import record, stage
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+RESPONSE_COMPRESS_MIN_BYTES = int(os.environ.get("RESPONSE_COMPRESS_MIN_BYTES", "1024"))
+RESPONSE_GZIP_LEVEL = int(os.environ.get("RESPONSE_GZIP_LEVEL", "6"))
+RESPONSE_BROTLI_QUALITY = int(os.environ.get("RESPONSE_BROTLI_QUALITY", "5"))
+# Encoded bodies kept for cacheable responses (each encoding is one entry)
+RESPONSE_CACHE_SIZE = int(os.environ.get("RESPONSE_CACHE_SIZE", "256"))
+
+COMPRESSIBLE_MIMETYPES = ("application/json", "application/x-ndjson", "image/svg+xml", "text/")
+# Bodies served again from the cache are recompressed once at these levels
+_CACHED_LEVELS = {"br": 11, "gzip": 9}
+
+_lock = threading.Lock()
+_bodies = OrderedDict()
+_stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+
+def wants_pretty(req):
+    """True when the request asks for indented JSON (?pretty=true)."""
+    return (req.params.get("pretty") or "false").strip().lower() in ("1", "true", "yes")
+
+
+def encode_json(data, pretty=False):
+    """
+    Returns:
+        bytes: data as compact JSON, or indented when pretty
+    """
+    if pretty:
+        return json.dumps(data, indent=2).encode("utf-8")
+    return json.dumps(data, separators=(",", ":")).encode("utf-8")
+
+
+def supported_encodings():
+    """Content codings this worker can produce, most preferred first."""
+    return ("br", "gzip") if brotli is not None else ("gzip",)
+
+
+def negotiate_encoding(req):
+    """
+    Picks the content coding for a response from the request's
+    Accept-Encoding (highest q-value wins, brotli on ties).
+
+    Returns:
+        str: "br", "gzip", or None for an uncompressed body
+    """
+    accepted = {}
+    for item in (req.headers.get("Accept-Encoding") or "").split(","):
+        name, _, params = item.partition(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        q = 1.0
+        for param in params.split(";"):
+            key, _, value = param.partition("=")
+            if key.strip().lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        accepted[name] = q
+
+    best, best_q = None, 0.0
+    for encoding in supported_encodings():
+        q = accepted.get(encoding, accepted.get("*", 0.0))
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+def compress(body, encoding, cached=False):
+    """
+    Returns:
+        bytes: body in the given content coding (None returns it as is), at
+        the best ratio when cached
+    """
+    if encoding is None:
+        return body
+    with stage("compress"):
+        if encoding == "br":
+            quality = _CACHED_LEVELS["br"] if cached else RESPONSE_BROTLI_QUALITY
+            return brotli.compress(body, quality=quality)
+        level = _CACHED_LEVELS["gzip"] if cached else RESPONSE_GZIP_LEVEL
+        # mtime=0 so the same body always compresses to the same bytes
+        return gzip.compress(body, compresslevel=level, mtime=0)
+
+
+def _compressible(mimetype):
+    return mimetype.startswith(COMPRESSIBLE_MIMETYPES)
+
+
+def _cached_body(etag, encoding):
+    with _lock:
+        entry = _bodies.get((etag, encoding))
+        if entry is not None:
+            _bodies.move_to_end((etag, encoding))
+        return entry
+
+
+def _store_body(etag, encoding, body, mimetype, best=True):
+    """best is False for a body compressed at the default level (upgraded on its next hit)."""
+    with _lock:
+        _bodies[(etag, encoding)] = (body, mimetype, best)
+        _bodies.move_to_end((etag, encoding))
+        while len(_bodies) > RESPONSE_CACHE_SIZE:
+            _bodies.popitem(last=False)
+            _stats["evictions"] += 1
+
+
+def _response(body, mimetype, encoding, status_code, headers, etag):
+    headers = dict(headers or {})
+    if _compressible(mimetype):
+        headers["Vary"] = "Accept-Encoding"
+    if encoding is not None:
+        headers["Content-Encoding"] = encoding
+        if etag:
+            headers["ETag"] = "W/" + etag
+    record(bytes_sent=len(body))
+    return func.HttpResponse(body, status_code=status_code, mimetype=mimetype, headers=headers)
+
+
+def cached_response(req, etag, headers=None):
+    """
+    Serves a cacheable response from the encoded bodies kept for its ETag.
+
+    Returns:
+        HttpResponse: The response, or None when the body isn't cached (the
+        caller builds it and passes it to body_response with the ETag)
+    """
+    if not etag:
+        return None
+    encoding = negotiate_encoding(req)
+    entry = _cached_body(etag, encoding)
+    if entry is not None and not entry[2]:
+        # Served again: worth recompressing once at the best ratio
+        identity = _cached_body(etag, None)
+        if identity is not None:
+            entry = (compress(identity[0], encoding, cached=True), entry[1], True)
+            _store_body(etag, encoding, *entry)
+    elif entry is None and encoding is not None:
+        # Only the uncompressed body is cached: compress it for this encoding
+        identity = _cached_body(etag, None)
+        if identity is not None and _compressible(identity[1]) and len(identity[0]) >= RESPONSE_COMPRESS_MIN_BYTES:
+            entry = (compress(identity[0], encoding), identity[1], False)
+            _store_body(etag, encoding, *entry)
+        elif identity is not None:
+            encoding, entry = None, identity
+    with _lock:
+        _stats["hits" if entry is not None else "misses"] += 1
+    if entry is None:
+        return None
+    record(cache_hits=1)
+    return _response(entry[0], entry[1], encoding, 200, headers, etag)
+
+
+def body_response(req, body, mimetype, status_code=200, headers=None, etag=None):
+    """
+    Builds the response for a body, compressed when the client accepts it and
+    the body is worth compressing (at the default level). With an ETag the
+    encoded bodies are kept for cached_response.
+
+    Returns:
+        HttpResponse: The response
+    """
+    encoding = None
+    if _compressible(mimetype) and len(body) >= RESPONSE_COMPRESS_MIN_BYTES:
+        encoding = negotiate_encoding(req)
+    cacheable = bool(etag) and status_code == 200
+    if cacheable and _compressible(mimetype):
+        _store_body(etag, None, body, mimetype)
+    encoded = compress(body, encoding)
+    if cacheable and encoding is not None:
+        _store_body(etag, encoding, encoded, mimetype, best=False)
+    record(bytes_uncompressed=len(body))
+    return _response(encoded, mimetype, encoding, status_code, headers, etag)
+
+
+def json_response(req, data, status_code=200, headers=None, etag=None):
+    """
+    Serializes data (compact, or indented for ?pretty=true) and builds the
+    response with body_response.
+
+    Returns:
+        HttpResponse: The response
+    """
+    with stage("serialize"):
+        body = encode_json(data, wants_pretty(req))
+    return body_response(req, body, "application/json", status_code, headers, etag)
+
+
+def get_response_cache_stats():
+    """
+    Returns a snapshot of the encoded body cache counters for this worker.
+
+    Returns:
+        dict: hits, misses, evictions and cached body count
+    """
+    with _lock:
+        stats = dict(_stats)
+        stats["entries"] = len(_bodies)
+    return stats
+
+
+def clear_response_cache():
+    """Drops every cached body and resets the counters."""
+    with _lock:
+        _bodies.clear()
+        for name in _stats:
+            _stats[name] = 0
@@ -0,0 +1,231 @@
+"""
+Search Index Utility
+
+Inverted token index for DietSearch keyword search.
+
+Recipe_name, Cuisine_type and Diet_type are lower-cased and split into word
+tokens; every token maps to the sorted row positions it occurs in (a posting
+list). A keyword made only of word characters must sit inside a single token,
+so its result is the union of the posting lists of the tokens containing it.
+Keywords spanning several words intersect the posting lists of each word piece
+and then confirm the candidates against the actual text.
+
+DataCleaningBlobTrigger builds the index once and stores it next to the
+cleaned CSV; DietSearch loads it together with the dataset.
+"""
+
+import io
+import json
+import re
+import numpy as np
+import pandas as pd
+from pandas.api.types import is_bool_dtype, is_numeric_dtype
+
+
+INDEX_COLUMNS = ["Recipe_name", "Cuisine_type", "Diet_type"]
+SEARCH_INDEX_BLOB = "All_Diets_cleaned_index.npz"
+INDEX_VERSION = 1
+
+_WORD = re.compile(r"\w+")
+# Keywords containing these are regular expressions, not plain text
+_REGEX_CHARS = set(".^$*+?{}[]\\|()")
+# Characters that can appear when a float is converted to str ("1e-05", "nan", "inf")
+_NUMERIC_CHARS = set("0123456789.-+einaf")
+
+
+class SearchIndex:
+    """Token vocabulary plus CSR posting lists (offsets into one row array)."""
+
+    def __init__(self, tokens, offsets, rows, n_rows, source_etag=None):
+        self.tokens = tokens
+        self.offsets = offsets
+        self.rows = rows
+        self.n_rows = n_rows
+        self.source_etag = source_etag
+
+    def _postings(self, token_ids):
+        """Union of the posting lists of the given tokens (sorted positions)."""
+        if len(token_ids) == 0:
+            return np.empty(0, dtype=np.int32)
+        if len(token_ids) == 1:
+            token_id = token_ids[0]
+            return self.rows[self.offsets[token_id]:self.offsets[token_id + 1]]
+        return np.unique(np.concatenate([
+            self.rows[self.offsets[token_id]:self.offsets[token_id + 1]]
+            for token_id in token_ids
+        ]))
+
+    def _matching_tokens(self, piece, prefix):
+        if len(self.tokens) == 0:
+            return np.empty(0, dtype=np.intp)
+        if prefix:
+            return np.flatnonzero(np.char.startswith(self.tokens, piece))
+        return np.flatnonzero(np.char.find(self.tokens, piece) >= 0)
+
+    def lookup(self, keyword, prefix=False):
+        """
+        Finds rows whose indexed text contains the keyword.
+
+        Returns:
+            tuple: (rows, exact). rows is None when the keyword has no word
+            characters and the index can't narrow it down; exact is False when
+            the rows are only candidates that still need to be confirmed.
+        """
+        keyword = keyword.lower()
+        pieces = _WORD.findall(keyword)
+        if not pieces:
+            return None, False
+
+        result = None
+        for piece in pieces:
+            rows = self._postings(self._matching_tokens(piece, prefix))
+            result = rows if result is None else np.intersect1d(result, rows, assume_unique=True)
+            if len(result) == 0:
+                break
+
+        # A keyword made of a single run of word characters can only match
+        # inside one token, so the union above is already the exact answer
+        exact = prefix or (len(pieces) == 1 and pieces[0] == keyword)
+        return result, exact
+
+    def to_bytes(self):
+        """Serializes the index to .npz bytes for blob storage."""
+        meta = {
+            "version": INDEX_VERSION,
+            "n_rows": self.n_rows,
+            "source_etag": self.source_etag,
+            "columns": INDEX_COLUMNS
+        }
+        buf = io.BytesIO()
+        np.savez_compressed(
+            buf,
+            meta=np.frombuffer(json.dumps(meta).encode("utf-8"), dtype=np.uint8),
+            tokens=np.frombuffer("\n".join(self.tokens.tolist()).encode("utf-8"), dtype=np.uint8),
+            offsets=self.offsets,
+            rows=self.rows
+        )
+        return buf.getvalue()
+
+    @classmethod
+    def from_bytes(cls, data):
+        """Loads an index written by to_bytes. Returns None for other versions."""
+        with np.load(io.BytesIO(data), allow_pickle=False) as archive:
+            meta = json.loads(archive["meta"].tobytes().decode("utf-8"))
+            if meta.get("version") != INDEX_VERSION or meta.get("columns") != INDEX_COLUMNS:
+                return None
+            token_text = archive["tokens"].tobytes().decode("utf-8")
+            tokens = np.array(token_text.split("\n") if token_text else [], dtype=str)
+            return cls(tokens, archive["offsets"], archive["rows"], meta["n_rows"], meta.get("source_etag"))
+
+
+def _column_tokens(series):
+    """Returns (row, token) pairs for one column, tokenizing each distinct value once."""
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        value_ids = series.cat.codes.to_numpy().astype(np.int64)
+        values = pd.Index(series.cat.categories.astype(str).tolist() + ["nan"])
+        value_ids[value_ids < 0] = len(values) - 1
+    else:
+        value_ids, values = pd.factorize(series.astype(str))
+
+    value_tokens = (
+        pd.Series(values.str.lower().str.findall(_WORD.pattern), name="token")
+        .explode()
+        .dropna()
+    )
+    value_tokens = pd.DataFrame({"value_id": value_tokens.index, "token": value_tokens.to_numpy()})
+    row_values = pd.DataFrame({"row": np.arange(len(series), dtype=np.int32), "value_id": value_ids})
+    return row_values.merge(value_tokens, on="value_id")[["row", "token"]]
+
+
+def build_search_index(df, source_etag=None):
+    """
+    Builds the inverted token index over the text columns of a dataset.
+
+    Row numbers are positions in df, which must match the order of the
+    stored CSV.
+
+    Returns:
+        SearchIndex: The built index
+    """
+    pairs = pd.concat(
+        [_column_tokens(df[col]) for col in INDEX_COLUMNS if col in df.columns],
+        ignore_index=True
+    ).drop_duplicates()
+
+    token_ids, tokens = pd.factorize(pairs["token"], sort=True)
+    rows = pairs["row"].to_numpy()
+    order = np.lexsort((rows, token_ids))
+    counts = np.bincount(token_ids, minlength=len(tokens))
+    offsets = np.zeros(len(tokens) + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+
+    return SearchIndex(
+        np.array(tokens.tolist(), dtype=str),
+        offsets,
+        rows[order].astype(np.int32),
+        len(df),
+        source_etag
+    )
+
+
+def _contains(series, keyword):
+    """Plain-text, case-insensitive contains over one column (as strings)."""
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        # Test each category once, then map the result through the codes
+        categories = pd.Series(series.cat.categories.astype(str).tolist() + ["nan"])
+        hits = categories.str.contains(keyword, case=False, regex=False).to_numpy()
+        codes = series.cat.codes.to_numpy()
+        return hits[np.where(codes < 0, len(categories) - 1, codes)]
+    return series.astype(str).str.contains(keyword, case=False, regex=False).to_numpy()
+
+
+def _scan_rows(df, keyword):
+    """Column-at-a-time regular expression scan (used for regex keywords)."""
+    mask = np.zeros(len(df), dtype=bool)
+    for col in df.columns:
+        mask |= df[col].astype(str).str.contains(keyword, case=False, na=False).to_numpy()
+    return np.flatnonzero(mask)
+
+
+def find_keyword_rows(df, keyword, index=None, prefix=False):
+    """
+    Returns the sorted row positions of df matching a DietSearch keyword.
+
+    In the default substring mode the result is the same as converting every
+    column to str and running str.contains(keyword, case=False) on each cell.
+    With prefix=True only the indexed text columns are searched and each word
+    of the keyword must start a word in them.
+    """
+    if index is None or index.n_rows != len(df) or (not prefix and _REGEX_CHARS & set(keyword)):
+        return _scan_rows(df, keyword)
+
+    rows, exact = index.lookup(keyword, prefix)
+    if prefix:
+        return rows
+
+    text_columns = [col for col in INDEX_COLUMNS if col in df.columns]
+    if not exact:
+        # Confirm the candidates against the actual text
+        candidates = df.iloc[rows] if rows is not None else df
+        confirmed = np.zeros(len(candidates), dtype=bool)
+        for col in text_columns:
+            confirmed |= _contains(candidates[col], keyword)
+        rows = (rows if rows is not None else np.arange(len(df)))[confirmed]
+
+    # Columns outside the index: numbers only need a look when the keyword
+    # could appear in their string form
+    mask = None
+    lowered = keyword.lower()
+    for col in df.columns:
+        if col in text_columns:
+            continue
+        series = df[col]
+        if is_numeric_dtype(series.dtype) and not is_bool_dtype(series.dtype):
+            if not set(lowered) <= _NUMERIC_CHARS:
+                continue
+        hits = _contains(series, keyword)
+        mask = hits if mask is None else mask | hits
+
+    if mask is None or not mask.any():
+        return rows
+    return np.union1d(rows, np.flatnonzero(mask))
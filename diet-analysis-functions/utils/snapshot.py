@@ -0,0 +1,326 @@
+"""
+Snapshot Utility
+
+Compact binary, columnar snapshot of the cleaned dataset, so read paths don't
+have to parse CSV text.
+
+DataCleaningBlobTrigger publishes All_Diets_cleaned.snapshot next to
+All_Diets_cleaned.csv. Layout:
+
+    b"DIETSNP1" | uint64 header length | JSON header | column buffers
+
+Every buffer starts on a 64-byte boundary. Numeric columns are stored as raw
+little-endian arrays. String columns are dictionary-encoded: int8/16/32 codes
+(-1 for missing) plus a dictionary buffer of UTF-8 strings and their offsets.
+The header lists each column's dtype, buffer offsets and statistics (min, max,
+null count, distinct values), so readers can load only the columns they need.
+
+Readers keep a local copy of the blob per ETag (SNAPSHOT_CACHE_DIR) and
+memory-map it, so numeric columns are used straight from the page cache.
+The current and previous generation's snapshots stay open, since requests
+pinned to either can run side by side during the GC grace window; other
+local copies are deleted once they are older than GC_GRACE_SECONDS.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import struct
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+from pandas.api.types import is_bool_dtype, is_numeric_dtype
+from azure.core import MatchConditions
+from azure.core.exceptions import ResourceNotFoundError
+from utils.cache_helper import GC_GRACE_SECONDS
+from utils.storage import download_kwargs, get_blob_client
+from utils.timing import record, stage
+
+
+SNAPSHOT_BLOB = "All_Diets_cleaned.snapshot"
+SNAPSHOT_CACHE_DIR = os.environ.get(
+    "SNAPSHOT_CACHE_DIR", os.path.join(tempfile.gettempdir(), "diet-snapshots")
+)
+
+MAGIC = b"DIETSNP1"
+ALIGNMENT = 64
+FORMAT_VERSION = 1
+# Open snapshots kept per worker: the current generation's and the previous one
+SNAPSHOT_KEEP = 2
+
+_lock = threading.Lock()
+_open_snapshots = OrderedDict()
+
+
+def _code_dtype(n_values):
+    for dtype in (np.int8, np.int16, np.int32):
+        if n_values < np.iinfo(dtype).max:
+            return np.dtype(dtype)
+    return np.dtype(np.int64)
+
+
+def _json_scalar(value):
+    if value is None or pd.isna(value):
+        return None
+    return value.item() if hasattr(value, "item") else value
+
+
+def write_snapshot(df, source_etag=None):
+    """
+    Encodes a DataFrame as snapshot bytes.
+
+    Returns:
+        bytes: The snapshot file contents
+    """
+    buffers = []
+    columns = []
+    offset = 0
+
+    def add_buffer(array):
+        nonlocal offset
+        data = np.ascontiguousarray(array).tobytes()
+        start = offset
+        buffers.append(data)
+        offset += len(data)
+        padding = -offset % ALIGNMENT
+        if padding:
+            buffers.append(b"\0" * padding)
+            offset += padding
+        return {"offset": start, "nbytes": len(data)}
+
+    for name in df.columns:
+        series = df[name]
+        null_count = int(series.isna().sum())
+
+        if is_numeric_dtype(series.dtype) and not is_bool_dtype(series.dtype):
+            values = series.to_numpy()
+            dtype = values.dtype.newbyteorder("<")
+            columns.append({
+                "name": name,
+                "kind": "numeric",
+                "dtype": dtype.str,
+                "data": add_buffer(values.astype(dtype, copy=False)),
+                "stats": {
+                    "min": _json_scalar(series.min()),
+                    "max": _json_scalar(series.max()),
+                    "null_count": null_count
+                }
+            })
+            continue
+
+        # Dictionary encoding for everything else (strings, categories, bools)
+        codes, uniques = pd.factorize(series.astype(object).where(series.notna(), None))
+        dictionary = [str(value) for value in uniques]
+        encoded = [value.encode("utf-8") for value in dictionary]
+        offsets = np.zeros(len(encoded) + 1, dtype="<i8")
+        np.cumsum([len(value) for value in encoded], out=offsets[1:])
+        code_dtype = _code_dtype(len(dictionary)).newbyteorder("<")
+        columns.append({
+            "name": name,
+            "kind": "dictionary",
+            "dtype": code_dtype.str,
+            "data": add_buffer(codes.astype(code_dtype)),
+            "dictionary": add_buffer(np.frombuffer(b"".join(encoded), dtype=np.uint8)),
+            "dictionary_offsets": add_buffer(offsets),
+            "stats": {
+                "min": min(dictionary) if dictionary else None,
+                "max": max(dictionary) if dictionary else None,
+                "null_count": null_count,
+                "distinct": len(dictionary)
+            }
+        })
+
+    header = json.dumps({
+        "version": FORMAT_VERSION,
+        "n_rows": len(df),
+        "source_etag": source_etag,
+        "columns": columns
+    }).encode("utf-8")
+    prefix = MAGIC + struct.pack("<Q", len(header)) + header
+    prefix += b"\0" * (-len(prefix) % ALIGNMENT)
+    return prefix + b"".join(buffers)
+
+
+class Snapshot:
+    """Read access to a snapshot held in bytes or a memory-mapped file."""
+
+    def __init__(self, buffer):
+        self._buffer = np.frombuffer(buffer, dtype=np.uint8) if isinstance(buffer, (bytes, bytearray)) else buffer
+        if self._buffer[:len(MAGIC)].tobytes() != MAGIC:
+            raise ValueError("Not a diet dataset snapshot")
+        header_length = struct.unpack("<Q", self._buffer[len(MAGIC):len(MAGIC) + 8].tobytes())[0]
+        header_end = len(MAGIC) + 8 + header_length
+        self.header = json.loads(self._buffer[len(MAGIC) + 8:header_end].tobytes().decode("utf-8"))
+        if self.header.get("version") != FORMAT_VERSION:
+            raise ValueError(f"Unsupported snapshot version {self.header.get('version')}")
+        self._data_start = header_end + (-header_end % ALIGNMENT)
+        self._columns = {column["name"]: column for column in self.header["columns"]}
+        # ETag of the blob this snapshot was downloaded from (set by get_snapshot)
+        self.etag = None
+
+    @classmethod
+    def open(cls, path):
+        """Memory-maps a snapshot file."""
+        return cls(np.memmap(path, dtype=np.uint8, mode="r"))
+
+    @property
+    def n_rows(self):
+        return self.header["n_rows"]
+
+    @property
+    def source_etag(self):
+        return self.header.get("source_etag")
+
+    @property
+    def columns(self):
+        return list(self._columns)
+
+    def stats(self, name):
+        """Per-column statistics recorded when the snapshot was written."""
+        return self._columns[name]["stats"]
+
+    def _array(self, ref, dtype):
+        start = self._data_start + ref["offset"]
+        return self._buffer[start:start + ref["nbytes"]].view(dtype)
+
+    def column(self, name):
+        """
+        Returns one column: a read-only numpy array (numeric columns, no copy)
+        or a pandas Categorical (dictionary-encoded columns).
+        """
+        meta = self._columns[name]
+        codes = self._array(meta["data"], np.dtype(meta["dtype"]))
+        if meta["kind"] == "numeric":
+            return codes
+        text = self._array(meta["dictionary"], np.uint8).tobytes()
+        offsets = self._array(meta["dictionary_offsets"], np.dtype("<i8"))
+        dictionary = [text[offsets[i]:offsets[i + 1]].decode("utf-8") for i in range(len(offsets) - 1)]
+        return pd.Categorical.from_codes(codes, categories=dictionary, validate=False)
+
+    def to_frame(self, columns=None):
+        """Builds a DataFrame with the requested columns (all by default)."""
+        names = columns or self.columns
+        return pd.DataFrame({name: self.column(name) for name in names}, copy=False)
+
+
+def _local_path(etag):
+    return os.path.join(SNAPSHOT_CACHE_DIR, hashlib.sha1(etag.encode("utf-8")).hexdigest() + ".snapshot")
+
+
+def get_snapshot(connect_str, container_name="datasets", blob_name=SNAPSHOT_BLOB):
+    """
+    Returns the snapshot memory-mapped from a local copy, downloading it once
+    per ETag. blob_name is a generation's snapshot, or the legacy one.
+
+    Returns:
+        Snapshot: The snapshot, or None if it hasn't been published
+    """
+    blob_client = get_blob_client(connect_str, container_name, blob_name)
+    try:
+        etag = blob_client.get_blob_properties().etag
+    except ResourceNotFoundError:
+        return None
+
+    snapshot = _open_snapshots.get(etag)
+    if snapshot is not None:
+        return snapshot
+
+    with _lock:
+        snapshot = _open_snapshots.get(etag)
+        if snapshot is not None:
+            _open_snapshots.move_to_end(etag)
+            return snapshot
+
+        path = _local_path(etag)
+        snapshot = _open_local(blob_client, etag, path)
+        snapshot.etag = etag
+        # Dropping older snapshots releases their mappings once the datasets
+        # built on them are gone
+        _open_snapshots[etag] = snapshot
+        while len(_open_snapshots) > SNAPSHOT_KEEP:
+            _open_snapshots.popitem(last=False)
+        _remove_superseded({_local_path(kept) for kept in _open_snapshots})
+        return snapshot
+
+
+def _open_local(blob_client, etag, path):
+    """
+    Memory-maps the local copy at path, downloading it first when missing.
+    Another process sharing SNAPSHOT_CACHE_DIR may delete a copy between the
+    download and the open, so the download is tried twice.
+    """
+    try:
+        snapshot = Snapshot.open(path)
+        # Copies in use stay newer than the removal cutoff
+        os.utime(path)
+        return snapshot
+    except FileNotFoundError:
+        pass
+    for attempt in range(2):
+        _download(blob_client, etag, path)
+        try:
+            return Snapshot.open(path)
+        except FileNotFoundError:
+            if attempt:
+                raise
+            logging.warning(f"⚠️ Snapshot copy {path} removed before it was opened, downloading again")
+
+
+def _download(blob_client, etag, path):
+    """Downloads the blob at etag to path (written to a temp name, then renamed)."""
+    os.makedirs(SNAPSHOT_CACHE_DIR, exist_ok=True)
+    partial = f"{path}.{os.getpid()}.part"
+    with stage("storage"), open(partial, "wb") as f:
+        size = blob_client.download_blob(
+            etag=etag, match_condition=MatchConditions.IfNotModified, **download_kwargs()
+        ).readinto(f)
+    record(bytes_downloaded=size)
+    os.replace(partial, path)
+    logging.info(f"✅ Downloaded dataset snapshot to {path}")
+
+
+def _remove_superseded(kept):
+    """
+    Deletes the local copies not in kept that haven't been opened for
+    GC_GRACE_SECONDS. A file still mapped somewhere stays readable until
+    unmapped (where the OS refuses, it is left for the next call).
+    """
+    try:
+        names = os.listdir(SNAPSHOT_CACHE_DIR)
+    except OSError:
+        return
+    cutoff = time.time() - GC_GRACE_SECONDS
+    for name in names:
+        other = os.path.join(SNAPSHOT_CACHE_DIR, name)
+        if name.endswith(".snapshot") and other not in kept:
+            try:
+                if os.path.getmtime(other) >= cutoff:
+                    continue
+                os.remove(other)
+            except OSError:
+                continue
+            logging.info(f"🧹 Removed superseded snapshot copy {other}")
+
+
+def load_snapshot_frame(connect_str, container_name="datasets", columns=None, blob_name=SNAPSHOT_BLOB):
+    """
+    Loads the requested columns of the published snapshot.
+
+    Returns:
+        DataFrame: The columns, or None if there is no usable snapshot
+    """
+    try:
+        snapshot = get_snapshot(connect_str, container_name, blob_name)
+        if snapshot is None:
+            return None
+        with stage("parse"):
+            df = snapshot.to_frame(columns)
+        record(rows_loaded=len(df))
+        return df
+    except Exception as e:
+        logging.warning(f"⚠️ Snapshot not available: {str(e)}")
+        return None
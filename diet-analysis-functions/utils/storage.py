@@ -0,0 +1,211 @@
+"""
+Storage Client Utility
+
+Shared, module-level BlobServiceClient registry for every function in the app.
+Clients are created once per connection string and reuse one pooled HTTP
+session, so keep-alive connections survive across invocations instead of
+paying connection setup and TLS on every request.
+
+The async functions use azure.storage.blob.aio clients from the same kind of
+registry, one per event loop (an aiohttp session belongs to its loop).
+
+Blobs larger than STORAGE_RANGE_SIZE_MB are downloaded as concurrent range
+GETs, DOWNLOAD_CONCURRENCY at a time, instead of one stream on one
+connection: pass download_kwargs() to download_blob().
+
+Pool size, retry policy and timeouts are read from app settings:
+    STORAGE_POOL_SIZE          max keep-alive connections per host (default 10)
+    STORAGE_RETRY_TOTAL        retries per storage operation (default 3)
+    STORAGE_RETRY_BACKOFF      initial retry backoff in seconds (default 1)
+    STORAGE_CONNECT_TIMEOUT    connect timeout in seconds (default 10)
+    STORAGE_READ_TIMEOUT       read timeout in seconds (default 60)
+    STORAGE_RANGE_SIZE_MB      first GET and range size for downloads (default 4)
+    DOWNLOAD_CONCURRENCY       parallel range GETs per download (default 4)
+"""
+
+import os
+import threading
+import weakref
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from azure.storage.blob import BlobServiceClient, ExponentialRetry
+
+
+POOL_SIZE = int(os.environ.get("STORAGE_POOL_SIZE", "10"))
+RETRY_TOTAL = int(os.environ.get("STORAGE_RETRY_TOTAL", "3"))
+RETRY_BACKOFF = float(os.environ.get("STORAGE_RETRY_BACKOFF", "1"))
+CONNECT_TIMEOUT = float(os.environ.get("STORAGE_CONNECT_TIMEOUT", "10"))
+READ_TIMEOUT = float(os.environ.get("STORAGE_READ_TIMEOUT", "60"))
+RANGE_SIZE_BYTES = int(float(os.environ.get("STORAGE_RANGE_SIZE_MB", "4")) * 1024 * 1024)
+DOWNLOAD_CONCURRENCY = int(os.environ.get("DOWNLOAD_CONCURRENCY", "4"))
+
+_lock = threading.Lock()
+_clients = {}
+# Event loop -> {connection string: async BlobServiceClient}
+_async_clients = weakref.WeakKeyDictionary()
+_session = None
+_stats = {
+    "clients_created": 0,
+    "connections_opened": 0,
+    "requests_sent": 0,
+    "bytes_downloaded": 0,
+    "bytes_uploaded": 0,
+}
+
+
+def _count(name, amount=1):
+    with _lock:
+        _stats[name] += amount
+
+
+class _CountingHTTPConnectionPool(HTTPConnectionPool):
+    def _new_conn(self):
+        _count("connections_opened")
+        return super()._new_conn()
+
+
+class _CountingHTTPSConnectionPool(HTTPSConnectionPool):
+    def _new_conn(self):
+        _count("connections_opened")
+        return super()._new_conn()
+
+
+class _CountingAdapter(HTTPAdapter):
+    """HTTPAdapter that records connections, requests and payload bytes."""
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": _CountingHTTPConnectionPool,
+            "https": _CountingHTTPSConnectionPool,
+        }
+
+    def send(self, request, *args, **kwargs):
+        _count("requests_sent")
+        if request.body is not None and hasattr(request.body, "__len__"):
+            _count("bytes_uploaded", len(request.body))
+        response = super().send(request, *args, **kwargs)
+        if request.method == "GET":
+            _count("bytes_downloaded", int(response.headers.get("Content-Length") or 0))
+        return response
+
+
+def _get_session():
+    """Returns the process-wide pooled HTTP session (created on first use)."""
+    global _session
+    if _session is None:
+        session = requests.Session()
+        adapter = _CountingAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        _session = session
+    return _session
+
+
+def get_blob_service_client(connect_str):
+    """
+    Returns the shared BlobServiceClient for a connection string.
+
+    Returns:
+        BlobServiceClient: Client bound to the pooled HTTP session
+    """
+    client = _clients.get(connect_str)
+    if client is not None:
+        return client
+
+    with _lock:
+        client = _clients.get(connect_str)
+        if client is None:
+            client = BlobServiceClient.from_connection_string(
+                connect_str,
+                session=_get_session(),
+                session_owner=False,
+                retry_policy=ExponentialRetry(
+                    initial_backoff=RETRY_BACKOFF,
+                    increment_base=2,
+                    retry_total=RETRY_TOTAL
+                ),
+                connection_timeout=CONNECT_TIMEOUT,
+                read_timeout=READ_TIMEOUT,
+                max_single_get_size=RANGE_SIZE_BYTES,
+                max_chunk_get_size=RANGE_SIZE_BYTES
+            )
+            _clients[connect_str] = client
+            _stats["clients_created"] += 1
+    return client
+
+
+def get_blob_client(connect_str, container_name, blob_name):
+    """Shortcut for get_blob_service_client(...).get_blob_client(...)."""
+    return get_blob_service_client(connect_str).get_blob_client(
+        container=container_name,
+        blob=blob_name
+    )
+
+
+def get_async_blob_service_client(connect_str):
+    """
+    Returns the shared async BlobServiceClient for a connection string on the
+    running event loop. Must be called from a coroutine.
+
+    Returns:
+        azure.storage.blob.aio.BlobServiceClient: Client with its own aiohttp session
+    """
+    import asyncio
+    # Imported on first use: only the async functions need aiohttp
+    from azure.storage.blob.aio import BlobServiceClient as AsyncBlobServiceClient
+    from azure.storage.blob.aio import ExponentialRetry as AsyncExponentialRetry
+
+    loop = asyncio.get_running_loop()
+    with _lock:
+        loop_clients = _async_clients.setdefault(loop, {})
+        client = loop_clients.get(connect_str)
+        if client is None:
+            client = AsyncBlobServiceClient.from_connection_string(
+                connect_str,
+                retry_policy=AsyncExponentialRetry(
+                    initial_backoff=RETRY_BACKOFF,
+                    increment_base=2,
+                    retry_total=RETRY_TOTAL
+                ),
+                connection_timeout=CONNECT_TIMEOUT,
+                read_timeout=READ_TIMEOUT,
+                max_single_get_size=RANGE_SIZE_BYTES,
+                max_chunk_get_size=RANGE_SIZE_BYTES
+            )
+            loop_clients[connect_str] = client
+            _stats["clients_created"] += 1
+    return client
+
+
+def get_async_blob_client(connect_str, container_name, blob_name):
+    """Shortcut for get_async_blob_service_client(...).get_blob_client(...)."""
+    return get_async_blob_service_client(connect_str).get_blob_client(
+        container=container_name,
+        blob=blob_name
+    )
+
+
+def download_kwargs():
+    """Keyword arguments for download_blob() that fetch large blobs as parallel ranges."""
+    return {"max_concurrency": DOWNLOAD_CONCURRENCY}
+
+
+def get_storage_stats():
+    """
+    Returns a snapshot of the storage counters for this worker.
+
+    Returns:
+        dict: clients_created, connections_opened, requests_sent,
+        bytes_downloaded and bytes_uploaded
+    """
+    with _lock:
+        return dict(_stats)
+
+
+def reset_storage_stats():
+    """Resets the storage counters (the shared clients are kept)."""
+    with _lock:
+        for name in _stats:
+            _stats[name] = 0
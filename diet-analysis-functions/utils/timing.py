@@ -0,0 +1,199 @@
+"""
+Timing Utility
+
+Per-stage timing of every function invocation, reported as a Server-Timing
+header on HTTP responses and as one structured log record per invocation.
+
+    @timed("DietBarChart")
+    def main(req): ...          # or async def main(req)
+
+    with stage("render"):
+        image = render(...)
+    record(rows=len(df), bytes_downloaded=len(data))
+
+The invocation's Timing lives in a context variable, so utils code marks its
+own stages (storage, parse, groupby, ...) and counters without the timer
+being passed around. Outside an invocation, and on threads the invocation
+didn't start (background revalidation, render pool), stage() and record()
+do nothing. A stage costs two perf_counter() calls and a dict update, so
+timing stays on in production; TIMING_ENABLED=false turns it off.
+
+Stage names used across the app:
+    storage     blob downloads and uploads
+    parse       CSV, JSON and snapshot decoding
+    clean       cleaning rules (dedup, validation, imputation)
+    groupby     cache section aggregation
+    recompute   rebuilding missing cache sections
+    search      filtering and paging the resident dataset
+    render      matplotlib rendering (time spent waiting for the image)
+    serialize   building the response body or an encoded blob
+    compress    gzip/brotli of a response body (utils/responses.py)
+
+Counters: bytes_downloaded, bytes_uploaded, bytes_sent and
+bytes_uncompressed (response body on the wire and before compression), rows
+(rows processed or matched), rows_loaded (rows read into memory), cache_hits
+and cache_misses (in-memory caches: documents, section blobs, the dataset,
+chart images, encoded response bodies).
+"""
+
+import contextvars
+import functools
+import inspect
+import json
+import logging
+import os
+import time
+
+
+TIMING_ENABLED = os.environ.get("TIMING_ENABLED", "true").lower() != "false"
+
+_current = contextvars.ContextVar("timing", default=None)
+
+
+class Timing:
+    """Stage durations and counters of one invocation."""
+
+    __slots__ = ("function", "start", "stages", "metrics")
+
+    def __init__(self, function):
+        self.function = function
+        self.start = time.perf_counter()
+        # Stage name -> seconds, summed when a stage runs more than once
+        self.stages = {}
+        self.metrics = {}
+
+    def add_stage(self, name, seconds):
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def add(self, **metrics):
+        """Adds numeric counters (bytes, rows, cache hits); other values are set."""
+        for name, value in metrics.items():
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                self.metrics[name] = self.metrics.get(name, 0) + value
+            else:
+                self.metrics[name] = value
+
+    def elapsed(self):
+        return time.perf_counter() - self.start
+
+    def cache_status(self):
+        """"hit" when every cache lookup hit, "miss" when any missed, None without lookups."""
+        if self.metrics.get("cache_misses"):
+            return "miss"
+        if self.metrics.get("cache_hits"):
+            return "hit"
+        return None
+
+    def server_timing(self):
+        """
+        Returns:
+            str: Server-Timing header value, durations in milliseconds
+        """
+        entries = [f"{name};dur={seconds * 1000:.1f}" for name, seconds in self.stages.items()]
+        cache = self.cache_status()
+        if cache:
+            entries.append(f'cache;desc="{cache}"')
+        entries.append(f"total;dur={self.elapsed() * 1000:.1f}")
+        return ", ".join(entries)
+
+    def record(self, status=None):
+        """
+        Returns:
+            dict: The structured log record for this invocation
+        """
+        return {
+            "function": self.function,
+            "status": status,
+            "total_ms": round(self.elapsed() * 1000, 2),
+            "stages_ms": {name: round(seconds * 1000, 2) for name, seconds in self.stages.items()},
+            "cache": self.cache_status(),
+            **self.metrics
+        }
+
+
+class _Stage:
+    __slots__ = ("name", "timing", "start")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.timing = _current.get()
+        if self.timing is not None:
+            self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.timing is not None:
+            self.timing.add_stage(self.name, time.perf_counter() - self.start)
+        return False
+
+
+def stage(name):
+    """Context manager timing a stage of the current invocation."""
+    return _Stage(name)
+
+
+def record(**metrics):
+    """Adds counters (bytes_downloaded, rows, cache_hits, ...) to the current invocation."""
+    timing = _current.get()
+    if timing is not None:
+        timing.add(**metrics)
+
+
+def timed(function_name):
+    """
+    Decorates a function's main(): times the invocation, adds Server-Timing
+    (and Timing-Allow-Origin, so the dashboard can read it cross-origin) to
+    the HTTP response, and logs the structured record.
+    """
+    def decorator(main):
+        if not TIMING_ENABLED:
+            return main
+
+        if inspect.iscoroutinefunction(main):
+            @functools.wraps(main)
+            async def async_wrapper(*args, **kwargs):
+                timing = Timing(function_name)
+                token = _current.set(timing)
+                status = "error"
+                try:
+                    response = await main(*args, **kwargs)
+                    status = _finish(timing, response)
+                    return response
+                finally:
+                    _current.reset(token)
+                    _log(timing, status)
+
+            return async_wrapper
+
+        @functools.wraps(main)
+        def wrapper(*args, **kwargs):
+            timing = Timing(function_name)
+            token = _current.set(timing)
+            status = "error"
+            try:
+                response = main(*args, **kwargs)
+                status = _finish(timing, response)
+                return response
+            finally:
+                _current.reset(token)
+                _log(timing, status)
+
+        return wrapper
+    return decorator
+
+
+def _finish(timing, response):
+    """Adds the timing headers to an HTTP response and returns the status to log."""
+    if hasattr(response, "headers"):
+        response.headers["Server-Timing"] = timing.server_timing()
+        response.headers["Timing-Allow-Origin"] = "*"
+    return getattr(response, "status_code", "ok")
+
+
+def _log(timing, status):
+    # The record is only built when something will log it
+    if logging.getLogger().isEnabledFor(logging.INFO):
+        timing_record = timing.record(status)
+        logging.info(f"⏱️ {json.dumps(timing_record)}", extra={"custom_dimensions": timing_record})
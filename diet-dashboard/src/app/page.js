@@ -1,6 +1,6 @@
 "use client";
 
-import { useEffect, useState } from "react";
+import { useEffect, useRef, useState } from "react";
 import ChartCard from "./components/ChartCard";
 import DietDataTable from "./components/DietDataTable";
 import DietInsightsTable from "./components/DietInsightsTable";
@@ -27,6 +27,8 @@ function HomeContent() {
   const [filteredData, setFilteredData] = useState([]);
   const [pagination, setPagination] = useState({});
   const [loadingData, setLoadingData] = useState(false);
+  // The initial DietDashboard call already loads the pie chart and table
+  const skipInitial = useRef({ pie: true, table: true });
 
   // Fetch charts
   const fetchChart = async (type, endpoint) => {
@@ -82,21 +84,74 @@ function HomeContent() {
     }
   };
 
+  // Charts and first table page in one call (DietDashboard)
+  const fetchDashboard = async (diet = selectedDiet, pg = page) => {
+    // Sections the dashboard couldn't build are fetched from their own endpoints
+    const fallbacks = {
+      bar: () => fetchChart("bar", "DietBarChart"),
+      line: () => fetchChart("line", "DietLineChart"),
+      pie: () => fetchPieChart(pieDiet),
+    };
+    setLoadingData(true);
+    try {
+      const params = new URLSearchParams({
+        diet: pieDiet,
+        table_diet: diet,
+        keyword: keyword,
+        page: pg,
+        page_size: pageSize,
+        images: "true",
+      });
+      const response = await fetch(`${API_BASE}DietDashboard?${params}`);
+      if (!response.ok) throw new Error(`Error fetching dashboard: ${response.statusText}`);
+      const json = await response.json();
+
+      const images = {};
+      for (const type of ["bar", "line", "pie"]) {
+        const section = json[`${type}_chart`];
+        if (section && section.image) {
+          images[type] = { img: section.image, time: json.timings[`${type}_chart`].toFixed(2) };
+        } else {
+          fallbacks[type]();
+        }
+      }
+      setCharts((prev) => ({ ...prev, ...images }));
+      if (json.search && json.search.data) {
+        setFilteredData(json.search.data);
+        setPagination(json.search.pagination);
+      } else {
+        fetchDietData(diet, keyword, pg);
+      }
+    } catch (err) {
+      // Fall back to the individual endpoints
+      console.error(err);
+      Object.values(fallbacks).forEach((fetchSection) => fetchSection());
+      fetchDietData(diet, keyword, pg);
+    } finally {
+      setLoadingData(false);
+    }
+  };
+
   // Initial data fetch
   useEffect(() => {
-    fetchChart("bar", "DietBarChart");
-    fetchChart("line", "DietLineChart");
-    fetchPieChart(pieDiet);
-    fetchDietData("All");
+    fetchDashboard("All");
   }, []);
 
   // Refetch pie chart when pieDiet changes
   useEffect(() => {
+    if (skipInitial.current.pie) {
+      skipInitial.current.pie = false;
+      return;
+    }
     fetchPieChart(pieDiet);
   }, [pieDiet]);
 
   // Refetch table when selectedDiet, page, or keyword changes
   useEffect(() => {
+    if (skipInitial.current.table) {
+      skipInitial.current.table = false;
+      return;
+    }
     fetchDietData(selectedDiet, keyword, page);
   }, [selectedDiet, page, keyword]);
 
@@ -115,10 +170,7 @@ function HomeContent() {
           <button
             onClick={() => {
               setCharts({ bar: { img: null }, line: { img: null }, pie: { img: null } });
-              fetchChart("bar", "DietBarChart");
-              fetchChart("line", "DietLineChart");
-              fetchPieChart(pieDiet);
-              fetchDietData(selectedDiet);
+              fetchDashboard(selectedDiet);
             }}
             className="px-4 py-2 bg-white text-blue-500 font-semibold rounded hover:bg-gray-100"
           >
@@ -1,28 +1,28 @@
 from azure.storage.blob import BlobServiceClient
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+import numpy as np
 import pandas as pd
+import argparse
 import io
 import json
 import os
+import time
 
-def process_nutritional_data_from_azurite():
-    # Local Azurite connection string
-    connect_str = (
-        "AccountName=devstoreaccount1;AccountKey=Eby8vdM02xNOcqFlqUwJPLlmEtlCDXJ1OUzFT50uSRZ6IFsuFq2UVErCz4I6tq/K1SZFPTOtr/KBHBeksoGMGw==;DefaultEndpointsProtocol=http;BlobEndpoint=http://127.0.0.1:10000/devstoreaccount1;QueueEndpoint=http://127.0.0.1:10001/devstoreaccount1;TableEndpoint=http://127.0.0.1:10002/devstoreaccount1;"
-    )
-
-    blob_service_client = BlobServiceClient.from_connection_string(connect_str)
-
-    container_name = "datasets"
-    blob_name = "All_Diets.csv"
+# Local Azurite connection string
+AZURITE_CONNECTION_STRING = (
+    "AccountName=devstoreaccount1;AccountKey=Eby8vdM02xNOcqFlqUwJPLlmEtlCDXJ1OUzFT50uSRZ6IFsuFq2UVErCz4I6tq/K1SZFPTOtr/KBHBeksoGMGw==;DefaultEndpointsProtocol=http;BlobEndpoint=http://127.0.0.1:10000/devstoreaccount1;QueueEndpoint=http://127.0.0.1:10001/devstoreaccount1;TableEndpoint=http://127.0.0.1:10002/devstoreaccount1;"
+)
+MACRO_COLUMNS = ["Protein(g)", "Carbs(g)", "Fat(g)"]
+RESULTS_PATH = "simulated_nosql/results.json"
+# Batch mode: processes computing shard partials, and threads downloading shards
+BATCH_WORKERS = int(os.environ.get("BATCH_WORKERS", str(os.cpu_count() or 1)))
+DOWNLOAD_THREADS = int(os.environ.get("DOWNLOAD_THREADS", "8"))
 
-    container_client = blob_service_client.get_container_client(container_name)
-    blob_client = container_client.get_blob_client(blob_name)
 
-    blob_data = blob_client.download_blob().readall()
-    
+def read_csv_bytes(blob_data):
     # This code below was added as a improvement for Task 5
     # This is used to tell the code, which columns to load so we don't load unneeded data
-    usecols = ["Diet_type", "Protein(g)", "Carbs(g)", "Fat(g)"] 
+    usecols = ["Diet_type", "Protein(g)", "Carbs(g)", "Fat(g)"]
     # Panda has ways we can optomize how it reads and uses the data, the first one tells it we can turn diet_type to numeric values (Vegan = 0, Keto = 1, etc.)
     # The other 3 columns simply tell it to create a smaller number as Panda defaults to float64 which has more decimal places, but we don't need that many for the macros.
     dtypes = {
@@ -35,29 +35,230 @@ def process_nutritional_data_from_azurite():
     }
 
     # This is just the same pd.read_csv but using the variables established above
-    df = pd.read_csv(io.BytesIO(blob_data), usecols=usecols, dtype=dtypes)
-
-    # This line creates a new column that has the numeric values for diet_type, 
-    # this way we can use numbers rather than strings to determine which diet the meal is faster than before, 
-    # and is the reason we did "Diet_Type": "category" earlier
-    df["Diet_type_code"] = df["Diet_type"].cat.codes
-
-    avg_macros = (
-        # Even though it says it is using diet_type not Diet_type_code, it is still using the numeric values behind the scenes
-        # As since we set that dtype earlier, panda knows it has a numeric value it can use for processing, but this way it still displays the 
-        # string value when we print it out or save it to a file.
-        df.groupby("Diet_type")[["Protein(g)", "Carbs(g)", "Fat(g)"]]
-        .mean()
-        .reset_index()
-    )
-
-    os.makedirs("simulated_nosql", exist_ok=True)
-
-    result = avg_macros.to_dict(orient="records")
-    with open("simulated_nosql/results.json", "w") as f:
+    return pd.read_csv(io.BytesIO(blob_data), usecols=usecols, dtype=dtypes)
+
+
+def read_csv_blob(blob_client):
+    return read_csv_bytes(blob_client.download_blob().readall())
+
+
+def partial_aggregates(df):
+    """
+    Per-diet counts and sums of the macro columns. Unlike means, these can be
+    added up across shards, so averages from merged partials are the same as
+    from the whole dataset at once.
+
+    Returns:
+        tuple: (rows, {diet: [count per macro..., sum per macro...]})
+    """
+    # Sums are taken in float64 so merging shards adds no float32 rounding
+    grouped = df.astype({col: "float64" for col in MACRO_COLUMNS}).groupby("Diet_type", observed=True)[MACRO_COLUMNS]
+    counts = grouped.count()
+    sums = grouped.sum()
+    partials = {
+        str(diet): counts.loc[diet].tolist() + sums.loc[diet].tolist()
+        for diet in counts.index
+    }
+    return len(df), partials
+
+
+def shard_partial_aggregates(shard_data):
+    """Parses one CSV shard and reduces it to partial aggregates (runs in a worker process)."""
+    return partial_aggregates(read_csv_bytes(shard_data))
+
+
+def merge_partials(partials):
+    """Adds up partial aggregates from any number of shards."""
+    total_rows = 0
+    merged = {}
+    for rows, shard in partials:
+        total_rows += rows
+        for diet, values in shard.items():
+            if diet in merged:
+                merged[diet] = [a + b for a, b in zip(merged[diet], values)]
+            else:
+                merged[diet] = list(values)
+    return total_rows, merged
+
+
+def averages_from_partials(merged):
+    """
+    Turns merged partials into the results.json records: one row per diet,
+    sorted by diet, with the average of each macro (float32, as before).
+    """
+    n = len(MACRO_COLUMNS)
+    result = []
+    for diet in sorted(merged):
+        counts, sums = merged[diet][:n], merged[diet][n:]
+        record = {"Diet_type": diet}
+        for col, count, total in zip(MACRO_COLUMNS, counts, sums):
+            record[col] = float(np.float32(total / count)) if count else None
+        result.append(record)
+    return result
+
+
+def write_results(result):
+    os.makedirs(os.path.dirname(RESULTS_PATH), exist_ok=True)
+    with open(RESULTS_PATH, "w") as f:
         json.dump(result, f, indent=4)
 
-    print("Data processed and stored in simulated_nosql/results.json")
+
+def process_nutritional_data_from_azurite():
+    blob_service_client = BlobServiceClient.from_connection_string(AZURITE_CONNECTION_STRING)
+
+    container_name = "datasets"
+    blob_name = "All_Diets.csv"
+
+    container_client = blob_service_client.get_container_client(container_name)
+    blob_client = container_client.get_blob_client(blob_name)
+
+    # The raw upload is the one source for results.json, here and in batch
+    # mode, so diets keep the spelling they have in All_Diets.csv
+    df = read_csv_blob(blob_client)
+
+    # The whole dataset is one shard here, so batch mode (any number of shards)
+    # writes exactly the same averages
+    _, merged = merge_partials([partial_aggregates(df)])
+    result = averages_from_partials(merged)
+    write_results(result)
+
+    print(f"Data processed and stored in {RESULTS_PATH}")
+
+
+class AzuriteShards:
+    """CSV shards stored as blobs under a prefix of an Azurite container."""
+
+    def __init__(self, container_name, prefix):
+        blob_service_client = BlobServiceClient.from_connection_string(AZURITE_CONNECTION_STRING)
+        self.container_client = blob_service_client.get_container_client(container_name)
+        self.prefix = prefix
+
+    def list(self):
+        return sorted(
+            blob.name for blob in self.container_client.list_blobs(name_starts_with=self.prefix)
+            if blob.name.endswith(".csv")
+        )
+
+    def read(self, name):
+        return self.container_client.get_blob_client(name).download_blob().readall()
+
+    def write(self, name, data):
+        self.container_client.get_blob_client(name).upload_blob(data, overwrite=True)
+
+
+class LocalShards:
+    """Stand-in for a container: files under a local directory, named by their relative path."""
+
+    def __init__(self, root, prefix):
+        self.root = root
+        self.prefix = prefix
+
+    def list(self):
+        names = []
+        for dirpath, _, filenames in os.walk(self.root):
+            for filename in filenames:
+                name = os.path.relpath(os.path.join(dirpath, filename), self.root).replace(os.sep, "/")
+                if name.startswith(self.prefix) and name.endswith(".csv"):
+                    names.append(name)
+        return sorted(names)
+
+    def read(self, name):
+        with open(os.path.join(self.root, name), "rb") as f:
+            return f.read()
+
+    def write(self, name, data):
+        path = os.path.join(self.root, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(data)
+
+
+def write_shards(source, csv_path, shard_count):
+    """Splits a CSV into shard_count CSV shards (each with the header) under the source's prefix."""
+    df = pd.read_csv(csv_path)
+    rows_per_shard = -(-len(df) // shard_count)
+    for i in range(shard_count):
+        shard = df.iloc[i * rows_per_shard:(i + 1) * rows_per_shard]
+        source.write(f"{source.prefix}part-{i:05d}.csv", shard.to_csv(index=False).encode("utf-8"))
+    print(f"Wrote {shard_count} shards of up to {rows_per_shard} rows under {source.prefix}")
+
+
+def process_shards(source, workers=BATCH_WORKERS, threads=DOWNLOAD_THREADS):
+    """
+    Downloads every shard of source concurrently and reduces each one to
+    partial aggregates in a pool of worker processes. A shard is handed to the
+    pool as soon as its download finishes, so parsing overlaps the remaining
+    downloads. Partials are merged in shard-name order, so the result does not
+    depend on which shard finished first.
+
+    Returns:
+        tuple: (results.json records, stats dict with shards, rows, seconds, rows_per_second)
+    """
+    names = source.list()
+    if not names:
+        raise ValueError(f"No CSV shards found under '{source.prefix}'")
+
+    start_time = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as downloads, ProcessPoolExecutor(max_workers=workers) as pool:
+        download_futures = {downloads.submit(source.read, name): name for name in names}
+        partial_futures = {}
+        for future in as_completed(download_futures):
+            partial_futures[download_futures[future]] = pool.submit(shard_partial_aggregates, future.result())
+        partials = [partial_futures[name].result() for name in names]
+
+    rows, merged = merge_partials(partials)
+    seconds = time.perf_counter() - start_time
+    stats = {
+        "shards": len(names),
+        "rows": rows,
+        "seconds": round(seconds, 3),
+        "rows_per_second": round(rows / seconds) if seconds else None
+    }
+    return averages_from_partials(merged), stats
+
+
+def process_nutritional_data_batch(source, workers=BATCH_WORKERS, scaling=False):
+    """
+    Batch mode: writes results.json from all shards of source. With scaling,
+    runs once per worker count from 1 to workers and prints the throughput
+    and speedup of each.
+    """
+    worker_counts = range(1, workers + 1) if scaling else [workers]
+    baseline = None
+    for count in worker_counts:
+        result, stats = process_shards(source, workers=count)
+        baseline = baseline or stats["rows_per_second"]
+        speedup = stats["rows_per_second"] / baseline if baseline else 0
+        print(
+            f"{count} worker(s): {stats['rows']} rows from {stats['shards']} shards in "
+            f"{stats['seconds']}s ({stats['rows_per_second']} rows/s, {speedup:.2f}x)"
+        )
+
+    write_results(result)
+    print(f"Data processed and stored in {RESULTS_PATH}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Average macronutrients per diet type.")
+    parser.add_argument("--prefix", help="Batch mode: process every CSV shard under this prefix")
+    parser.add_argument("--container", default="datasets", help="Azurite container holding the shards")
+    parser.add_argument("--local-dir", help="Read shards from this directory instead of Azurite")
+    parser.add_argument("--workers", type=int, default=BATCH_WORKERS, help="Worker processes for batch mode")
+    parser.add_argument("--scaling", action="store_true", help="Report throughput for 1 to --workers processes")
+    parser.add_argument("--split", type=int, metavar="N", help="First split --csv into N shards under --prefix")
+    parser.add_argument("--csv", default="All_Diets.csv", help="CSV split by --split")
+    return parser.parse_args(argv)
+
 
 if __name__ == "__main__":
-    process_nutritional_data_from_azurite()
\ No newline at end of file
+    args = parse_args()
+    if args.prefix is None:
+        process_nutritional_data_from_azurite()
+    else:
+        if args.local_dir:
+            shard_source = LocalShards(args.local_dir, args.prefix)
+        else:
+            shard_source = AzuriteShards(args.container, args.prefix)
+        if args.split:
+            write_shards(shard_source, args.csv, args.split)
+        process_nutritional_data_batch(shard_source, workers=max(args.workers, 1), scaling=args.scaling)